@@ -0,0 +1,104 @@
+"""
+Cache de déduplication des enregistrements par empreinte de contenu (SHA-256)
+"""
+
+import os
+import time
+import logging
+from typing import Any, Dict, Optional
+
+from report_store import report_store
+from model_registry import model_registry
+
+logger = logging.getLogger(__name__)
+
+
+class AudioDedupCache:
+    """
+    Associe (SHA-256 de l'audio, moteur, modèle, langue) au rapport déjà produit.
+
+    Un utilisateur qui renvoie le même enregistrement (après un timeout de
+    l'interface par exemple) récupère le rapport existant sans repasser par
+    Whisper ni OpenAI. Les entrées sont évincées LRU au-delà de `max_entries`.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("AUDIO_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+        self.max_entries = int(os.getenv("AUDIO_CACHE_MAX_ENTRIES", "1000"))
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def cache_key(sha256: str, model: str, language: str) -> str:
+        # Même modèle, autre moteur (openai-whisper, faster-whisper int8, API) : autre transcription
+        return f"{sha256}:{model_registry.engine.cache_id}:{model}:{language}"
+
+    def remember_upload(self, file_id: str, sha256: str, size_bytes: int):
+        """Enregistre l'empreinte calculée pendant l'upload"""
+        report_store.save_upload_hash(file_id, sha256, size_bytes)
+
+    def lookup(self, file_id: str, model: str, language: str) -> Optional[str]:
+        """
+        Cherche un rapport déjà produit pour le même contenu audio
+
+        Args:
+            file_id: Identifiant de l'upload
+            model: Modèle de transcription
+            language: Langue de transcription
+
+        Returns:
+            L'ID du rapport existant, ou None
+        """
+        if not self.enabled:
+            return None
+        upload = report_store.get_upload_hash(file_id)
+        if upload is None:
+            return None
+
+        key = self.cache_key(upload["sha256"], model, language)
+        entry = report_store.get_cache_entry(key)
+        if entry is None or entry["report_id"] == file_id:
+            self.misses += 1
+            return None
+        if report_store.get_report(entry["report_id"], include_transcript=False) is None:
+            # Rapport supprimé depuis : l'entrée est périmée
+            report_store.delete_cache_entry(key)
+            self.misses += 1
+            return None
+
+        report_store.touch_cache_entry(key, time.time())
+        self.hits += 1
+        return entry["report_id"]
+
+    def store(self, file_id: str, model: str, language: str):
+        """Référence le rapport terminé de `file_id` pour les uploads identiques suivants"""
+        if not self.enabled:
+            return
+        upload = report_store.get_upload_hash(file_id)
+        if upload is None:
+            return
+        report_store.put_cache_entry(
+            self.cache_key(upload["sha256"], model, language), file_id, upload["size_bytes"], time.time()
+        )
+        count, _ = report_store.cache_totals()
+        if count > self.max_entries:
+            self.evictions += report_store.evict_cache_lru(count - self.max_entries)
+
+    def stats(self) -> Dict[str, Any]:
+        count, size_bytes = report_store.cache_totals()
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": count,
+            "max_entries": self.max_entries,
+            "audio_mb": round(size_bytes / 1024 / 1024, 1),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "evictions": self.evictions,
+        }
+
+
+# Instance globale
+audio_cache = AudioDedupCache()
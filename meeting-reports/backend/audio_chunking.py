@@ -0,0 +1,212 @@
+"""
+Découpage des longs enregistrements en fenêtres pour la transcription parallèle
+"""
+
+import os
+import re
+import subprocess
+import logging
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+
+CHUNK_SECONDS = float(os.getenv("TRANSCRIPTION_CHUNK_SECONDS", "30"))
+CHUNK_OVERLAP_SECONDS = float(os.getenv("TRANSCRIPTION_CHUNK_OVERLAP", "1.0"))
+
+# Taille des trames d'énergie et fenêtre de lissage pour trouver les silences
+_FRAME_SECONDS = 0.03
+_SMOOTH_FRAMES = 10
+
+
+def decode_audio(file_path: str, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """
+    Décode un fichier audio en PCM mono float32 avec ffmpeg
+
+    Args:
+        file_path: Chemin du fichier audio (tout format lisible par ffmpeg)
+        sample_rate: Fréquence d'échantillonnage cible
+
+    Returns:
+        Les échantillons normalisés dans [-1, 1]
+    """
+    cmd = [
+        "ffmpeg", "-nostdin", "-threads", "0",
+        "-i", file_path,
+        "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(sample_rate),
+        "-"
+    ]
+    result = subprocess.run(cmd, capture_output=True, check=False)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed to decode {file_path}: {result.stderr.decode(errors='ignore')[-500:]}")
+    return np.frombuffer(result.stdout, np.int16).astype(np.float32) / 32768.0
+
+
+def split_on_silence(samples: np.ndarray, sample_rate: int = SAMPLE_RATE,
+                     chunk_seconds: float = CHUNK_SECONDS,
+                     overlap_seconds: float = CHUNK_OVERLAP_SECONDS) -> List[Tuple[int, int]]:
+    """
+    Découpe l'audio en fenêtres d'au plus `chunk_seconds`, coupées dans les silences
+
+    Chaque coupure est placée au point le plus calme (énergie lissée) de la seconde
+    moitié de la fenêtre ; la fenêtre suivante démarre `overlap_seconds` avant la
+    coupure pour ne pas perdre de mot à la frontière.
+
+    Args:
+        samples: Audio mono
+        sample_rate: Fréquence d'échantillonnage
+        chunk_seconds: Durée maximale d'une fenêtre
+        overlap_seconds: Recouvrement entre deux fenêtres consécutives
+
+    Returns:
+        Liste de bornes (début, fin) en échantillons
+    """
+    return SilenceSplitter(sample_rate, chunk_seconds, overlap_seconds).feed(samples, final=True)
+
+
+class SilenceSplitter:
+    """
+    Découpage incrémental : les fenêtres de split_on_silence, au fil du décodage.
+
+    `feed` reçoit l'audio disponible (qui ne fait que s'allonger) et renvoie les
+    nouvelles fenêtres dont la coupure ne peut plus changer : la seconde moitié
+    de la fenêtre et le voisinage du lissage sont déjà décodés. La dernière
+    fenêtre n'est émise qu'avec `final=True`.
+    """
+
+    def __init__(self, sample_rate: int = SAMPLE_RATE, chunk_seconds: float = CHUNK_SECONDS,
+                 overlap_seconds: float = CHUNK_OVERLAP_SECONDS):
+        self.max_len = int(chunk_seconds * sample_rate)
+        self.overlap = int(overlap_seconds * sample_rate)
+        self.frame = max(1, int(_FRAME_SECONDS * sample_rate))
+        self.start = 0
+        self.done = False
+        self._energy = np.zeros(0, dtype=np.float32)
+
+    def feed(self, samples: np.ndarray, final: bool = False) -> List[Tuple[int, int]]:
+        """
+        Args:
+            samples: Tout l'audio disponible depuis le début
+            final: True quand l'audio est complet
+
+        Returns:
+            Les fenêtres (début, fin) nouvellement arrêtées, dans l'ordre
+        """
+        total = len(samples)
+        n_frames = total // self.frame
+        if n_frames > len(self._energy):
+            # Énergie calculée une seule fois par trame, sur les trames nouvellement complètes
+            frames = samples[len(self._energy) * self.frame:n_frames * self.frame].reshape(-1, self.frame)
+            energy = np.sqrt(np.mean(frames.astype(np.float32) ** 2, axis=1))
+            self._energy = np.concatenate([self._energy, energy])
+
+        # Trames au-delà de la fenêtre nécessaires au lissage
+        lookahead = (_SMOOTH_FRAMES // 2 + 1) * self.frame
+        windows = []
+        while not self.done:
+            end = self.start + self.max_len
+            if end >= total:
+                if not final:
+                    break
+                windows.append((self.start, total))
+                self.done = True
+                break
+            if not final and end + lookahead > total:
+                break
+
+            search_from = (self.start + self.max_len // 2) // self.frame
+            search_to = min(end // self.frame, n_frames)
+            if search_to > search_from:
+                smoothed = self._smoothed(search_from, search_to, n_frames)
+                cut = (search_from + int(np.argmin(smoothed))) * self.frame
+            else:
+                cut = end
+            windows.append((self.start, cut))
+            self.start = max(cut - self.overlap, self.start + 1)
+        return windows
+
+    def _smoothed(self, first: int, last: int, n_frames: int) -> np.ndarray:
+        """Énergie moyennée sur _SMOOTH_FRAMES trames centrées, pour les trames [first, last)"""
+        half = _SMOOTH_FRAMES // 2
+        lo, hi = first - half, last + half - 1
+        energy = self._energy[max(lo, 0):min(hi, n_frames)]
+        # Zéros au-delà des bords de l'audio (comme np.convolve en mode "same")
+        energy = np.concatenate([
+            np.zeros(max(0, -lo), dtype=np.float32), energy, np.zeros(max(0, hi - n_frames), dtype=np.float32)
+        ])
+        kernel = np.ones(_SMOOTH_FRAMES, dtype=np.float32) / _SMOOTH_FRAMES
+        return np.convolve(energy, kernel, mode="valid")
+
+
+_WORD_RE = re.compile(r"[\w']+", re.UNICODE)
+
+
+def _normalized_words(text: str) -> List[str]:
+    return [w.lower() for w in _WORD_RE.findall(text)]
+
+
+def _drop_repeated_prefix(previous_text: str, text: str, max_words: int = 8) -> str:
+    """Retire du début de `text` les mots déjà présents à la fin de `previous_text`"""
+    prev_words = _normalized_words(previous_text)[-max_words:]
+    words = text.split()
+    norm = [_normalized_words(w) for w in words]
+    flat = [w[0] if w else "" for w in norm]
+    for k in range(min(len(prev_words), len(flat)), 0, -1):
+        if prev_words[-k:] == flat[:k]:
+            return " ".join(words[k:])
+    return text
+
+
+def stitch_chunks(windows: List[Tuple[int, int]], chunk_results: List[Dict[str, Any]],
+                  sample_rate: int = SAMPLE_RATE) -> Dict[str, Any]:
+    """
+    Recolle les transcriptions des fenêtres en une seule transcription
+
+    Les timestamps des segments sont déjà absolus. Dans chaque zone de
+    recouvrement, on garde les segments de la fenêtre précédente dont le milieu
+    précède le milieu du recouvrement et ceux de la suivante après ; les mots
+    répétés à la jonction (début du premier segment gardé d'une fenêtre) sont
+    supprimés.
+
+    Args:
+        windows: Bornes (début, fin) en échantillons, dans l'ordre
+        chunk_results: Résultat de chaque fenêtre ({"segments": [...]})
+
+    Returns:
+        Dict avec le texte complet et la liste des segments
+    """
+    segments: List[Dict[str, Any]] = []
+    for index, result in enumerate(chunk_results):
+        lower = 0.0
+        upper = float("inf")
+        if index > 0:
+            lower = (windows[index][0] + windows[index - 1][1]) / 2 / sample_rate
+        if index + 1 < len(windows):
+            upper = (windows[index + 1][0] + windows[index][1]) / 2 / sample_rate
+
+        at_boundary = index > 0
+        for segment in result.get("segments", []):
+            middle = (segment["start"] + segment["end"]) / 2
+            if not (lower <= middle < upper):
+                continue
+            text = segment["text"].strip()
+            # Seule la jonction avec la fenêtre précédente peut répéter des mots
+            if segments and at_boundary:
+                text = _drop_repeated_prefix(segments[-1]["text"], text)
+            if not text:
+                continue
+            at_boundary = False
+            stitched = dict(segment, id=len(segments), text=text)
+            if segment.get("words"):
+                # Les mots retirés du début du texte le sont aussi des timestamps par mot
+                dropped = len(segment["text"].split()) - len(text.split())
+                stitched["words"] = segment["words"][dropped:]
+            segments.append(stitched)
+
+    return {
+        "text": " ".join(segment["text"] for segment in segments),
+        "segments": segments,
+    }
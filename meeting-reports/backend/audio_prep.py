@@ -0,0 +1,364 @@
+"""
+Préparation audio : un seul décodage ffmpeg par upload, partagé par toutes les étapes
+"""
+
+import os
+import json
+import time
+import subprocess
+import threading
+import logging
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from audio_chunking import SAMPLE_RATE
+
+logger = logging.getLogger(__name__)
+
+PCM_SUFFIX = ".pcm16k.f32"
+META_SUFFIX = ".pcm16k.json"
+
+# Taille des blocs lus sur la sortie d'ffmpeg (échantillons int16)
+_READ_BLOCK_BYTES = 1 << 20
+
+
+def pcm_path_for(audio_path: str) -> Path:
+    """Chemin de l'artefact PCM à côté de l'upload ({file_id}.pcm16k.f32)"""
+    path = Path(audio_path)
+    return path.with_name(path.stem + PCM_SUFFIX)
+
+
+class PreparedAudio:
+    """Audio décodé en PCM mono float32 16 kHz, lu par memory-mapping"""
+
+    __slots__ = ("path", "num_samples", "decode_seconds", "sample_rate")
+
+    def __init__(self, path: Path, num_samples: int, decode_seconds: float, sample_rate: int = SAMPLE_RATE):
+        self.path = path
+        self.num_samples = num_samples
+        self.decode_seconds = decode_seconds
+        self.sample_rate = sample_rate
+
+    @property
+    def duration(self) -> float:
+        return self.num_samples / self.sample_rate
+
+    def samples(self, start: int = 0, end: Optional[int] = None) -> np.ndarray:
+        """
+        Vue sans copie sur les échantillons [start, end)
+
+        Le mode copy-on-write donne un tableau inscriptible (torch.from_numpy
+        l'exige) sans jamais modifier le fichier.
+        """
+        if self.num_samples == 0:
+            return np.zeros(0, dtype=np.float32)
+        data = np.memmap(self.path, dtype=np.float32, mode="c", shape=(self.num_samples,))
+        return data[start:end]
+
+
+class LiveDecode:
+    """
+    Décodage d'un upload encore en cours de réception.
+
+    L'artefact PCM est écrit directement à son emplacement final (le JSON de
+    métadonnées n'apparaît qu'à la fin) : les `num_samples` premiers échantillons
+    sont lisibles avant la fin du décodage. Les abonnés sont appelés, depuis le
+    thread de décodage, à chaque bloc écrit et à la fin.
+    """
+
+    __slots__ = ("pcm_path", "num_samples", "finished", "error", "decode_seconds", "_listeners", "_lock")
+
+    def __init__(self, pcm_path: Path):
+        self.pcm_path = pcm_path
+        self.num_samples = 0
+        self.finished = False
+        self.error: Optional[Exception] = None
+        self.decode_seconds = 0.0
+        self._listeners: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback: Callable[[], None]):
+        """Abonne `callback` et l'appelle une première fois avec l'état courant"""
+        with self._lock:
+            self._listeners.append(callback)
+        callback()
+
+    def _update(self, num_samples: Optional[int] = None, error: Optional[Exception] = None,
+                decode_seconds: Optional[float] = None):
+        with self._lock:
+            if num_samples is not None:
+                self.num_samples = num_samples
+            if error is not None:
+                self.error = error
+                self.finished = True
+            if decode_seconds is not None:
+                self.decode_seconds = decode_seconds
+                self.finished = True
+            listeners = list(self._listeners)
+        for callback in listeners:
+            try:
+                callback()
+            except Exception as e:
+                logger.debug(f"Live decode listener failed: {e}")
+
+
+class AudioPreparer:
+    """
+    Décode chaque upload une seule fois vers un fichier PCM float32 brut.
+
+    Whisper, la diarisation et l'estimation de durée lisent ensuite ce fichier par
+    memory-mapping au lieu de relancer ffmpeg. Le temps de décodage initial est
+    noté dans un fichier JSON voisin : chaque réutilisation ajoute ce temps au
+    compteur « decode_seconds_saved ».
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._decoding: Dict[str, threading.Lock] = {}
+        self._live: Dict[str, LiveDecode] = {}
+        self.decodes = 0
+        self.reuses = 0
+        self.decode_seconds_total = 0.0
+        self.decode_seconds_saved = 0.0
+        self.streamed = 0
+        self.probes = 0
+        self.probe_timeout = float(os.getenv("AUDIO_PROBE_TIMEOUT", "10"))
+
+    def prepare(self, audio_path: str) -> PreparedAudio:
+        """
+        Renvoie l'audio décodé, en le décodant s'il ne l'a pas encore été
+
+        Args:
+            audio_path: Chemin du fichier uploadé
+
+        Returns:
+            L'audio préparé (memory-mappé)
+        """
+        pcm_path = pcm_path_for(audio_path)
+        with self._lock:
+            file_lock = self._decoding.setdefault(str(pcm_path), threading.Lock())
+
+        try:
+            with file_lock:
+                prepared = self._load(audio_path, pcm_path)
+                reused = prepared is not None
+                if not reused:
+                    prepared = self._decode(audio_path, pcm_path)
+        finally:
+            with self._lock:
+                self._decoding.pop(str(pcm_path), None)
+
+        with self._lock:
+            if reused:
+                self.reuses += 1
+                self.decode_seconds_saved += prepared.decode_seconds
+            else:
+                self.decodes += 1
+                self.decode_seconds_total += prepared.decode_seconds
+        return prepared
+
+    def prepare_stream(self, audio_path: str, blocks: Iterable[bytes]) -> PreparedAudio:
+        """
+        Décode un upload pendant sa réception : ffmpeg lit les octets sur son entrée standard
+
+        Le verrou du fichier est tenu jusqu'à la fin : un `prepare()` lancé entre-temps
+        attend puis réutilise l'artefact. Seuls les formats lisibles en flux (pas de
+        mp4/m4a dont l'index est en fin de fichier) s'y prêtent.
+
+        Args:
+            audio_path: Chemin final de l'upload (l'artefact PCM est écrit à côté)
+            blocks: Les octets de l'upload, dans l'ordre, au fur et à mesure de leur arrivée
+
+        Returns:
+            L'audio préparé (memory-mappé)
+        """
+        pcm_path = pcm_path_for(audio_path)
+        live = LiveDecode(pcm_path)
+        with self._lock:
+            file_lock = self._decoding.setdefault(str(pcm_path), threading.Lock())
+            self._live[str(audio_path)] = live
+        try:
+            with file_lock:
+                prepared = self._decode(audio_path, pcm_path, blocks, live)
+        finally:
+            with self._lock:
+                self._decoding.pop(str(pcm_path), None)
+                self._live.pop(str(audio_path), None)
+
+        with self._lock:
+            self.decodes += 1
+            self.streamed += 1
+            self.decode_seconds_total += prepared.decode_seconds
+        return prepared
+
+    def live(self, audio_path: str) -> Optional[LiveDecode]:
+        """Décodage en cours de `audio_path` pendant son upload, s'il y en a un"""
+        with self._lock:
+            return self._live.get(str(audio_path))
+
+    def discard(self, audio_path: str):
+        """Supprime l'artefact PCM d'un upload"""
+        pcm_path = pcm_path_for(audio_path)
+        for path in (pcm_path, pcm_path.with_name(pcm_path.name[:-len(PCM_SUFFIX)] + META_SUFFIX)):
+            if path.exists():
+                path.unlink()
+
+    def probe_duration(self, audio_path: str) -> Optional[float]:
+        """
+        Durée de l'enregistrement lue dans l'en-tête du conteneur (ffprobe, sans décodage)
+
+        Sans durée dans l'en-tête (WebM de MediaRecorder par exemple), elle est estimée
+        à partir de la taille et du débit annoncé.
+
+        Args:
+            audio_path: Chemin du fichier uploadé
+
+        Returns:
+            La durée en secondes, ou None si ffprobe ne sait pas la donner
+        """
+        cmd = [
+            "ffprobe", "-v", "error", "-show_entries", "format=duration,size,bit_rate",
+            "-of", "default=noprint_wrappers=1", str(audio_path)
+        ]
+        try:
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=self.probe_timeout, check=False)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            logger.warning(f"ffprobe failed on {audio_path}: {e}")
+            return None
+        values = {}
+        for line in result.stdout.splitlines():
+            key, _, value = line.partition("=")
+            try:
+                values[key.strip()] = float(value)
+            except ValueError:
+                pass
+        if values.get("duration", 0) > 0:
+            self.probes += 1
+            return values["duration"]
+        if values.get("size", 0) > 0 and values.get("bit_rate", 0) > 0:
+            self.probes += 1
+            return values["size"] * 8 / values["bit_rate"]
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "decodes": self.decodes,
+            "reuses": self.reuses,
+            "decode_seconds_total": round(self.decode_seconds_total, 2),
+            "decode_seconds_saved": round(self.decode_seconds_saved, 2),
+            "decoded_while_uploading": self.streamed,
+            "duration_probes": self.probes,
+        }
+
+    def _meta_path(self, pcm_path: Path) -> Path:
+        return pcm_path.with_name(pcm_path.name[:-len(PCM_SUFFIX)] + META_SUFFIX)
+
+    def _load(self, audio_path: str, pcm_path: Path) -> Optional[PreparedAudio]:
+        meta_path = self._meta_path(pcm_path)
+        if not pcm_path.exists() or not meta_path.exists():
+            return None
+        if os.path.exists(audio_path) and os.path.getmtime(audio_path) > pcm_path.stat().st_mtime:
+            return None
+        try:
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+            return PreparedAudio(pcm_path, int(meta["num_samples"]), float(meta["decode_seconds"]))
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable PCM metadata {meta_path}: {e}")
+            return None
+
+    def _decode(self, audio_path: str, pcm_path: Path, blocks: Optional[Iterable[bytes]] = None,
+                live: Optional[LiveDecode] = None) -> PreparedAudio:
+        started = time.perf_counter()
+        if live is not None:
+            # Écriture en place, lisible au fil de l'eau ; le JSON de métadonnées marque la fin
+            self._meta_path(pcm_path).unlink(missing_ok=True)
+            tmp_path = pcm_path
+        else:
+            tmp_path = pcm_path.with_name(pcm_path.name + ".tmp")
+        cmd = [
+            "ffmpeg", "-nostdin", "-loglevel", "error", "-threads", "0",
+            "-i", "pipe:0" if blocks is not None else str(audio_path),
+            "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(SAMPLE_RATE),
+            "-"
+        ]
+        process = subprocess.Popen(
+            cmd, stdin=subprocess.PIPE if blocks is not None else None,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        feeder = None
+        feed_state = {"waiting": 0.0, "error": None}
+        if blocks is not None:
+            # Entrée alimentée par un thread : la sortie est lue ici en parallèle
+            feeder = threading.Thread(target=self._feed, args=(process, blocks, feed_state), daemon=True)
+            feeder.start()
+        num_samples = 0
+        try:
+            # Conversion int16 -> float32 par blocs : pas de pic mémoire sur les gros fichiers
+            with open(tmp_path, "wb") as out:
+                while True:
+                    block = process.stdout.read(_READ_BLOCK_BYTES)
+                    if not block:
+                        break
+                    samples = np.frombuffer(block[:len(block) - len(block) % 2], np.int16)
+                    out.write((samples.astype(np.float32) / 32768.0).tobytes())
+                    num_samples += len(samples)
+                    if live is not None:
+                        out.flush()
+                        live._update(num_samples=num_samples)
+            stderr = process.stderr.read()
+            if feeder is not None:
+                feeder.join()
+                if feed_state["error"] is not None:
+                    raise RuntimeError(f"Upload stream of {audio_path} interrupted: {feed_state['error']}")
+            if process.wait() != 0:
+                raise RuntimeError(f"ffmpeg failed to decode {audio_path}: {stderr.decode(errors='ignore')[-500:]}")
+            if tmp_path != pcm_path:
+                os.replace(tmp_path, pcm_path)
+        except Exception as e:
+            process.kill()
+            if feeder is not None:
+                feeder.join(timeout=5)
+            if tmp_path.exists():
+                tmp_path.unlink()
+            if live is not None:
+                live._update(error=e)
+            raise
+
+        # Temps passé à attendre les octets de l'upload : pas du décodage
+        decode_seconds = time.perf_counter() - started - feed_state["waiting"]
+        with open(self._meta_path(pcm_path), "w") as f:
+            json.dump({"num_samples": num_samples, "sample_rate": SAMPLE_RATE, "decode_seconds": decode_seconds}, f)
+        if live is not None:
+            live._update(decode_seconds=decode_seconds)
+        logger.info(f"Decoded {audio_path} once to PCM: {num_samples / SAMPLE_RATE:.0f}s of audio in {decode_seconds:.1f}s")
+        return PreparedAudio(pcm_path, num_samples, decode_seconds)
+
+    @staticmethod
+    def _feed(process: subprocess.Popen, blocks: Iterable[bytes], state: Dict[str, Any]):
+        iterator = iter(blocks)
+        try:
+            while True:
+                waited = time.perf_counter()
+                block = next(iterator, None)
+                state["waiting"] += time.perf_counter() - waited
+                if block is None:
+                    break
+                process.stdin.write(block)
+        except BrokenPipeError:
+            # ffmpeg s'est arrêté (format illisible) : son code de sortie le signalera
+            pass
+        except Exception as e:
+            state["error"] = e
+            process.kill()
+        finally:
+            try:
+                process.stdin.close()
+            except OSError:
+                pass
+
+
+# Instance globale
+audio_preparer = AudioPreparer()
@@ -0,0 +1,323 @@
+"""
+Stockage des sessions de chat : cache LRU en mémoire et journal JSONL en ajout seul
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_SESSION_ID_RE = re.compile(r"^[\w.-]+$")
+
+
+def _dumps(record: Dict[str, Any]) -> str:
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+
+
+class ChatSession:
+    __slots__ = ("session_id", "report_id", "mode", "system", "transcript_sha256",
+                 "messages", "created_at", "last_activity", "size_bytes")
+
+    def __init__(self, session_id: str, report_id: str, mode: str, system: str,
+                 transcript_sha256: str, created_at: Optional[str] = None):
+        self.session_id = session_id
+        self.report_id = report_id
+        self.mode = mode
+        self.system = system
+        self.transcript_sha256 = transcript_sha256
+        self.messages: List[Dict[str, str]] = []
+        self.created_at = created_at or datetime.now().isoformat()
+        self.last_activity = self.created_at
+        self.size_bytes = len(system.encode("utf-8"))
+
+    def header(self) -> Dict[str, Any]:
+        return {
+            "type": "session",
+            "session_id": self.session_id,
+            "report_id": self.report_id,
+            "mode": self.mode,
+            "system": self.system,
+            "transcript_sha256": self.transcript_sha256,
+            "created_at": self.created_at,
+        }
+
+
+class ChatSessionStore:
+    """
+    Sessions de chat persistées en JSONL, une ligne par message.
+
+    Chaque session est un fichier `{session_id}.jsonl` : une ligne d'en-tête puis
+    une ligne par message, ajoutée à la fin du fichier (plus de réécriture de
+    toute la session à chaque échange). La transcription n'est écrite qu'une fois
+    par rapport (`transcripts/{report_id}.txt`) et les sessions y font référence.
+
+    Les sessions actives restent en mémoire dans un cache LRU borné en nombre et
+    en octets ; les sessions inactives depuis `idle_ttl` secondes sont supprimées.
+    """
+
+    def __init__(self, sessions_dir: Optional[str] = None):
+        self.sessions_dir = Path(sessions_dir or os.getenv("CHAT_SESSIONS_DIR", "/app/reports/chat_sessions"))
+        self.transcripts_dir = self.sessions_dir / "transcripts"
+        self.max_sessions = int(os.getenv("CHAT_SESSION_CACHE_SIZE", "200"))
+        self.max_bytes = int(float(os.getenv("CHAT_SESSION_CACHE_MB", "64")) * 1024 * 1024)
+        self.idle_ttl = float(os.getenv("CHAT_SESSION_IDLE_TTL", str(7 * 24 * 3600)))
+        self.expiry_interval = 600.0
+
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._transcripts: Dict[str, str] = {}
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self._last_expiry = 0.0
+
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+        self.expired = 0
+
+    def create(self, report_id: str, transcript: str, mode: str, system: str, session_id: str) -> ChatSession:
+        """
+        Crée une session et écrit son en-tête
+
+        Args:
+            report_id: L'ID du rapport
+            transcript: Le texte de la transcription (écrit une seule fois par rapport)
+            mode: "retrieval" ou "full"
+            system: Le prompt système, sans la transcription (vide en mode "full")
+            session_id: L'ID souhaité (suffixé s'il existe déjà)
+
+        Returns:
+            La session créée
+        """
+        self._check_id(session_id)
+        self._check_id(report_id)
+        self._expire_if_due()
+        digest = hashlib.sha256(transcript.encode("utf-8")).hexdigest()
+
+        with self._lock:
+            self.sessions_dir.mkdir(parents=True, exist_ok=True)
+            self._write_transcript(report_id, transcript, digest)
+            candidate, suffix = session_id, 1
+            while True:
+                try:
+                    # "x" : échoue si une session du même nom existe déjà
+                    with open(self._session_path(candidate), "x", encoding="utf-8") as f:
+                        session = ChatSession(candidate, report_id, mode, system, digest)
+                        f.write(_dumps(session.header()) + "\n")
+                    break
+                except FileExistsError:
+                    suffix += 1
+                    candidate = f"{session_id}_{suffix}"
+            self._cache(session)
+        return session
+
+    def get(self, session_id: str) -> Optional[ChatSession]:
+        """Session depuis le cache, ou relue depuis son journal"""
+        if not _SESSION_ID_RE.match(session_id or ""):
+            return None
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                self._sessions.move_to_end(session_id)
+                self.hits += 1
+                return session
+            session = self._load(session_id)
+            if session is not None:
+                self.loads += 1
+                self._cache(session)
+            return session
+
+    def append(self, session: ChatSession, messages: List[Dict[str, str]]):
+        """Ajoute des messages à la session, en mémoire et en fin de journal (appel bloquant)"""
+        now = datetime.now().isoformat()
+        records = [{"type": "message", "role": m["role"], "content": m["content"], "at": now} for m in messages]
+        data = "".join(_dumps(record) + "\n" for record in records)
+        with self._lock:
+            with open(self._session_path(session.session_id), "a", encoding="utf-8") as f:
+                f.write(data)
+            self._touch_transcript(session.report_id)
+            added = sum(len(m["content"].encode("utf-8")) for m in messages)
+            session.messages.extend({"role": m["role"], "content": m["content"]} for m in messages)
+            session.last_activity = now
+            session.size_bytes += added
+            if session.session_id in self._sessions:
+                self._bytes += added
+                self._evict()
+
+    def transcript(self, session: ChatSession) -> str:
+        """Transcription à laquelle la session fait référence"""
+        with self._lock:
+            transcript = self._transcripts.get(session.report_id)
+            if transcript is None:
+                path = self._transcript_path(session.report_id)
+                transcript = path.read_text(encoding="utf-8") if path.exists() else ""
+                if transcript:
+                    self._transcripts[session.report_id] = transcript
+                    self._bytes += len(transcript.encode("utf-8"))
+            return transcript
+
+    def expire_idle(self) -> int:
+        """Supprime les sessions (et transcriptions) inactives depuis `idle_ttl` secondes"""
+        cutoff = time.time() - self.idle_ttl
+        expired = 0
+        with self._lock:
+            self._last_expiry = time.time()
+            if not self.sessions_dir.exists():
+                return 0
+            # .json : sessions de l'ancien format jamais rouvertes
+            for directory, suffix in ((self.sessions_dir, ".jsonl"), (self.sessions_dir, ".json"),
+                                      (self.transcripts_dir, ".txt")):
+                if not directory.exists():
+                    continue
+                for entry in os.scandir(directory):
+                    if not entry.name.endswith(suffix) or entry.stat().st_mtime >= cutoff:
+                        continue
+                    name = entry.name[:-len(suffix)]
+                    if suffix != ".txt":
+                        session = self._sessions.pop(name, None)
+                        if session is not None:
+                            self._bytes -= session.size_bytes
+                        expired += 1
+                    else:
+                        transcript = self._transcripts.pop(name, None)
+                        if transcript is not None:
+                            self._bytes -= len(transcript.encode("utf-8"))
+                    os.unlink(entry.path)
+        if expired:
+            self.expired += expired
+            logger.info(f"Chat sessions: expired {expired} idle sessions")
+        return expired
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "cached_sessions": len(self._sessions),
+                "cached_transcripts": len(self._transcripts),
+                "cached_mb": round(self._bytes / 1024 / 1024, 2),
+                "hits": self.hits,
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "expired": self.expired,
+            }
+
+    def _check_id(self, session_id: str):
+        if not _SESSION_ID_RE.match(session_id):
+            raise ValueError(f"Invalid chat session id: {session_id}")
+
+    def _session_path(self, session_id: str) -> Path:
+        return self.sessions_dir / f"{session_id}.jsonl"
+
+    def _transcript_path(self, report_id: str) -> Path:
+        return self.transcripts_dir / f"{report_id}.txt"
+
+    def _write_transcript(self, report_id: str, transcript: str, digest: str):
+        path = self._transcript_path(report_id)
+        cached = self._transcripts.get(report_id)
+        if cached is not None and hashlib.sha256(cached.encode("utf-8")).hexdigest() == digest and path.exists():
+            self._touch_transcript(report_id)
+            return
+        if path.exists() and hashlib.sha256(path.read_bytes()).hexdigest() == digest:
+            self._touch_transcript(report_id)
+        else:
+            self.transcripts_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(".tmp")
+            tmp_path.write_text(transcript, encoding="utf-8")
+            os.replace(tmp_path, path)
+        if cached is not None:
+            self._bytes -= len(cached.encode("utf-8"))
+        self._transcripts[report_id] = transcript
+        self._bytes += len(transcript.encode("utf-8"))
+
+    def _touch_transcript(self, report_id: str):
+        try:
+            os.utime(self._transcript_path(report_id))
+        except FileNotFoundError:
+            pass
+
+    def _load(self, session_id: str) -> Optional[ChatSession]:
+        path = self._session_path(session_id)
+        if not path.exists():
+            return self._migrate_json(session_id)
+
+        session = None
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Dernière ligne tronquée par un arrêt brutal : ignorée
+                    logger.warning(f"Skipping corrupt line in chat session {session_id}")
+                    continue
+                if record.get("type") == "session":
+                    session = ChatSession(session_id, record["report_id"], record["mode"], record["system"],
+                                          record.get("transcript_sha256", ""), record.get("created_at"))
+                elif session is not None and record.get("type") == "message":
+                    session.messages.append({"role": record["role"], "content": record["content"]})
+                    session.size_bytes += len(record["content"].encode("utf-8"))
+                    session.last_activity = record.get("at", session.last_activity)
+        if session is not None:
+            self._touch_transcript(session.report_id)
+        return session
+
+    def _migrate_json(self, session_id: str) -> Optional[ChatSession]:
+        """Convertit une session de l'ancien format (un JSON complet réécrit à chaque message)"""
+        legacy_path = self.sessions_dir / f"{session_id}.json"
+        if not legacy_path.exists():
+            return None
+        try:
+            with open(legacy_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            logger.error(f"Error loading legacy chat session {session_id}: {e}")
+            return None
+
+        mode = data.get("mode", "full")
+        system = data["messages"][0]["content"] if mode == "retrieval" else ""
+        transcript = data.get("transcript", "")
+        digest = hashlib.sha256(transcript.encode("utf-8")).hexdigest()
+        self._write_transcript(data["report_id"], transcript, digest)
+        session = ChatSession(session_id, data["report_id"], mode, system, digest, data.get("created_at"))
+        with open(self._session_path(session_id), "w", encoding="utf-8") as f:
+            f.write(_dumps(session.header()) + "\n")
+        self.append(session, [m for m in data["messages"] if m["role"] in ("user", "assistant")])
+        legacy_path.unlink()
+        logger.info(f"Migrated legacy chat session {session_id} to JSONL")
+        return session
+
+    def _cache(self, session: ChatSession):
+        previous = self._sessions.pop(session.session_id, None)
+        if previous is not None:
+            self._bytes -= previous.size_bytes
+        self._sessions[session.session_id] = session
+        self._bytes += session.size_bytes
+        self._evict()
+
+    def _evict(self):
+        while len(self._sessions) > 1 and (len(self._sessions) > self.max_sessions or self._bytes > self.max_bytes):
+            _, session = self._sessions.popitem(last=False)
+            self._bytes -= session.size_bytes
+            self.evictions += 1
+            # Transcription gardée tant qu'une session en cache y fait référence
+            if not any(s.report_id == session.report_id for s in self._sessions.values()):
+                transcript = self._transcripts.pop(session.report_id, None)
+                if transcript is not None:
+                    self._bytes -= len(transcript.encode("utf-8"))
+
+    def _expire_if_due(self):
+        if time.time() - self._last_expiry >= self.expiry_interval:
+            try:
+                self.expire_idle()
+            except Exception as e:
+                logger.error(f"Error expiring chat sessions: {e}")
+
+
+# Instance globale
+chat_sessions = ChatSessionStore()
@@ -0,0 +1,114 @@
+"""
+Diffusion des événements de traitement (segments, progression, statut) par job
+"""
+
+import time
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class _Channel:
+    __slots__ = ("history", "subscribers", "closed", "closed_at")
+
+    def __init__(self):
+        self.history: List[Dict[str, Any]] = []
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.closed = False
+        self.closed_at: Optional[float] = None
+
+
+class JobEventBroker:
+    """
+    Canal d'événements par job, avec historique rejoué aux abonnés tardifs.
+
+    Un client qui se connecte au milieu d'une transcription reçoit d'abord tous
+    les segments déjà produits, puis les suivants au fil de l'eau. Les canaux
+    terminés sont conservés `history_ttl` secondes puis oubliés.
+    """
+
+    def __init__(self, history_ttl: float = 600.0):
+        self.history_ttl = history_ttl
+        self._channels: Dict[str, _Channel] = {}
+
+    def has_channel(self, job_id: str) -> bool:
+        return job_id in self._channels
+
+    def open(self, job_id: str):
+        """Réinitialise le canal d'un job (nouveau traitement)"""
+        self._cleanup()
+        self._channels[job_id] = _Channel()
+
+    def publish(self, job_id: str, event: str, data: Dict[str, Any], final: bool = False):
+        """
+        Publie un événement pour un job
+
+        Args:
+            job_id: Identifiant du job
+            event: Type d'événement (segment, progress, status)
+            data: Données sérialisables en JSON
+            final: Ferme le canal après cet événement
+        """
+        channel = self._channels.get(job_id)
+        if channel is None:
+            channel = self._channels[job_id] = _Channel()
+        if channel.closed:
+            return
+
+        message = {"event": event, "data": data}
+        channel.history.append(message)
+        for queue in channel.subscribers:
+            queue.put_nowait(message)
+
+        if final:
+            channel.closed = True
+            channel.closed_at = time.time()
+            for queue in channel.subscribers:
+                queue.put_nowait(None)
+
+    async def subscribe(self, job_id: str, keepalive: float = 15.0) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """
+        Itère sur les événements d'un job jusqu'à sa fin
+
+        Yields:
+            Les événements ({"event", "data"}), ou None toutes les `keepalive`
+            secondes sans activité pour permettre d'envoyer un ping
+        """
+        channel = self._channels.get(job_id)
+        if channel is None:
+            channel = self._channels[job_id] = _Channel()
+
+        queue: asyncio.Queue = asyncio.Queue()
+        for message in channel.history:
+            queue.put_nowait(message)
+        if channel.closed:
+            queue.put_nowait(None)
+        channel.subscribers.add(queue)
+
+        try:
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=keepalive)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                if message is None:
+                    return
+                yield message
+        finally:
+            channel.subscribers.discard(queue)
+
+    def _cleanup(self):
+        now = time.time()
+        expired = [
+            job_id for job_id, channel in self._channels.items()
+            if channel.closed and not channel.subscribers and now - channel.closed_at > self.history_ttl
+        ]
+        for job_id in expired:
+            del self._channels[job_id]
+
+
+# Instance globale
+job_events = JobEventBroker()
@@ -0,0 +1,209 @@
+"""
+État des jobs de traitement en mémoire, persisté en différé dans le report store
+"""
+
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
+
+from report_store import report_store
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ("queued", "processing")
+FINAL_STATUSES = ("completed", "error", "cancelled")
+
+
+class JobRecord:
+    __slots__ = ("id", "status", "progress", "message", "updated_at", "extra",
+                 "stage", "stage_started", "resumable")
+
+    def __init__(self, job_id: str, status: str, progress: int, message: str,
+                 updated_at: Optional[str] = None, extra: Optional[Dict[str, Any]] = None):
+        self.id = job_id
+        self.status = status
+        self.progress = progress
+        self.message = message
+        self.updated_at = updated_at or datetime.now().isoformat()
+        self.extra = extra or {}
+        self.stage = status
+        self.stage_started = time.monotonic()
+        self.resumable = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = dict(self.extra)
+        data.update({
+            "id": self.id,
+            "status": self.status,
+            "progress": self.progress,
+            "message": self.message,
+            "updated_at": self.updated_at,
+        })
+        if self.resumable:
+            data["resumable"] = True
+        return data
+
+
+class JobStateTable:
+    """
+    Table des statuts de job servie depuis la mémoire.
+
+    Chaque mise à jour modifie l'enregistrement en mémoire et le marque « sale » ;
+    une tâche de fond écrit les enregistrements sales dans SQLite par lots, toutes
+    les `flush_interval` secondes (immédiatement pour les statuts finaux). Au
+    redémarrage, les jobs restés en cours sont rechargés et marqués reprenables
+    (main.py les resoumet au pool, ou les passe en erreur).
+    """
+
+    def __init__(self):
+        self.flush_interval = float(os.getenv("JOB_STATE_FLUSH_INTERVAL", "1.0"))
+        # Durée pendant laquelle un job terminé reste en mémoire après persistance
+        self.retention = float(os.getenv("JOB_STATE_RETENTION", "300"))
+        self._records: Dict[str, JobRecord] = {}
+        self._dirty: Set[str] = set()
+        self._flush_now: Optional[asyncio.Event] = None
+        self._writer: Optional[asyncio.Task] = None
+        # Durées cumulées par étape (statut) pour les moyennes exposées par /health
+        self._stage_totals: Dict[str, float] = {}
+        self._stage_counts: Dict[str, int] = {}
+
+    def start(self):
+        if self._writer is None:
+            self._flush_now = asyncio.Event()
+            self._writer = asyncio.create_task(self._write_behind_loop())
+
+    async def shutdown(self):
+        if self._writer is not None:
+            self._writer.cancel()
+            self._writer = None
+        await self.flush()
+
+    def update(self, job_id: str, status: str, progress: int, message: str, **extra) -> Dict[str, Any]:
+        """
+        Met à jour le statut d'un job (en mémoire, persistance différée)
+
+        Returns:
+            Le statut sous forme de dict
+        """
+        record = self._records.get(job_id)
+        if record is None:
+            record = self._records[job_id] = JobRecord(job_id, status, progress, message, extra=extra)
+        else:
+            if record.stage != status:
+                self._close_stage(record)
+                record.stage = status
+                record.stage_started = time.monotonic()
+            record.status = status
+            record.progress = progress
+            record.message = message
+            record.updated_at = datetime.now().isoformat()
+            record.resumable = False
+            record.extra.update(extra)
+
+        self._dirty.add(job_id)
+        if status in FINAL_STATUSES:
+            self._close_stage(record)
+            if self._flush_now is not None:
+                self._flush_now.set()
+        return record.to_dict()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Statut d'un job, depuis la mémoire ou à défaut depuis la base"""
+        record = self._records.get(job_id)
+        if record is not None:
+            return record.to_dict()
+        return report_store.get_status(job_id)
+
+    def forget(self, job_id: Optional[str] = None):
+        """Oublie un job (ou tous) après suppression dans la base"""
+        if job_id is None:
+            self._records.clear()
+            self._dirty.clear()
+        else:
+            self._records.pop(job_id, None)
+            self._dirty.discard(job_id)
+
+    def load_incomplete(self) -> List[Dict[str, Any]]:
+        """
+        Recharge les jobs interrompus par un redémarrage et les marque reprenables
+        
+        L'appelant doit les resoumettre ou les passer en erreur : sinon ils restent
+        « queued » indéfiniment.
+
+        Returns:
+            Les statuts des jobs reprenables
+        """
+        resumable = []
+        for data in report_store.list_statuses(ACTIVE_STATUSES):
+            record = JobRecord(data["id"], "queued", 0, "Interrupted by a server restart, waiting to resume",
+                               extra={k: v for k, v in data.items()
+                                      if k not in ("id", "status", "progress", "message", "updated_at")})
+            record.resumable = True
+            self._records[record.id] = record
+            self._dirty.add(record.id)
+            resumable.append(record.to_dict())
+        if resumable:
+            logger.info(f"Reloaded {len(resumable)} interrupted job(s)")
+        return resumable
+
+    def stats(self) -> Dict[str, Any]:
+        counts: Dict[str, int] = {}
+        for record in self._records.values():
+            counts[record.status] = counts.get(record.status, 0) + 1
+        return {
+            "queue_depth": counts.get("queued", 0),
+            "in_flight": counts.get("processing", 0),
+            "by_status": counts,
+            "pending_writes": len(self._dirty),
+            "avg_stage_seconds": {
+                stage: round(self._stage_totals[stage] / self._stage_counts[stage], 2)
+                for stage in self._stage_totals
+            },
+        }
+
+    def _close_stage(self, record: JobRecord):
+        if record.stage in FINAL_STATUSES:
+            return
+        elapsed = time.monotonic() - record.stage_started
+        self._stage_totals[record.stage] = self._stage_totals.get(record.stage, 0.0) + elapsed
+        self._stage_counts[record.stage] = self._stage_counts.get(record.stage, 0) + 1
+
+    async def flush(self):
+        """Écrit tous les statuts modifiés dans la base, en une transaction"""
+        if not self._dirty:
+            return
+        job_ids, self._dirty = self._dirty, set()
+        batch = [self._records[job_id].to_dict() for job_id in job_ids if job_id in self._records]
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, report_store.save_statuses, batch)
+        except Exception as e:
+            logger.error(f"Error persisting job statuses: {e}")
+            self._dirty |= job_ids
+            return
+        self._evict_finished()
+
+    def _evict_finished(self):
+        now = time.monotonic()
+        expired = [
+            job_id for job_id, record in self._records.items()
+            if record.status in FINAL_STATUSES and job_id not in self._dirty
+            and now - record.stage_started > self.retention
+        ]
+        for job_id in expired:
+            del self._records[job_id]
+
+    async def _write_behind_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_now.clear()
+            await self.flush()
+
+
+# Instance globale
+job_states = JobStateTable()
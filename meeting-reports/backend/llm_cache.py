@@ -0,0 +1,184 @@
+"""
+Cache persistant des réponses LLM (résumés), indexé par l'empreinte de la transcription
+"""
+
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+import logging
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_responses (
+    cache_key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    template_version TEXT NOT NULL,
+    transcript_sha256 TEXT NOT NULL,
+    response TEXT NOT NULL,
+    tokens INTEGER NOT NULL DEFAULT 0,
+    size_bytes INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_llm_responses_last_used ON llm_responses (last_used);
+CREATE INDEX IF NOT EXISTS idx_llm_responses_created_at ON llm_responses (created_at);
+"""
+
+
+class LLMResponseCache:
+    """
+    Réponses OpenAI déjà obtenues pour une même transcription, dans un fichier SQLite.
+
+    La clé combine modèle, température, version des prompts, langue et SHA-256 de
+    la transcription : régénérer un rapport ou reprendre un traitement après un
+    crash ne rappelle pas l'API. Les entrées expirent après `ttl` secondes et les
+    moins récemment utilisées sont évincées au-delà de `max_entries` ou `max_bytes`.
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = Path(db_path or os.getenv("LLM_CACHE_DB", "reports/llm_cache.db"))
+        self.enabled = os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+        self.ttl = float(os.getenv("LLM_CACHE_TTL", str(30 * 24 * 3600)))
+        self.max_entries = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+        self.max_bytes = int(float(os.getenv("LLM_CACHE_MAX_MB", "100")) * 1024 * 1024)
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.stored = 0
+        self.evictions = 0
+        self.tokens_saved = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.db_path), timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    conn.executescript(_SCHEMA)
+                    self._initialized = True
+        return conn
+
+    @staticmethod
+    def cache_key(model: str, temperature: float, template_version: str,
+                  transcript_sha256: str, language: str) -> str:
+        raw = f"{model}|{temperature:.3f}|{template_version}|{language}|{transcript_sha256}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def transcript_digest(transcript: str) -> str:
+        return hashlib.sha256(transcript.encode("utf-8")).hexdigest()
+
+    def get(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        """
+        Réponse en cache pour une clé
+
+        Returns:
+            La réponse (dict), ou None si absente ou expirée
+        """
+        if not self.enabled:
+            return None
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT response, tokens, created_at FROM llm_responses WHERE cache_key = ?", (cache_key,)
+        ).fetchone()
+        now = time.time()
+        if row is None or now - row["created_at"] > self.ttl:
+            if row is not None:
+                with conn:
+                    conn.execute("DELETE FROM llm_responses WHERE cache_key = ?", (cache_key,))
+                self.evictions += 1
+            self.misses += 1
+            return None
+
+        with conn:
+            conn.execute(
+                "UPDATE llm_responses SET last_used = ?, hits = hits + 1 WHERE cache_key = ?", (now, cache_key)
+            )
+        self.hits += 1
+        self.tokens_saved += row["tokens"]
+        return json.loads(row["response"])
+
+    def put(self, cache_key: str, response: Dict[str, Any], model: str, template_version: str,
+            transcript_sha256: str, tokens: int):
+        """Enregistre une réponse puis applique TTL et limites de taille"""
+        if not self.enabled:
+            return
+        data = json.dumps(response, ensure_ascii=False)
+        now = time.time()
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_responses "
+                "(cache_key, model, template_version, transcript_sha256, response, tokens, size_bytes, created_at, last_used, hits) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 0)",
+                (cache_key, model, template_version, transcript_sha256, data, tokens, len(data.encode("utf-8")), now, now),
+            )
+        self.stored += 1
+        self._evict(conn, now)
+
+    def note_bypass(self):
+        self.bypassed += 1
+
+    def clear(self) -> int:
+        conn = self._connection()
+        with conn:
+            return conn.execute("DELETE FROM llm_responses").rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        count, size_bytes = self._totals(self._connection())
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": count,
+            "size_mb": round(size_bytes / 1024 / 1024, 2),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "bypassed": self.bypassed,
+            "stored": self.stored,
+            "evictions": self.evictions,
+            "tokens_saved": self.tokens_saved,
+        }
+
+    def _totals(self, conn: sqlite3.Connection):
+        row = conn.execute("SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM llm_responses").fetchone()
+        return row[0], row[1]
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        with conn:
+            evicted = conn.execute("DELETE FROM llm_responses WHERE created_at < ?", (now - self.ttl,)).rowcount
+        count, size_bytes = self._totals(conn)
+        while count > self.max_entries or (size_bytes > self.max_bytes and count > 1):
+            # LRU, par lots pour ne pas boucler entrée par entrée
+            batch = count - self.max_entries if count > self.max_entries else max(1, count // 10)
+            with conn:
+                evicted += conn.execute(
+                    "DELETE FROM llm_responses WHERE cache_key IN "
+                    "(SELECT cache_key FROM llm_responses ORDER BY last_used ASC LIMIT ?)",
+                    (batch,),
+                ).rowcount
+            count, size_bytes = self._totals(conn)
+        if evicted:
+            self.evictions += evicted
+            logger.info(f"LLM cache: evicted {evicted} entries")
+
+
+# Instance globale
+llm_cache = LLMResponseCache()
@@ -13,6 +13,7 @@ import logging
 from dotenv import load_dotenv
 from openai_summarizer import OpenAISummarizer
 from whisper_api import whisper_transcribe_hybrid
+from model_registry import model_registry
 from pdf_generator import pdf_generator
 
 # Load environment variables
@@ -71,10 +72,12 @@ whisper_model = None
 async def startup_event():
     global whisper_model
     
-    logger.info("Loading Whisper model...")
+    logger.info(f"Loading Whisper model: {model_registry.default_size} ({model_registry.engine.name})")
     try:
-        import whisper
-        whisper_model = whisper.load_model("base")
+        model_registry.engine.check()
+        # Chargement hors de la boucle d'événements
+        await asyncio.get_running_loop().run_in_executor(None, model_registry.warm)
+        whisper_model = model_registry.engine
         logger.info("Whisper model loaded successfully!")
     except Exception as e:
         logger.error(f"Error loading Whisper model: {e}")
@@ -273,7 +276,8 @@ async def process_audio_background(file_id: str):
         
         # Transcribe audio
         if whisper_model:
-            transcript = whisper_model.transcribe(str(file_path))["text"]
+            with model_registry.acquire() as model:
+                transcript = model.transcribe(str(file_path))["text"]
         else:
             # Fallback to API transcription
             transcript = whisper_transcribe_hybrid(str(file_path))
@@ -407,7 +411,7 @@ async def generate_ai_meeting_report(transcript: str, file_id: str) -> dict:
     
     # Use OpenAI for advanced summarization
     logger.info(f"Generating AI summary for {file_id}...")
-    ai_summary = summarizer.summarize_transcript(transcript, language="fr")
+    ai_summary = await summarizer.summarize_transcript_async(transcript, language="fr")
     
     # Create enhanced report
     report = {
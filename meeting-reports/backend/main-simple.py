@@ -1,6 +1,6 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks
+from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
 import os
@@ -13,7 +13,9 @@ import logging
 # import ffmpeg  # Commented out - using alternative approach
 from dotenv import load_dotenv
 from openai_summarizer import summarizer
-from whisper_api import whisper_transcribe_hybrid
+from openai_client import openai_client
+from whisper_api import whisper_transcribe_hybrid_async, remote_whisper
+from model_registry import model_registry
 from pdf_generator import pdf_generator
 # Import optionnel des fonctionnalités Scriberr
 try:
@@ -26,6 +28,8 @@ except ImportError as e:
 
 try:
     from transcript_chat import transcript_chat
+    from transcript_index import transcript_indexes
+    from chat_session_store import chat_sessions
     SCRIBERR_CHAT = True
 except ImportError as e:
     logger.warning(f"Transcript chat not available: {e}")
@@ -93,17 +97,30 @@ whisper_model = None
 async def startup_event():
     global whisper_model
     
-    logger.info("Loading Whisper model...")
+    logger.info(f"Loading Whisper model: {model_registry.default_size} ({model_registry.engine.name})")
     try:
-        import whisper
-        whisper_model = whisper.load_model("base")
+        model_registry.engine.check()
+        # Chargement hors de la boucle d'événements
+        await asyncio.get_running_loop().run_in_executor(None, model_registry.warm)
+        whisper_model = model_registry.engine
         logger.info("Whisper model loaded successfully!")
     except Exception as e:
         logger.error(f"Error loading Whisper: {e}")
         whisper_model = None
     
+    # Importer une fois les anciennes annotations JSON dans la base SQLite
+    if SCRIBERR_ANNOTATIONS:
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, transcript_annotations.import_json_files)
+        except Exception as e:
+            logger.error(f"Error importing JSON annotations: {e}")
+    
     logger.info("Application started!")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    await openai_client.aclose()
+
 # Routes
 @app.get("/")
 async def root():
@@ -114,7 +131,11 @@ async def health_check():
     return {
         "status": "healthy", 
         "whisper_loaded": whisper_model is not None,
-        "llm_loaded": False  # Simplified version
+        "llm_loaded": False,  # Simplified version
+        "openai": openai_client.stats(),
+        "whisper_api": remote_whisper.stats(),
+        "chat_index": transcript_indexes.stats() if SCRIBERR_CHAT else None,
+        "chat_sessions": chat_sessions.stats() if SCRIBERR_CHAT else None
     }
 
 @app.post("/upload")
@@ -215,12 +236,13 @@ async def summarize_text(request: dict):
     """Summarize text using OpenAI"""
     text = request.get("text", "")
     language = request.get("language", "fr")
+    bypass_cache = bool(request.get("bypass_cache", False))
     
     if not text:
         raise HTTPException(status_code=400, detail="Text is required")
     
     try:
-        summary = summarizer.summarize_transcript(text, language)
+        summary = await summarizer.summarize_transcript_async(text, language, use_cache=not bypass_cache)
         return {
             "success": True,
             "summary": summary,
@@ -348,7 +370,7 @@ async def create_chat_session(file_id: str):
         session_id = transcript_chat.create_chat_session(transcript, file_id)
         
         # Générer des questions suggérées
-        suggested_questions = transcript_chat.get_suggested_questions(transcript)
+        suggested_questions = await transcript_chat.get_suggested_questions(transcript)
         
         return {
             "success": True,
@@ -370,13 +392,38 @@ async def send_chat_message(request: dict):
         if not session_id or not message:
             return {"success": False, "error": "session_id et message requis"}
         
-        result = transcript_chat.send_message(session_id, message)
+        result = await transcript_chat.send_message(session_id, message)
         return result
         
     except Exception as e:
         logger.error(f"Error sending chat message: {e}")
         return {"success": False, "error": str(e)}
 
+@app.post("/api/chat/stream-message")
+async def stream_chat_message(body: dict, request: Request):
+    """Server-Sent Events: la réponse du chat token par token, puis les métriques de latence"""
+    session_id = body.get("session_id")
+    message = body.get("message")
+    if not session_id or not message:
+        raise HTTPException(status_code=400, detail="session_id et message requis")
+    
+    async def event_source():
+        events = transcript_chat.stream_message(session_id, message)
+        try:
+            async for event in events:
+                if await request.is_disconnected():
+                    break
+                payload = json.dumps(event["data"], ensure_ascii=False)
+                yield f"event: {event['event']}\ndata: {payload}\n\n"
+        finally:
+            await events.aclose()
+    
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/api/chat/history/{session_id}")
 async def get_chat_history(session_id: str):
     """Récupère l'historique d'une session de chat"""
@@ -410,6 +457,17 @@ async def get_annotations(file_id: str):
         logger.error(f"Error getting annotations: {e}")
         return {"success": False, "error": str(e)}
 
+@app.get("/api/annotations/{file_id}/range")
+async def get_annotations_in_range(file_id: str, start: float, end: float, type: Optional[str] = None):
+    """Récupère les annotations qui chevauchent une plage de temps (en secondes)"""
+    try:
+        annotations = transcript_annotations.get_annotations_in_range(file_id, start, end, type)
+        return {"success": True, "annotations": annotations}
+        
+    except Exception as e:
+        logger.error(f"Error getting annotations in range: {e}")
+        return {"success": False, "error": str(e)}
+
 @app.put("/api/annotations/{file_id}/{annotation_id}")
 async def update_annotation(file_id: str, annotation_id: str, updates: dict):
     """Met à jour une annotation"""
@@ -502,6 +560,13 @@ async def delete_report(file_id: str):
             audio_file.unlink()
             break
     
+    # Les fichiers sont déjà supprimés : une erreur de la base d'annotations ne doit pas faire échouer la requête
+    if SCRIBERR_ANNOTATIONS:
+        try:
+            transcript_annotations.delete_report_annotations(file_id)
+        except Exception as e:
+            logger.error(f"Error deleting annotations for {file_id}: {e}")
+
     return {"message": "Report deleted successfully"}
 
 # Background processing function
@@ -538,7 +603,7 @@ async def process_meeting_audio(file_id: str, file_path: str):
             # Use the hybrid transcription method (API + local fallback)
             absolute_path = str(Path(file_path).absolute())
             logger.info(f"Attempting hybrid transcription of: {absolute_path}")
-            result = whisper_transcribe_hybrid(absolute_path)
+            result = await whisper_transcribe_hybrid_async(absolute_path)
             
             if result and result.get("text"):
                 logger.info("Real transcription successful!")
@@ -593,10 +658,29 @@ async def update_status(file_id: str, status: str, progress: int, message: str):
         json.dump(status_data, f, indent=2)
 
 def convert_audio_to_wav(input_path: str, output_path: str) -> bool:
-    """Convert audio file to WAV format using subprocess and ffmpeg"""
+    """Convert audio file to WAV format, reusing the shared PCM artifact when possible"""
     try:
         logger.info(f"Converting {input_path} to {output_path}")
         
+        # The upload is decoded once; the WAV is written from that PCM without running ffmpeg again
+        try:
+            from audio_prep import audio_preparer
+            import wave
+            import numpy as np
+            audio = audio_preparer.prepare(input_path)
+            samples = audio.samples()
+            with wave.open(output_path, "wb") as wav_file:
+                wav_file.setnchannels(1)
+                wav_file.setsampwidth(2)
+                wav_file.setframerate(audio.sample_rate)
+                for start in range(0, len(samples), audio.sample_rate * 60):
+                    block = samples[start:start + audio.sample_rate * 60]
+                    wav_file.writeframes((np.clip(block, -1.0, 1.0) * 32767).astype("<i2").tobytes())
+            logger.info(f"Conversion successful (shared PCM): {output_path}")
+            return True
+        except Exception as e:
+            logger.warning(f"Shared PCM unavailable ({e}), running ffmpeg directly")
+        
         import subprocess
         
         # Try to use ffmpeg via subprocess
@@ -646,7 +730,7 @@ async def generate_ai_meeting_report(transcript: str, file_id: str) -> dict:
     
     # Use OpenAI for advanced summarization
     logger.info(f"Generating AI summary for {file_id}...")
-    ai_summary = summarizer.summarize_transcript(transcript, language="fr")
+    ai_summary = await summarizer.summarize_transcript_async(transcript, language="fr")
     
     # Create enhanced report
     report = {
@@ -1,34 +1,43 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, BackgroundTasks
+from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, BackgroundTasks, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
-import whisper
 import os
 import uuid
 import json
+import hashlib
 from datetime import datetime
+from email.utils import formatdate, parsedate_to_datetime
 from pathlib import Path
 import asyncio
 import os
-from openai import OpenAI
 import logging
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak
-from reportlab.lib.enums import TA_CENTER, TA_JUSTIFY
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.requests import Request
 from starlette.responses import Response
+from model_registry import model_registry
+from transcription_pool import transcription_pool, TranscriptionQueueFull, TranscriptionCancelled, TranscriptionUnavailable
+from job_events import job_events
+from report_store import report_store
+from job_state import job_states
+from audio_cache import audio_cache
+from audio_prep import audio_preparer
+from map_reduce_summarizer import map_reduce_summarizer
+from llm_cache import llm_cache
+from openai_client import openai_client
+from pdf_cache import pdf_cache
+from resumable_upload import resumable_uploads, UploadError, parse_metadata, parse_checksum, TUS_VERSION
 
 # Configuration
 UPLOAD_DIR = Path("/app/uploads")
 REPORTS_DIR = Path("/app/reports")
 UPLOAD_DIR.mkdir(exist_ok=True, parents=True)
 REPORTS_DIR.mkdir(exist_ok=True, parents=True)
+# Extensions sous lesquelles un upload finalisé peut être enregistré
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".m4a", ".webm", ".ogg", ".flac", ".FLAC", ".WAV")
+# En-tête identifiant l'utilisateur (quota de transcriptions simultanées), à défaut l'adresse du client
+TRANSCRIPTION_USER_HEADER = os.getenv("TRANSCRIPTION_USER_HEADER", "X-User-Id")
 
 # Logging
 logging.basicConfig(level=logging.INFO)
@@ -80,11 +89,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # En-têtes du protocole d'upload reprenable lus par le navigateur
+    expose_headers=["Location", "Upload-Offset", "Upload-Length", "Upload-Expires", "Tus-Resumable"],
 )
 
 # Global variables
 whisper_model = None
-openai_client = None
 
 # Pydantic models
 class MeetingReport(BaseModel):
@@ -107,32 +117,52 @@ class ProcessingStatus(BaseModel):
 # Initialize models
 @app.on_event("startup")
 async def startup_event():
-    global whisper_model, openai_client
+    global whisper_model
     
-    logger.info("Loading Whisper model...")
+    logger.info(f"Warming Whisper models: {', '.join(model_registry.warm_sizes)} ({model_registry.engine.name})")
     try:
-        import whisper
-        whisper_model = whisper
-        logger.info("Whisper module loaded successfully")
+        model_registry.engine.check()
+        whisper_model = model_registry.engine
+        if transcription_pool.in_process:
+            # Charger les modèles une fois pour toutes, hors de la boucle d'événements
+            await asyncio.get_running_loop().run_in_executor(None, model_registry.warm)
+        # Sinon chaque worker du pool charge son propre modèle au démarrage
+        transcription_pool.start()
+        logger.info("Whisper transcription pool ready")
     except Exception as e:
         logger.error(f"Error loading Whisper: {e}")
         whisper_model = None
     
-    # Initialize OpenAI client
-    openai_api_key = os.getenv("OPENAI_API_KEY")
-    if openai_api_key:
-        try:
-            openai_client = OpenAI(api_key=openai_api_key)
-            logger.info("OpenAI client initialized successfully")
-        except Exception as e:
-            logger.error(f"Error initializing OpenAI: {e}")
-            openai_client = None
+    # Importer une fois les anciens rapports JSON dans la base SQLite
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, report_store.migrate_json_files, REPORTS_DIR)
+    except Exception as e:
+        logger.error(f"Error migrating JSON reports: {e}")
+    
+    # Statuts servis depuis la mémoire ; les jobs interrompus deviennent reprenables
+    interrupted = job_states.load_incomplete()
+    job_states.start()
+    for status in interrupted:
+        await _resume_interrupted(status["id"])
+    
+    # Uploads reprenables abandonnés depuis plus de UPLOAD_PARTIAL_TTL
+    resumable_uploads.expire_stale()
+    
+    # OpenAI (client asynchrone créé à la première requête)
+    if map_reduce_summarizer.enabled:
+        logger.info(f"OpenAI summarization enabled ({map_reduce_summarizer.model})")
     else:
         logger.warning("OPENAI_API_KEY not set, OpenAI features will be disabled")
-        openai_client = None
     
     logger.info("Application started successfully!")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    await transcription_pool.shutdown()
+    await job_states.shutdown()
+    await openai_client.aclose()
+    pdf_cache.shutdown()
+
 # Routes
 @app.get("/")
 async def root():
@@ -140,7 +170,23 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "whisper_loaded": whisper_model is not None}
+    return {
+        "status": "healthy",
+        "whisper_loaded": whisper_model is not None and (
+            model_registry.is_loaded() or bool(transcription_pool.stats()["worker_processes"])
+            or not transcription_pool.in_process
+        ),
+        "whisper_models": model_registry.stats(),
+        "transcription_pool": transcription_pool.stats(),
+        "jobs": job_states.stats(),
+        "audio_cache": audio_cache.stats(),
+        "audio_prep": audio_preparer.stats(),
+        "summarizer": map_reduce_summarizer.stats(),
+        "llm_cache": llm_cache.stats(),
+        "openai": openai_client.stats(),
+        "pdf_cache": pdf_cache.stats(),
+        "resumable_uploads": resumable_uploads.stats()
+    }
 
 @app.post("/upload")
 async def upload_audio(file: UploadFile = File(None)):
@@ -184,6 +230,8 @@ async def upload_audio(file: UploadFile = File(None)):
         async with aiofiles.open(file_path, "wb") as buffer:
             chunk_size = 65536  # 64KB chunks pour meilleures performances
             total_size = 0
+            # Empreinte du contenu calculée au fil de l'eau (déduplication des ré-uploads)
+            hasher = hashlib.sha256()
             last_logged = 0
             
             logger.info(f"🚀 Starting file stream...")
@@ -197,6 +245,7 @@ async def upload_audio(file: UploadFile = File(None)):
                         break
                     
                     await buffer.write(chunk)
+                    hasher.update(chunk)
                     total_size += len(chunk)
                     
                     # Log progress plus fréquent pour les gros fichiers (toutes les 5MB)
@@ -208,9 +257,14 @@ async def upload_audio(file: UploadFile = File(None)):
                     logger.error(f"❌ Timeout while reading chunk at {total_size} bytes")
                     raise HTTPException(status_code=408, detail=f"Upload timeout after {total_size / 1024 / 1024:.1f} MB")
         
+        sha256 = hasher.hexdigest()
+        audio_cache.remember_upload(file_id, sha256, total_size)
+        duration = await _probe_duration(file_id, file_path)
+        
         logger.info(f"✅ File uploaded successfully: {filename}, size: {total_size} bytes ({total_size / 1024 / 1024:.2f} MB)")
         logger.info("=" * 80)
-        return {"id": file_id, "filename": filename, "status": "uploaded", "size": total_size}
+        return {"id": file_id, "filename": filename, "status": "uploaded", "size": total_size, "sha256": sha256,
+                "duration": duration}
     
     except Exception as e:
         logger.error(f"❌ Error uploading file: {e}", exc_info=True)
@@ -223,88 +277,328 @@ async def upload_audio(file: UploadFile = File(None)):
                 pass
         raise HTTPException(status_code=500, detail=f"Error uploading file: {str(e)}")
 
+async def _probe_duration(file_id: str, file_path: Path) -> Optional[float]:
+    """Read the duration from the container header (no decode) to schedule the transcription"""
+    duration = await asyncio.get_running_loop().run_in_executor(None, audio_preparer.probe_duration, str(file_path))
+    if duration is not None:
+        report_store.save_upload_duration(file_id, duration)
+    return duration
+
+def _request_user(request: Request) -> Optional[str]:
+    """Who submitted a job: the user header set by the frontend or the proxy, else the client address"""
+    user = request.headers.get(TRANSCRIPTION_USER_HEADER)
+    if user:
+        return user[:128]
+    forwarded = request.headers.get("x-forwarded-for") or request.headers.get("x-real-ip")
+    if forwarded:
+        return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else None
+
+def _upload_headers(upload) -> dict:
+    return {
+        "Tus-Resumable": TUS_VERSION,
+        "Upload-Offset": str(upload.offset),
+        "Upload-Length": str(upload.length),
+        "Upload-Expires": formatdate(resumable_uploads.expires_at(upload), usegmt=True),
+        "Cache-Control": "no-store",
+    }
+
+def _upload_error(e: UploadError) -> JSONResponse:
+    return JSONResponse(status_code=e.status_code, content={"detail": str(e)}, headers={"Tus-Resumable": TUS_VERSION})
+
+@app.post("/uploads")
+async def create_resumable_upload(request: Request):
+    """
+    Create a resumable upload (tus-style)
+
+    Headers: Upload-Length (total bytes), Upload-Metadata ("filename <base64>,sha256 <base64 of hex>").
+    The body of each following PATCH /uploads/{id} is written at Upload-Offset.
+    """
+    try:
+        length = int(request.headers.get("upload-length", ""))
+    except ValueError:
+        return JSONResponse(status_code=400, content={"detail": "Upload-Length header is required"})
+    try:
+        metadata = parse_metadata(request.headers.get("upload-metadata"))
+        upload = await resumable_uploads.create(metadata.get("filename", ""), length, metadata.get("sha256"))
+    except UploadError as e:
+        return _upload_error(e)
+    
+    # Décodage ffmpeg au fil de la réception (formats lisibles en flux)
+    resumable_uploads.decode_while_uploading(upload.upload_id, str(UPLOAD_DIR / f"{upload.upload_id}{upload.extension}"))
+    
+    headers = _upload_headers(upload)
+    # Relatif : valable derrière le préfixe /api du proxy
+    headers["Location"] = f"uploads/{upload.upload_id}"
+    return JSONResponse(
+        status_code=201,
+        headers=headers,
+        content={"id": upload.upload_id, "offset": upload.offset, "length": upload.length}
+    )
+
+@app.head("/uploads/{upload_id}")
+async def get_upload_offset(upload_id: str):
+    """Current offset of a resumable upload (where to resume after a network failure)"""
+    try:
+        upload = resumable_uploads.get(upload_id)
+    except UploadError as e:
+        return Response(status_code=e.status_code, headers={"Tus-Resumable": TUS_VERSION})
+    return Response(status_code=200, headers=_upload_headers(upload))
+
+@app.patch("/uploads/{upload_id}")
+async def patch_upload(upload_id: str, request: Request):
+    """Append bytes at Upload-Offset (Content-Type: application/offset+octet-stream, optional Upload-Checksum)"""
+    if request.headers.get("content-type", "").split(";")[0].strip() != "application/offset+octet-stream":
+        return JSONResponse(status_code=415, content={"detail": "Content-Type must be application/offset+octet-stream"})
+    try:
+        offset = int(request.headers.get("upload-offset", ""))
+    except ValueError:
+        return JSONResponse(status_code=400, content={"detail": "Upload-Offset header is required"})
+    
+    try:
+        checksum = parse_checksum(request.headers.get("upload-checksum"))
+        upload = resumable_uploads.get(upload_id)
+        # Après un redémarrage du serveur, le décodage anticipé reprend au premier PATCH
+        resumable_uploads.decode_while_uploading(upload_id, str(UPLOAD_DIR / f"{upload_id}{upload.extension}"))
+        await resumable_uploads.write(upload_id, offset, request.stream(), checksum)
+    except UploadError as e:
+        return _upload_error(e)
+    return Response(status_code=204, headers=_upload_headers(upload))
+
+@app.post("/uploads/{upload_id}/complete")
+async def complete_upload(upload_id: str, request: Request):
+    """
+    Finalize a resumable upload: verify its SHA-256 and make it available to /process
+
+    The expected digest comes from an Upload-Checksum header, a JSON body {"sha256": "<hex>"}
+    or the sha256 metadata given at creation.
+    """
+    sha256 = None
+    try:
+        checksum = parse_checksum(request.headers.get("upload-checksum"))
+        if checksum is not None:
+            sha256 = checksum.hex()
+        elif request.headers.get("content-type", "").startswith("application/json"):
+            sha256 = (await request.json()).get("sha256")
+        result = await resumable_uploads.finalize(upload_id, UPLOAD_DIR, sha256)
+    except UploadError as e:
+        return _upload_error(e)
+    
+    audio_cache.remember_upload(upload_id, result["sha256"], result["size"])
+    duration = await _probe_duration(upload_id, result["path"])
+    return {"id": upload_id, "filename": result["filename"], "status": "uploaded",
+            "size": result["size"], "sha256": result["sha256"], "duration": duration}
+
+@app.delete("/uploads/{upload_id}")
+async def delete_upload(upload_id: str):
+    """Abandon a resumable upload and delete the received bytes"""
+    try:
+        resumable_uploads.abort(upload_id)
+    except UploadError as e:
+        return _upload_error(e)
+    return Response(status_code=204, headers={"Tus-Resumable": TUS_VERSION})
+
+def _upload_path(file_id: str) -> Optional[Path]:
+    """Fichier audio finalisé d'un upload, quelle que soit son extension"""
+    for ext in AUDIO_EXTENSIONS:
+        path = UPLOAD_DIR / f"{file_id}{ext}"
+        if path.exists():
+            return path
+    return None
+
+async def _resume_interrupted(file_id: str):
+    """Resoumet au pool un job interrompu par un redémarrage, ou le passe en erreur"""
+    file_path = _upload_path(file_id)
+    if file_path is None or whisper_model is None:
+        reason = "audio file no longer available" if file_path is None else "transcription unavailable"
+        await update_status(file_id, "error", 0, f"Interrupted by a server restart ({reason}), please upload again")
+        return
+    try:
+        job = transcription_pool.submit(file_id, str(file_path), language="fr",
+                                        audio_seconds=report_store.get_upload_duration(file_id))
+    except (TranscriptionQueueFull, TranscriptionUnavailable) as e:
+        reason = "queue full" if isinstance(e, TranscriptionQueueFull) else "transcription unavailable"
+        await update_status(file_id, "error", 0, f"Interrupted by a server restart ({reason}), please retry")
+        return
+    await update_status(file_id, "queued", 5, "Interrupted by a server restart, queued again")
+    asyncio.create_task(process_meeting_audio(file_id, str(file_path), job))
+    logger.info(f"Resubmitted interrupted job {file_id}")
+
 @app.post("/process/{file_id}")
-async def process_audio(file_id: str, background_tasks: BackgroundTasks):
-    """Process audio file to generate meeting report"""
-    file_path = UPLOAD_DIR / f"{file_id}.wav"
-    
-    if not file_path.exists():
-        # Try other extensions
-        for ext in [".mp3", ".m4a", ".webm", ".ogg", ".FLAC", ".flac", ".wav", ".WAV"]:
-            alt_path = UPLOAD_DIR / f"{file_id}{ext}"
-            if alt_path.exists():
-                file_path = alt_path
-                break
-        else:
+async def process_audio(file_id: str, request: Request, background_tasks: BackgroundTasks,
+                        bypass_llm_cache: bool = False):
+    """Process audio file to generate meeting report (bypass_llm_cache forces a fresh OpenAI summary)"""
+    file_path = _upload_path(file_id)
+    pending_upload = None
+    
+    if file_path is None:
+        if not resumable_uploads.exists(file_id):
             raise HTTPException(status_code=404, detail="File not found")
+        # Upload encore en cours : transcription en pipeline si l'audio est décodé au fil de l'eau
+        pending_upload = resumable_uploads.get(file_id)
+        file_path = UPLOAD_DIR / f"{file_id}{pending_upload.extension}"
+        if not transcription_pool.pipelined or audio_preparer.live(str(file_path)) is None:
+            raise HTTPException(status_code=409, detail="Upload not finalized yet")
+    
+    # Même enregistrement déjà traité : réutiliser le rapport existant
+    cached_report_id = None if pending_upload else audio_cache.lookup(file_id, transcription_pool.model_size, "fr")
+    report = report_store.get_report(cached_report_id) if cached_report_id else None
+    if cached_report_id and report is None:
+        # Rapport supprimé entre la recherche et la lecture : transcription normale
+        logger.warning(f"Cached report {cached_report_id} disappeared, transcribing {file_id} again")
+    if report is not None:
+        report.update({
+            "id": file_id,
+            "filename": file_path.name,
+            "created_at": datetime.now().isoformat(),
+            "deduplicated_from": cached_report_id,
+            "segments": report_store.get_segments(cached_report_id)
+        })
+        report_store.save_report(report)
+        pdf_cache.prerender(report)
+        await update_status(file_id, "completed", 100, "Report reused from an identical recording")
+        logger.info(f"Cache hit for {file_id}: reusing report {cached_report_id}")
+        return {"id": file_id, "status": "completed", "message": "Report reused from an identical recording", "cached": True}
+    
+    # Un job déjà en file ou en cours pour ce fichier n'est pas relancé
+    queue_position = transcription_pool.position(file_id)
+    if queue_position is not None:
+        return {"id": file_id, "status": "processing", "message": "Already processing", "queue_position": queue_position}
+    
+    # Durée lue à l'upload : les jobs courts passent devant les longs
+    duration = report_store.get_upload_duration(file_id)
+    if duration is None and pending_upload is None:
+        duration = await _probe_duration(file_id, file_path)
+    
+    # Réserver une place dans la file de transcription (back-pressure si pleine)
+    try:
+        # Pipeline : si le décodage pendant l'upload échoue, le pool attend le fichier finalisé
+        wait_ready = (lambda: resumable_uploads.wait_finalized(pending_upload)) if pending_upload else None
+        job = transcription_pool.submit(file_id, str(file_path), language="fr",
+                                        user=_request_user(request), audio_seconds=duration,
+                                        wait_ready=wait_ready)
+    except TranscriptionQueueFull as e:
+        logger.warning(f"Transcription queue full, rejecting {file_id}")
+        return JSONResponse(
+            status_code=503,
+            headers={"Retry-After": "30"},
+            content={
+                "detail": "Transcription queue is full, retry later",
+                "queue_position": e.queue_position,
+                "queue_capacity": e.capacity
+            }
+        )
+    except TranscriptionUnavailable as e:
+        logger.error(f"Cannot process {file_id}: {e}")
+        return JSONResponse(status_code=503, content={"detail": "Transcription unavailable, Whisper is not loaded"})
+    
+    queue_position = transcription_pool.position(file_id)
+    await update_status(file_id, "queued", 5, f"Waiting for a transcription worker (position {queue_position})")
     
     # Start background processing
-    background_tasks.add_task(process_meeting_audio, file_id, str(file_path))
+    background_tasks.add_task(process_meeting_audio, file_id, str(file_path), job, not bypass_llm_cache, pending_upload)
     
-    return {"id": file_id, "status": "processing", "message": "Processing started"}
+    return {"id": file_id, "status": "processing", "message": "Processing started", "queue_position": queue_position,
+            "pipelined": pending_upload is not None}
+
+@app.delete("/process/{file_id}")
+async def cancel_processing(file_id: str):
+    """Cancel a queued or running transcription job"""
+    if not transcription_pool.cancel(file_id):
+        raise HTTPException(status_code=404, detail="No active job for this file")
+    
+    await update_status(file_id, "cancelled", 0, "Processing cancelled")
+    return {"id": file_id, "status": "cancelled"}
 
 @app.get("/status/{file_id}")
 async def get_processing_status(file_id: str):
     """Get processing status"""
-    status_file = REPORTS_DIR / f"{file_id}_status.json"
+    status = job_states.get(file_id)
     
-    if not status_file.exists():
+    if status is None:
         raise HTTPException(status_code=404, detail="Processing status not found")
     
-    with open(status_file, "r") as f:
-        status = json.load(f)
+    queue_position = transcription_pool.position(file_id)
+    if queue_position is not None:
+        status["queue_position"] = queue_position
+    
+    # Heures estimées de début et de fin de la transcription (hors résumé)
+    estimate = transcription_pool.estimate(file_id)
+    if estimate is not None:
+        status["estimated_start"] = datetime.fromtimestamp(estimate["estimated_start"]).isoformat()
+        status["estimated_finish"] = datetime.fromtimestamp(estimate["estimated_finish"]).isoformat()
+        status["estimated_audio_seconds"] = estimate["estimated_audio_seconds"]
     
     return status
 
+@app.get("/stream/{file_id}")
+async def stream_processing(file_id: str, request: Request):
+    """Server-Sent Events: transcribed segments, real progress and status changes as they happen"""
+    if not job_events.has_channel(file_id):
+        status = job_states.get(file_id)
+        if status is None:
+            raise HTTPException(status_code=404, detail="Processing status not found")
+        # Traitement terminé avant ce serveur : renvoyer simplement le dernier statut
+        job_events.publish(file_id, "status", status, final=True)
+    
+    async def event_source():
+        async for message in job_events.subscribe(file_id):
+            if await request.is_disconnected():
+                break
+            if message is None:
+                yield ": keepalive\n\n"
+                continue
+            payload = json.dumps(message["data"], ensure_ascii=False, default=str)
+            yield f"event: {message['event']}\ndata: {payload}\n\n"
+    
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/report/{file_id}")
 async def get_meeting_report(file_id: str):
     """Get generated meeting report"""
-    report_file = REPORTS_DIR / f"{file_id}_report.json"
+    report = report_store.get_report(file_id)
     
-    if not report_file.exists():
+    if report is None:
         raise HTTPException(status_code=404, detail="Report not found")
     
-    with open(report_file, "r") as f:
-        report = json.load(f)
-    
     return report
 
 @app.get("/reports")
-async def list_reports():
-    """List all generated reports"""
-    reports = []
-    
-    for report_file in REPORTS_DIR.glob("*_report.json"):
-        with open(report_file, "r") as f:
-            report = json.load(f)
-            reports.append({
-                "id": report["id"],
-                "filename": report["filename"],
-                "created_at": report["created_at"],
-                "summary": report["summary"][:200] + "..." if len(report["summary"]) > 200 else report["summary"]
-            })
-    
-    return sorted(reports, key=lambda x: x["created_at"], reverse=True)
+async def list_reports(
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    cursor: Optional[str] = None
+):
+    """List generated reports, newest first (pass `limit`, then the X-Next-Cursor header as `cursor`)"""
+    try:
+        reports, next_cursor = report_store.list_reports(limit=limit, cursor=cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return JSONResponse(content=reports, headers=headers)
 
 @app.delete("/reports/{file_id}")
 async def delete_report(file_id: str):
     """Delete a report and associated files"""
-    # Delete report file
-    report_file = REPORTS_DIR / f"{file_id}_report.json"
-    if report_file.exists():
-        report_file.unlink()
-    
-    # Delete status file
-    status_file = REPORTS_DIR / f"{file_id}_status.json"
-    if status_file.exists():
-        status_file.unlink()
-    
-    # Delete audio file
-    for ext in [".wav", ".mp3", ".m4a", ".webm", ".ogg"]:
-        audio_file = UPLOAD_DIR / f"{file_id}{ext}"
-        if audio_file.exists():
-            audio_file.unlink()
-            break
+    # Delete report, transcript and status
+    report_store.delete_report(file_id)
+    job_states.forget(file_id)
+    
+    # Delete legacy JSON files
+    for legacy_file in (REPORTS_DIR / f"{file_id}_report.json", REPORTS_DIR / f"{file_id}_status.json",
+                        REPORTS_DIR / f"{file_id}.pdf"):
+        if legacy_file.exists():
+            legacy_file.unlink()
+    
+    # Delete audio file and its decoded PCM artifact
+    for ext in AUDIO_EXTENSIONS:
+        (UPLOAD_DIR / f"{file_id}{ext}").unlink(missing_ok=True)
+    audio_preparer.discard(str(UPLOAD_DIR / file_id))
+    pdf_cache.discard(file_id)
     
     return {"message": "Report deleted successfully"}
 
@@ -315,14 +609,15 @@ async def clean_all_reports():
         deleted_reports = 0
         deleted_files = 0
         
-        # Delete all report files
-        for report_file in REPORTS_DIR.glob("*_report.json"):
-            report_file.unlink()
-            deleted_reports += 1
+        # Delete all reports and statuses
+        deleted_reports = report_store.clear()
+        job_states.forget()
         
-        # Delete all status files
-        for status_file in REPORTS_DIR.glob("*_status.json"):
-            status_file.unlink()
+        # Delete legacy JSON files
+        for legacy_file in (list(REPORTS_DIR.glob("*_report.json")) + list(REPORTS_DIR.glob("*_status.json"))
+                            + list(REPORTS_DIR.glob("*.pdf"))):
+            legacy_file.unlink()
+        pdf_cache.clear()
         
         # Delete all uploaded audio files
         for audio_file in UPLOAD_DIR.glob("*"):
@@ -340,58 +635,79 @@ async def clean_all_reports():
         raise HTTPException(status_code=500, detail=f"Error cleaning reports: {str(e)}")
 
 @app.post("/diarize-speakers/{file_id}")
-async def diarize_speakers(file_id: str):
+async def diarize_speakers(file_id: str, refresh: bool = False):
     """Identifie les locuteurs dans un fichier audio"""
     try:
         # Vérifier que le rapport existe
-        report_path = REPORTS_DIR / f"{file_id}_report.json"
-        if not report_path.exists():
+        report = report_store.get_report(file_id, include_transcript=False)
+        if report is None:
             raise HTTPException(status_code=404, detail="Rapport non trouvé")
         
-        with open(report_path, 'r', encoding='utf-8') as f:
-            report = json.load(f)
-        
-        # Extraire les participants du rapport
-        participants = report.get('participants', [])
-        if isinstance(participants, str):
-            participants = [p.strip() for p in participants.split(',') if p.strip()]
-        
-        # Simuler une diarisation basée sur la transcription
-        # En production, on utiliserait pyannote.audio ou une autre bibliothèque
-        
-        # Analyse simple : compter les transitions de locuteurs
-        transcript = report.get('transcript', '')
-        
-        # Extraction approximative basée sur les participants détectés
-        speakers = []
-        for i, participant in enumerate(participants):
-            if participant and participant != "Non identifié":
-                # Générer un temps estimé pour chaque participant
-                duration = len(transcript) / len(participants) if participants else 0
-                speakers.append({
-                    "id": f"speaker_{i}",
-                    "name": participant,
-                    "role": "Participant",
-                    "duration": duration,
-                    "words_count": len(transcript.split()) // len(participants) if participants else 0
-                })
-        
-        # Statistiques approximatives
-        statistics = {
-            "total_speakers": len(speakers),
-            "total_duration": len(transcript) / 10,  # Estimation arbitraire
-            "transcript_length": len(transcript)
-        }
+        # Résultat déjà calculé pour ce rapport
+        if not refresh:
+            cached = report_store.get_diarization(file_id)
+            if cached is not None:
+                return dict(cached, cached=True)
+        
+        audio_path = _upload_path(file_id)
+        if audio_path is None:
+            raise HTTPException(status_code=404, detail="Fichier audio non trouvé")
+        
+        segments = report_store.get_segments(file_id)
+        if not segments:
+            raise HTTPException(
+                status_code=409,
+                detail="Transcription sans timestamps : relancez le traitement pour activer la diarisation"
+            )
         
-        return {
+        # Diarisation pyannote + alignement sur les mots Whisper, dans le pool de workers
+        result = await transcription_pool.diarize(file_id, str(audio_path), segments)
+        if not result.get("enabled"):
+            return {
+                "success": False,
+                "error": "Diarisation non disponible (HUGGINGFACE_TOKEN non configuré)"
+            }
+        if not result["turns"]:
+            return {
+                "success": False,
+                "error": "Aucun locuteur détecté"
+            }
+        
+        words_count = {}
+        for utterance in result["utterances"]:
+            words_count[utterance["speaker"]] = words_count.get(utterance["speaker"], 0) + utterance["words_count"]
+        
+        speakers = [
+            {
+                "id": speaker["speaker"],
+                "name": speaker["speaker"],
+                "role": "Participant",
+                "duration": round(speaker["total_time"], 1),
+                "percentage": speaker["percentage"],
+                "words_count": words_count.get(speaker["speaker"], 0)
+            }
+            for speaker in result["statistics"]["speakers"]
+        ]
+        
+        diarization = {
             "success": True,
             "speakers": speakers,
-            "statistics": statistics,
-            "message": "Analyse basée sur les participants détectés dans le rapport"
+            "utterances": result["utterances"],
+            "statistics": {
+                "total_speakers": result["statistics"]["total_speakers"],
+                "total_duration": round(result["audio_seconds"], 1),
+                "speech_duration": round(result["statistics"]["total_time"], 1),
+                "diarize_seconds": round(result["diarize_seconds"], 1)
+            },
+            "message": "Locuteurs identifiés par diarisation et alignés sur les mots transcrits"
         }
+        report_store.save_diarization(file_id, diarization)
+        return diarization
         
-    except FileNotFoundError:
-        raise HTTPException(status_code=404, detail="Rapport non trouvé")
+    except HTTPException:
+        raise
+    except TranscriptionUnavailable:
+        raise HTTPException(status_code=503, detail="Transcription workers are not running")
     except Exception as e:
         logger.error(f"Error diarizing speakers: {e}", exc_info=True)
         return {
@@ -409,69 +725,97 @@ async def generate_pdf(file_id: str):
     }
 
 @app.get("/download-pdf/{file_id}")
-async def download_pdf(file_id: str):
-    """Télécharge un PDF généré du rapport"""
-    try:
-        # Load the report data (le fichier s'appelle {file_id}_report.json)
-        report_path = REPORTS_DIR / f"{file_id}_report.json"
-        if not report_path.exists():
-            raise HTTPException(status_code=404, detail="Rapport non trouvé")
-        
-        with open(report_path, 'r', encoding='utf-8') as f:
-            report = json.load(f)
-        
-        # Generate PDF
-        pdf_path = REPORTS_DIR / f"{file_id}.pdf"
-        if not pdf_path.exists():
-            if not generate_pdf(report, str(pdf_path)):
-                raise HTTPException(status_code=500, detail="Erreur lors de la génération du PDF")
-        
-        # Return PDF file
-        return FileResponse(
-            path=str(pdf_path),
-            media_type='application/pdf',
-            filename=f"compte-rendu-{file_id}.pdf"
-        )
-    except FileNotFoundError:
+async def download_pdf(file_id: str, request: Request):
+    """Télécharge le PDF du rapport (rendu dans un worker, puis servi depuis le cache)"""
+    report = report_store.get_report(file_id)
+    if report is None:
         raise HTTPException(status_code=404, detail="Rapport non trouvé")
+    
+    try:
+        pdf_path, digest = await pdf_cache.get_pdf(report)
     except Exception as e:
-        logger.error(f"Error downloading PDF: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Erreur lors du téléchargement: {str(e)}")
+        logger.error(f"Error generating PDF for {file_id}: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Erreur lors de la génération du PDF")
+    
+    # L'empreinte du contenu sert d'ETag : un rapport modifié change d'ETag
+    etag = f'"{digest[:32]}"'
+    stat = pdf_path.stat()
+    last_modified = formatdate(stat.st_mtime, usegmt=True)
+    cache_headers = {
+        "ETag": etag,
+        "Last-Modified": last_modified,
+        "Cache-Control": "private, no-cache",
+    }
+    
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+            return Response(status_code=304, headers=cache_headers)
+    else:
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                if int(stat.st_mtime) <= parsedate_to_datetime(if_modified_since).timestamp():
+                    return Response(status_code=304, headers=cache_headers)
+            except (TypeError, ValueError):
+                pass
+    
+    return FileResponse(
+        path=str(pdf_path),
+        media_type='application/pdf',
+        filename=f"compte-rendu-{file_id}.pdf",
+        headers=cache_headers,
+        stat_result=stat
+    )
 
 # Background processing function
-async def process_meeting_audio(file_id: str, file_path: str):
-    """Process audio file and generate meeting report"""
+async def process_meeting_audio(file_id: str, file_path: str, job, use_llm_cache: bool = True, pending_upload=None):
+    """Process audio file and generate meeting report (pending_upload: resumable upload still being received)"""
     try:
+        # Attendre qu'un worker prenne le job (le statut reste "queued" jusque-là)
+        await job.started.wait()
+        if job.cancelled:
+            return
+        
         # Update status
         await update_status(file_id, "processing", 10, "Starting transcription...")
         
         # Transcribe audio
         logger.info(f"Transcribing audio: {file_path}")
         try:
-            # Utiliser directement le module whisper (correct API)
-            import whisper as whisper_lib
-            logger.info("Loading Whisper model: base")
-            model = whisper_lib.load_model("base")
-            logger.info("Whisper model loaded, starting transcription in French...")
-            # Forcer la langue française
-            result = model.transcribe(file_path, language="fr")
+            # La transcription tourne dans le pool de workers (langue forcée en français)
+            result = await job.future
             transcript = result["text"]
             logger.info(f"Transcription completed: {len(transcript)} characters")
+        except TranscriptionCancelled:
+            logger.info(f"Transcription cancelled for {file_id}")
+            return
         except Exception as e:
             logger.error(f"Transcription error: {e}", exc_info=True)
             raise
         
+        # Pipeline : pas de résumé tant que l'upload n'est pas finalisé et son empreinte vérifiée
+        if pending_upload is not None:
+            await update_status(file_id, "processing", 45, "Transcription completed, waiting for the upload to be finalized...")
+            if not await resumable_uploads.wait_finalized(pending_upload):
+                raise RuntimeError("Upload was abandoned or failed its checksum")
+        
         await update_status(file_id, "processing", 50, "Transcription completed, generating report...")
         
         # Generate meeting report using LangChain
-        report = await generate_meeting_report(transcript, file_id)
+        report = await generate_meeting_report(transcript, file_id, use_llm_cache)
+        if result.get("audio_seconds") is not None:
+            report["duration"] = round(result["audio_seconds"], 1)
+        # Segments horodatés (mots compris) conservés pour la diarisation
+        report["segments"] = result.get("segments", [])
         
         await update_status(file_id, "processing", 90, "Finalizing report...")
         
         # Save report
-        report_file = REPORTS_DIR / f"{file_id}_report.json"
-        with open(report_file, "w", encoding="utf-8") as f:
-            json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+        report_store.save_report(report)
+        audio_cache.store(file_id, job.model_size, job.language)
+        # PDF rendu tout de suite, en arrière-plan : le premier téléchargement est immédiat
+        pdf_cache.prerender(report)
         
         await update_status(file_id, "completed", 100, "Report generated successfully")
         
@@ -482,73 +826,26 @@ async def process_meeting_audio(file_id: str, file_path: str):
         await update_status(file_id, "error", 0, f"Error: {str(e)}")
 
 async def update_status(file_id: str, status: str, progress: int, message: str):
-    """Update processing status"""
-    status_data = {
-        "id": file_id,
-        "status": status,
-        "progress": progress,
-        "message": message,
-        "updated_at": datetime.now().isoformat()
-    }
+    """Update processing status (in memory, persisted in batches by job_states)"""
+    status_data = job_states.update(file_id, status, progress, message)
     
-    status_file = REPORTS_DIR / f"{file_id}_status.json"
-    with open(status_file, "w") as f:
-        json.dump(status_data, f, indent=2)
+    job_events.publish(file_id, "status", status_data, final=status in ("completed", "error", "cancelled"))
 
-async def generate_meeting_report(transcript: str, file_id: str) -> dict:
+async def generate_meeting_report(transcript: str, file_id: str, use_llm_cache: bool = True) -> dict:
     """Generate a meeting report from transcript using OpenAI"""
     
     # Use OpenAI if available, otherwise fallback to basic extraction
-    if openai_client:
+    if map_reduce_summarizer.enabled:
         try:
             logger.info("Using OpenAI for intelligent summarization in French")
             
-            # Create a prompt for OpenAI (en français)
-            prompt = f"""Analysez cette transcription de réunion et extrayez :
-
-1. Un résumé concis (2-3 phrases)
-2. Les points clés discutés (max 10)
-3. Les éléments d'action avec propriétaires si mentionnés (max 10)
-4. Les participants principaux mentionnés (max 5)
-
-Transcription :
-{transcript}
-
-Formatez la réponse en JSON avec ces clés exactes : summary, key_points, action_items, participants.
-Chaque clé doit contenir une liste de chaînes de caractères.
-Tout doit être en français."""
-
-            response = openai_client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "Vous êtes un expert en analyse de réunions. Extrayez et structurez les informations de réunion en français."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.3,
-                max_tokens=2000
-            )
-            
-            # Parse OpenAI response
-            content = response.choices[0].message.content
-            logger.info(f"OpenAI response: {content[:200]}...")
-            
-            # Try to parse as JSON, fallback if needed
-            try:
-                import json as json_lib
-                ai_data = json_lib.loads(content)
-            except:
-                # If not JSON, use basic parsing
-                ai_data = {
-                    "summary": content.split("1.")[0] if "1." in content else content[:200],
-                    "key_points": [l.strip() for l in content.split("\n") if l.strip() and "-" in l][:10],
-                    "action_items": [],
-                    "participants": []
-                }
+            # Map-reduce : les longues transcriptions sont résumées par sections en parallèle
+            ai_data = await map_reduce_summarizer.summarize(transcript, language="fr", use_cache=use_llm_cache)
             
-            summary = ai_data.get("summary", content[:200])
-            key_points = ai_data.get("key_points", [])
-            action_items = ai_data.get("action_items", [])
-            participants = ai_data.get("participants", ["Non identifié"])
+            summary = ai_data["summary"]
+            key_points = ai_data["key_points"]
+            action_items = ai_data["action_items"]
+            participants = ai_data["participants"]
             
         except Exception as e:
             logger.error(f"OpenAI error: {e}, falling back to basic extraction")
@@ -601,242 +898,6 @@ async def _basic_extraction(transcript: str):
     
     return summary, key_points, action_items, participants
 
-def generate_pdf(report: dict, output_path: str):
-    """Generate PDF from report data"""
-    try:
-        logger.info(f"Generating PDF for report: {output_path}")
-        # Create PDF
-        doc = SimpleDocTemplate(output_path, pagesize=A4)
-        styles = getSampleStyleSheet()
-        
-        # Story to build the PDF
-        story = []
-        
-        # Title - Style amélioré
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=28,
-            textColor='#1e40af',
-            spaceAfter=20,
-            spaceBefore=10,
-            alignment=TA_CENTER,
-            fontName='Helvetica-Bold'
-        )
-        story.append(Paragraph("Compte-rendu de Réunion", title_style))
-        story.append(Spacer(1, 0.3*inch))
-        
-        # Report info - Style amélioré avec fond
-        info_style = ParagraphStyle(
-            'Info',
-            parent=styles['Normal'],
-            fontSize=10,
-            textColor='#4b5563',
-            spaceAfter=8,
-            backColor='#f3f4f6',
-            borderPadding=8
-        )
-        info_box_style = ParagraphStyle(
-            'InfoBox',
-            parent=styles['Normal'],
-            fontSize=10,
-            textColor='#6b7280',
-            spaceAfter=5
-        )
-        story.append(Paragraph(f"<b>Fichier:</b> {report.get('filename', 'N/A')}", info_box_style))
-        story.append(Paragraph(f"<b>Date de création:</b> {report.get('created_at', 'N/A')}", info_box_style))
-        if report.get('duration'):
-            story.append(Paragraph(f"<b>Durée:</b> {report.get('duration', 'N/A')}", info_box_style))
-        story.append(Spacer(1, 0.4*inch))
-        
-        # Summary - Style amélioré
-        subtitle_style = ParagraphStyle(
-            'Subtitle',
-            parent=styles['Heading2'],
-            fontSize=18,
-            textColor='#1e40af',
-            spaceBefore=25,
-            spaceAfter=12,
-            fontName='Helvetica-Bold',
-            borderWidth=1,
-            borderColor='#1e40af',
-            borderPadding=8,
-            backColor='#eff6ff'
-        )
-        story.append(Paragraph("📋 Résumé", subtitle_style))
-        
-        normal_style = ParagraphStyle(
-            'Normal',
-            parent=styles['Normal'],
-            fontSize=12,
-            alignment=TA_JUSTIFY,
-            spaceAfter=12,
-            leading=14,
-            leftIndent=0,
-            rightIndent=0
-        )
-        
-        summary = report.get('summary', '')
-        # Handle summary - can be string or list
-        if isinstance(summary, list):
-            summary = ' '.join(str(s) for s in summary if s)
-        elif not isinstance(summary, str):
-            summary = str(summary) if summary else ''
-        
-        # Format summary as paragraphs
-        if summary:
-            # Split by periods or newlines for better paragraph breaks
-            paragraphs = summary.replace('. ', '.\n').split('\n')
-            for para in paragraphs:
-                para = para.strip()
-                if para:
-                    # Remove trailing period if followed by new paragraph
-                    if para.endswith('.') and len(para) > 1:
-                        para = para[:-1]
-                    story.append(Paragraph(para, normal_style))
-        
-        story.append(Spacer(1, 0.2*inch))
-        
-        # Key Points - Style amélioré
-        story.append(Paragraph("🔑 Points clés", subtitle_style))
-        bullet_style = ParagraphStyle(
-            'Bullet',
-            parent=styles['Normal'],
-            fontSize=11,
-            leftIndent=20,
-            bulletIndent=10,
-            spaceAfter=8,
-            leading=14
-        )
-        
-        key_points = report.get('key_points', [])
-        if isinstance(key_points, str):
-            key_points = [kp.strip() for kp in key_points.split(',') if kp.strip()]
-        elif not isinstance(key_points, list):
-            key_points = [str(key_points)] if key_points else []
-        
-        # Handle list items that might be nested lists
-        key_points_flat = []
-        for point in key_points:
-            if isinstance(point, list):
-                key_points_flat.extend([str(p) for p in point if p])
-            else:
-                key_points_flat.append(str(point))
-        
-        for point in key_points_flat:
-            point = point.strip()
-            if point:
-                story.append(Paragraph(f"• {point}", normal_style))
-        
-        story.append(Spacer(1, 0.2*inch))
-        
-        # Action Items - Style amélioré
-        story.append(Paragraph("✅ Éléments d'action", subtitle_style))
-        
-        action_items = report.get('action_items', [])
-        if isinstance(action_items, str):
-            action_items = [ai.strip() for ai in action_items.split(',') if ai.strip()]
-        elif not isinstance(action_items, list):
-            action_items = [str(action_items)] if action_items else []
-        
-        # Handle list items that might be nested lists
-        action_items_flat = []
-        for item in action_items:
-            if isinstance(item, list):
-                action_items_flat.extend([str(i) for i in item if i])
-            else:
-                action_items_flat.append(str(item))
-        
-        for item in action_items_flat:
-            item = item.strip()
-            if item:
-                story.append(Paragraph(f"• {item}", normal_style))
-        
-        story.append(Spacer(1, 0.2*inch))
-        
-        # Participants - Style amélioré
-        story.append(Paragraph("👥 Participants", subtitle_style))
-        
-        participants = report.get('participants', [])
-        if isinstance(participants, str):
-            participants = [p.strip() for p in participants.split(',') if p.strip()]
-        elif not isinstance(participants, list):
-            participants = [str(participants)] if participants else []
-        
-        # Handle list items that might be nested lists
-        participants_flat = []
-        for participant in participants:
-            if isinstance(participant, list):
-                participants_flat.extend([str(p) for p in participant if p])
-            else:
-                participants_flat.append(str(participant))
-        
-        for participant in participants_flat:
-            participant = participant.strip()
-            if participant:
-                story.append(Paragraph(f"• {participant}", normal_style))
-        
-        story.append(PageBreak())
-        
-        # Full Transcript - Style amélioré
-        transcript_title_style = ParagraphStyle(
-            'TranscriptTitle',
-            parent=styles['Heading2'],
-            fontSize=18,
-            textColor='#1e40af',
-            spaceBefore=25,
-            spaceAfter=15,
-            fontName='Helvetica-Bold'
-        )
-        story.append(Paragraph("📝 Transcription complète", transcript_title_style))
-        
-        transcript_style = ParagraphStyle(
-            'Transcript',
-            parent=styles['Normal'],
-            fontSize=10,
-            alignment=TA_JUSTIFY,
-            spaceAfter=8,
-            leading=12,
-            leftIndent=10,
-            rightIndent=10
-        )
-        transcript = report.get('transcript', '')
-        # Handle transcript - can be string or list
-        if isinstance(transcript, list):
-            transcript = ' '.join(str(t) for t in transcript if t)
-        elif not isinstance(transcript, str):
-            transcript = str(transcript) if transcript else ''
-        
-        # Split transcript into paragraphs
-        if transcript:
-            paragraphs = transcript.split('\n')
-            for para in paragraphs:
-                para = para.strip()
-                if para:
-                    story.append(Paragraph(para, transcript_style))
-                    story.append(Spacer(1, 0.08*inch))
-        
-        # Footer
-        story.append(Spacer(1, 0.3*inch))
-        footer_style = ParagraphStyle(
-            'Footer',
-            parent=styles['Normal'],
-            fontSize=9,
-            textColor='#9ca3af',
-            alignment=TA_CENTER,
-            spaceBefore=20
-        )
-        story.append(Paragraph("─" * 50, footer_style))
-        story.append(Paragraph("Généré par Compte rendus IA - IAHome", footer_style))
-        story.append(Paragraph(f"Document généré le {datetime.now().strftime('%d/%m/%Y à %H:%M')}", footer_style))
-        
-        # Build PDF
-        doc.build(story)
-        logger.info(f"PDF generated successfully: {output_path}")
-        return True
-    except Exception as e:
-        logger.error(f"Error generating PDF: {e}")
-        return False
 
 if __name__ == "__main__":
     import uvicorn
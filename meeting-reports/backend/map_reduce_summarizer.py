@@ -0,0 +1,376 @@
+"""
+Résumé hiérarchique (map-reduce) des transcriptions plus longues que le contexte du modèle
+"""
+
+import os
+import re
+import json
+import random
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+import openai
+
+from llm_cache import llm_cache
+from openai_client import SharedOpenAIClient, openai_client
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# À incrémenter à chaque modification des prompts : invalide le cache des réponses
+PROMPT_TEMPLATE_VERSION = "map-reduce-1"
+
+SUMMARY_KEYS = ("summary", "key_points", "action_items", "participants", "decisions", "next_steps")
+
+_LANGUAGE_NAMES = {"fr": "français", "en": "anglais"}
+
+_MAP_PROMPT = """Voici la partie {index}/{total} de la transcription d'une réunion.
+
+Transcription (partie {index}/{total}) :
+{text}
+
+Extrais de cette partie uniquement, au format JSON :
+{{
+    "summary": "Résumé de cette partie en 2-3 phrases",
+    "key_points": ["Point clé 1", "Point clé 2"],
+    "action_items": ["Action (avec responsable si mentionné)"],
+    "participants": ["Participant 1"],
+    "decisions": ["Décision 1"]
+}}
+Listes vides si rien n'est mentionné. Réponds en {language}."""
+
+_FINAL_FORMAT = """{{
+    "summary": "Résumé concis de toute la réunion en 2-3 phrases",
+    "key_points": ["Point clé 1", "Point clé 2"],
+    "action_items": ["Action 1", "Action 2"],
+    "participants": ["Participant 1", "Participant 2"],
+    "decisions": ["Décision 1"],
+    "next_steps": "Prochaines étapes recommandées"
+}}"""
+
+_SINGLE_PROMPT = """Analyse cette transcription de réunion.
+
+Transcription :
+{text}
+
+Fournis un compte rendu structuré au format JSON :
+""" + _FINAL_FORMAT + """
+
+Assure-toi que :
+- les points clés soient les plus importants (10 au maximum)
+- les actions soient spécifiques (10 au maximum) et les participants identifiés (5 au maximum)
+Réponds en {language}."""
+
+_REDUCE_PROMPT = """Voici les résumés partiels, dans l'ordre, des {total} parties d'une même réunion :
+
+{partials}
+
+Fusionne-les en un compte rendu unique au format JSON :
+""" + _FINAL_FORMAT + """
+
+Assure-toi que :
+- les doublons entre parties soient fusionnés
+- les points clés soient les plus importants (10 au maximum)
+- les actions soient spécifiques (10 au maximum) et les participants identifiés (5 au maximum)
+Réponds en {language}."""
+
+_COMBINE_PROMPT = """Voici les résumés partiels, dans l'ordre, de parties consécutives d'une même réunion :
+
+{partials}
+
+Fusionne-les en un seul résumé partiel au format JSON, avec les mêmes clés
+(summary, key_points, action_items, participants, decisions), sans doublons.
+Réponds en {language}."""
+
+_RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.InternalServerError,
+)
+
+
+def parse_json_object(text: str) -> Dict[str, Any]:
+    """Extrait le premier objet JSON d'une réponse du modèle (éventuellement entourée de texte)"""
+    match = re.search(r"\{.*\}", text, re.DOTALL)
+    data = json.loads(match.group(0) if match else text)
+    if not isinstance(data, dict):
+        raise ValueError("Expected a JSON object")
+    return data
+
+
+class MapReduceSummarizer:
+    """
+    Résumé de réunion en deux temps, quelle que soit la longueur de la transcription.
+
+    La transcription est découpée en sections bornées en tokens (aux limites de
+    phrases) ; chaque section est résumée en parallèle (map), puis les résumés
+    partiels sont fusionnés en un compte rendu JSON (reduce). Si les résumés
+    partiels dépassent eux-mêmes le budget, ils sont fusionnés par groupes
+    jusqu'à tenir dans une seule requête. Une transcription courte part en une
+    seule requête.
+    """
+
+    def __init__(self, client: Optional[SharedOpenAIClient] = None):
+        self.client = client or openai_client
+        self.model = os.getenv("SUMMARY_MODEL", "gpt-3.5-turbo")
+        self.temperature = 0.3
+        self.section_tokens = int(os.getenv("SUMMARY_SECTION_TOKENS", "3000"))
+        self.concurrency = int(os.getenv("SUMMARY_CONCURRENCY", "4"))
+        self.max_retries = int(os.getenv("SUMMARY_MAX_RETRIES", "4"))
+        self.timeout = float(os.getenv("SUMMARY_TIMEOUT", "120"))
+        self.map_max_tokens = 600
+        self.reduce_max_tokens = 1500
+
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._encoding = None
+        if tiktoken is not None:
+            try:
+                self._encoding = tiktoken.encoding_for_model(self.model)
+            except Exception:
+                self._encoding = tiktoken.get_encoding("cl100k_base")
+
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.sections = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.client.enabled
+
+    def count_tokens(self, text: str) -> int:
+        """Nombre de tokens (estimation prudente à ~3 caractères par token sans tiktoken)"""
+        if self._encoding is not None:
+            return len(self._encoding.encode(text))
+        return len(text) // 3 + 1
+
+    def split_sections(self, transcript: str) -> List[str]:
+        """
+        Découpe la transcription en sections d'au plus `section_tokens` tokens
+
+        Les coupures se font entre phrases ; une phrase trop longue est coupée
+        entre mots.
+        """
+        sentences = [s for s in re.split(r"(?<=[.!?…])\s+", transcript.strip()) if s]
+        pieces: List[str] = []
+        for sentence in sentences:
+            if self.count_tokens(sentence) <= self.section_tokens:
+                pieces.append(sentence)
+                continue
+            current, current_tokens = [], 0
+            for word in sentence.split():
+                tokens = self.count_tokens(" " + word)
+                if current and current_tokens + tokens > self.section_tokens:
+                    pieces.append(" ".join(current))
+                    current, current_tokens = [], 0
+                current.append(word)
+                current_tokens += tokens
+            if current:
+                pieces.append(" ".join(current))
+
+        sections: List[str] = []
+        current, current_tokens = [], 0
+        for piece in pieces:
+            tokens = self.count_tokens(piece)
+            if current and current_tokens + tokens > self.section_tokens:
+                sections.append(" ".join(current))
+                current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += tokens
+        if current:
+            sections.append(" ".join(current))
+        return sections
+
+    async def summarize(self, transcript: str, language: str = "fr", use_cache: bool = True) -> Dict[str, Any]:
+        """
+        Produit le compte rendu structuré d'une transcription
+
+        Une transcription identique (même modèle, température, version des prompts
+        et langue) est servie depuis le cache des réponses sans appeler l'API.
+
+        Args:
+            transcript: Texte de la transcription
+            language: Langue du compte rendu (fr, en)
+            use_cache: False pour ignorer le cache et forcer un nouvel appel
+
+        Returns:
+            Dict avec summary, key_points, action_items, participants, decisions, next_steps
+
+        Raises:
+            RuntimeError: si aucune clé OpenAI n'est configurée
+            openai.OpenAIError: si l'API échoue après toutes les tentatives
+        """
+        if not self.enabled:
+            raise RuntimeError("OPENAI_API_KEY is not configured")
+
+        # Le découpage fait partie du « template » : il change les requêtes envoyées
+        template_version = f"{PROMPT_TEMPLATE_VERSION}/s{self.section_tokens}"
+        digest = llm_cache.transcript_digest(transcript)
+        cache_key = llm_cache.cache_key(self.model, self.temperature, template_version, digest, language)
+        if use_cache:
+            cached = llm_cache.get(cache_key)
+            if cached is not None:
+                logger.info(f"Summary served from the LLM cache ({digest[:12]})")
+                return cached
+        else:
+            llm_cache.note_bypass()
+
+        usage = {"tokens": 0}
+        result = await self._summarize(transcript, language, usage)
+        llm_cache.put(cache_key, result, self.model, template_version, digest, usage["tokens"])
+        return result
+
+    async def _summarize(self, transcript: str, language: str, usage: Dict[str, int]) -> Dict[str, Any]:
+        sections = self.split_sections(transcript)
+        self.sections += len(sections)
+        language_name = _LANGUAGE_NAMES.get(language, language)
+
+        if len(sections) <= 1:
+            # Tient dans le contexte : une seule requête, directement au format final
+            prompt = _SINGLE_PROMPT.format(text=transcript, language=language_name)
+        else:
+            logger.info(f"Summarizing {len(sections)} sections ({self.count_tokens(transcript)} tokens)")
+            partials = await asyncio.gather(*(
+                self._map_section(section, index + 1, len(sections), language_name, usage)
+                for index, section in enumerate(sections)
+            ))
+            # Fusion par groupes tant que les résumés partiels ne tiennent pas dans une requête
+            while len(partials) > 1 and self.count_tokens(self._format_partials(partials)) > self.section_tokens:
+                groups = self._group_partials(partials)
+                partials = await asyncio.gather(*(self._combine(group, language_name, usage) for group in groups))
+            prompt = _REDUCE_PROMPT.format(total=len(sections), partials=self._format_partials(partials),
+                                           language=language_name)
+        content = await self._complete("summary_reduce", prompt, self.reduce_max_tokens, language_name, usage)
+        return self._normalize(parse_json_object(content))
+
+    async def aclose(self):
+        await self.client.aclose()
+        self._semaphore = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "model": self.model,
+            "requests": self.requests,
+            "retries": self.retries,
+            "failures": self.failures,
+            "sections": self.sections,
+            "tokenizer": "tiktoken" if self._encoding is not None else "estimate",
+        }
+
+    async def _map_section(self, section: str, index: int, total: int, language_name: str,
+                           usage: Dict[str, int]) -> Dict[str, Any]:
+        prompt = _MAP_PROMPT.format(index=index, total=total, text=section, language=language_name)
+        content = await self._complete("summary_map", prompt, self.map_max_tokens, language_name, usage)
+        try:
+            return parse_json_object(content)
+        except ValueError:
+            # Résumé non structuré : on garde le texte, la fusion s'en accommode
+            return {"summary": content.strip()}
+
+    async def _combine(self, partials: List[Dict[str, Any]], language_name: str,
+                       usage: Dict[str, int]) -> Dict[str, Any]:
+        if len(partials) == 1:
+            return partials[0]
+        prompt = _COMBINE_PROMPT.format(partials=self._format_partials(partials), language=language_name)
+        content = await self._complete("summary_combine", prompt, self.reduce_max_tokens, language_name, usage)
+        try:
+            return parse_json_object(content)
+        except ValueError:
+            return {"summary": content.strip()}
+
+    def _format_partials(self, partials: List[Dict[str, Any]]) -> str:
+        return "\n\n".join(
+            f"Partie {index + 1} :\n{json.dumps(partial, ensure_ascii=False)}"
+            for index, partial in enumerate(partials)
+        )
+
+    def _group_partials(self, partials: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        groups: List[List[Dict[str, Any]]] = []
+        current: List[Dict[str, Any]] = []
+        for partial in partials:
+            if current and self.count_tokens(self._format_partials(current + [partial])) > self.section_tokens:
+                groups.append(current)
+                current = []
+            current.append(partial)
+        if current:
+            groups.append(current)
+        if len(groups) == len(partials):
+            # Chaque résumé dépasse le budget à lui seul : on fusionne au moins par deux
+            groups = [partials[i:i + 2] for i in range(0, len(partials), 2)]
+        return groups
+
+    async def _complete(self, operation: str, prompt: str, max_tokens: int, language_name: str,
+                        usage: Dict[str, int]) -> str:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        for attempt in range(self.max_retries + 1):
+            # Le sémaphore n'est tenu que pendant la requête : une attente de backoff
+            # ne bloque pas une place de concurrence
+            async with self._semaphore:
+                self.requests += 1
+                try:
+                    # Les nouvelles tentatives sont gérées ici (avec jitter), pas par le SDK
+                    response = await self.client.chat_completion(
+                        operation,
+                        max_retries=0,
+                        timeout=self.timeout,
+                        model=self.model,
+                        messages=[
+                            {"role": "system", "content": f"Tu es un assistant spécialisé dans le résumé de réunions en {language_name}."},
+                            {"role": "user", "content": prompt}
+                        ],
+                        max_tokens=max_tokens,
+                        temperature=self.temperature
+                    )
+                    if response.usage is not None:
+                        usage["tokens"] += response.usage.total_tokens
+                    return response.choices[0].message.content or ""
+                except _RETRYABLE_ERRORS as e:
+                    if attempt == self.max_retries:
+                        self.failures += 1
+                        raise
+                    self.retries += 1
+                    delay = self._retry_delay(e, attempt)
+                    logger.warning(f"OpenAI request failed ({type(e).__name__}), retrying in {delay:.1f}s")
+                except openai.OpenAIError:
+                    self.failures += 1
+                    raise
+            await asyncio.sleep(delay)
+        raise RuntimeError("unreachable")
+
+    @staticmethod
+    def _retry_delay(error: Exception, attempt: int) -> float:
+        # Backoff exponentiel avec « full jitter », en respectant Retry-After s'il est fourni
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                return float(retry_after) + random.uniform(0, 0.5)
+            except ValueError:
+                pass
+        return random.uniform(0, min(30.0, 0.5 * 2 ** attempt))
+
+    def _normalize(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        result: Dict[str, Any] = {}
+        for key in SUMMARY_KEYS:
+            value = data.get(key)
+            if key in ("summary", "next_steps"):
+                if isinstance(value, list):
+                    value = " ".join(str(v) for v in value if v)
+                result[key] = value or ""
+            else:
+                if isinstance(value, str):
+                    value = [value] if value.strip() else []
+                result[key] = [str(v) for v in (value or []) if v]
+        return result
+
+
+# Instance globale
+map_reduce_summarizer = MapReduceSummarizer()
@@ -0,0 +1,199 @@
+"""
+Registre des modèles Whisper partagé par tout le processus
+"""
+
+import os
+import time
+import threading
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from transcription_engines import create_engine
+
+logger = logging.getLogger(__name__)
+
+
+def current_rss_bytes() -> Optional[int]:
+    """Mémoire résidente actuelle du processus (en octets)"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        pass
+    try:
+        import resource
+        # ru_maxrss est un pic (Ko sous Linux), faute de mieux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except Exception:
+        return None
+
+
+class _LoadedModel:
+    __slots__ = ("size", "model", "refcount", "load_seconds", "rss_bytes", "loaded_at", "last_used")
+
+    def __init__(self, size: str, model: Any, load_seconds: float, rss_bytes: Optional[int]):
+        self.size = size
+        self.model = model
+        self.refcount = 0
+        self.load_seconds = load_seconds
+        self.rss_bytes = rss_bytes
+        self.loaded_at = time.time()
+        self.last_used = self.loaded_at
+
+
+class WhisperModelRegistry:
+    """
+    Charge chaque taille de modèle Whisper une seule fois et la partage entre les jobs.
+
+    Les modèles sont comptés par référence : un modèle en cours d'utilisation n'est
+    jamais déchargé. Quand plus de `max_loaded` tailles sont en mémoire, la moins
+    récemment utilisée (et non référencée) est évincée. Les modèles sont chargés
+    par le moteur de transcription du déploiement (TRANSCRIPTION_ENGINE).
+    """
+
+    def __init__(self):
+        self.default_size = os.getenv("WHISPER_MODEL", "base")
+        self.warm_sizes = [
+            s.strip() for s in os.getenv("WHISPER_MODELS", self.default_size).split(",") if s.strip()
+        ]
+        self.max_loaded = max(1, int(os.getenv("WHISPER_MAX_LOADED_MODELS", str(len(self.warm_sizes) or 1))))
+        self.device = os.getenv("WHISPER_DEVICE", "cpu")
+        self.engine = create_engine()
+
+        self._models: "OrderedDict[str, _LoadedModel]" = OrderedDict()
+        self._loading: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+        self._evictions = 0
+
+    def warm(self, sizes: Optional[List[str]] = None):
+        """
+        Précharge les modèles configurés (appelé au démarrage)
+
+        Args:
+            sizes: Tailles à charger (par défaut WHISPER_MODELS)
+        """
+        for size in sizes or self.warm_sizes:
+            try:
+                with self.acquire(size):
+                    pass
+            except Exception as e:
+                logger.error(f"Error warming Whisper model '{size}': {e}")
+
+    @contextmanager
+    def acquire(self, size: Optional[str] = None):
+        """
+        Emprunte un modèle chargé pour la durée du bloc `with`
+
+        Args:
+            size: Taille du modèle (tiny, base, small...)
+
+        Yields:
+            Le modèle Whisper prêt à l'emploi
+        """
+        entry = self._checkout(size or self.default_size)
+        try:
+            yield entry.model
+        finally:
+            self._release(entry)
+
+    def is_loaded(self, size: Optional[str] = None) -> bool:
+        with self._lock:
+            if size is None:
+                return bool(self._models)
+            return size in self._models
+
+    def stats(self) -> Dict[str, Any]:
+        """Statistiques exposées par /health"""
+        with self._lock:
+            models = [
+                {
+                    "size": entry.size,
+                    "refcount": entry.refcount,
+                    "load_seconds": round(entry.load_seconds, 3),
+                    "rss_mb": round(entry.rss_bytes / 1024 / 1024, 1) if entry.rss_bytes is not None else None,
+                    "loaded_at": entry.loaded_at,
+                    "idle_seconds": round(time.time() - entry.last_used, 1),
+                }
+                for entry in self._models.values()
+            ]
+            evictions = self._evictions
+        rss = current_rss_bytes()
+        return {
+            **self.engine.describe(),
+            "device": self.device,
+            "max_loaded": self.max_loaded,
+            "evictions": evictions,
+            "process_rss_mb": round(rss / 1024 / 1024, 1) if rss is not None else None,
+            "models": models,
+        }
+
+    def _checkout(self, size: str) -> _LoadedModel:
+        while True:
+            with self._lock:
+                entry = self._models.get(size)
+                if entry is not None:
+                    entry.refcount += 1
+                    entry.last_used = time.time()
+                    self._models.move_to_end(size)
+                    return entry
+                pending = self._loading.get(size)
+                if pending is None:
+                    pending = threading.Event()
+                    self._loading[size] = pending
+                    break
+            # Un autre thread charge déjà ce modèle : attendre puis réessayer
+            pending.wait()
+
+        try:
+            entry = self._load(size)
+        except BaseException:
+            # Échec : réveiller les threads en attente, l'un d'eux retentera le chargement
+            with self._lock:
+                self._loading.pop(size, None)
+            pending.set()
+            raise
+
+        # Modèle publié avant de réveiller les threads en attente : ils le trouvent
+        # dans _models au lieu de relancer un chargement
+        with self._lock:
+            entry.refcount += 1
+            self._models[size] = entry
+            self._loading.pop(size, None)
+            self._evict_locked()
+        pending.set()
+        return entry
+
+    def _release(self, entry: _LoadedModel):
+        with self._lock:
+            entry.refcount -= 1
+            entry.last_used = time.time()
+            self._evict_locked()
+
+    def _evict_locked(self):
+        if len(self._models) <= self.max_loaded:
+            return
+        for size in list(self._models.keys()):
+            if len(self._models) <= self.max_loaded:
+                break
+            if self._models[size].refcount == 0:
+                logger.info(f"Evicting Whisper model '{size}' (LRU)")
+                del self._models[size]
+                self._evictions += 1
+
+    def _load(self, size: str) -> _LoadedModel:
+        logger.info(f"Loading Whisper model: {size} ({self.engine.name})")
+        rss_before = current_rss_bytes()
+        started = time.perf_counter()
+        model = self.engine.load(size, device=self.device)
+        load_seconds = time.perf_counter() - started
+        rss_after = current_rss_bytes()
+        rss_bytes = rss_after - rss_before if rss_before is not None and rss_after is not None else None
+        logger.info(f"Whisper model '{size}' loaded in {load_seconds:.1f}s")
+        return _LoadedModel(size, model, load_seconds, rss_bytes)
+
+
+# Instance globale
+model_registry = WhisperModelRegistry()
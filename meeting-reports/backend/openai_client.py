@@ -0,0 +1,249 @@
+"""
+Client OpenAI asynchrone partagé (pool de connexions keep-alive, HTTP/2 si disponible)
+"""
+
+import os
+import time
+import asyncio
+import logging
+from bisect import bisect_left
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+import openai
+
+try:
+    import h2  # noqa: F401  (présence requise par httpx pour HTTP/2)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Bornes (secondes) de l'histogramme de latence des requêtes
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class LatencyHistogram:
+    """Histogramme de latences (nombre de requêtes par bucket), par opération"""
+
+    __slots__ = ("counts", "count", "total", "max", "errors")
+
+    def __init__(self):
+        self.counts: List[int] = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.errors = 0
+
+    def observe(self, seconds: float):
+        self.counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Quantile estimé (borne supérieure du bucket qui le contient)"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return LATENCY_BUCKETS[index] if index < len(LATENCY_BUCKETS) else round(self.max, 3)
+        return round(self.max, 3)
+
+    def to_dict(self) -> Dict[str, Any]:
+        buckets = {f"le_{bound}": count for bound, count in zip(LATENCY_BUCKETS, self.counts)}
+        buckets["le_inf"] = self.counts[-1]
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "avg_seconds": round(self.total / self.count, 3) if self.count else None,
+            "p50_seconds": self.quantile(0.5),
+            "p95_seconds": self.quantile(0.95),
+            "max_seconds": round(self.max, 3),
+            "buckets": buckets,
+        }
+
+
+class SharedOpenAIClient:
+    """
+    Un seul client AsyncOpenAI pour tous les modules (résumé, chat, questions).
+
+    Le client httpx sous-jacent garde les connexions ouvertes (keep-alive) : plus de
+    nouvelle poignée de main TLS à chaque requête. Un sémaphore borne le nombre de
+    requêtes simultanées vers l'API, et chaque requête alimente un histogramme de
+    latence par opération, exposé par /health.
+    """
+
+    def __init__(self):
+        self.api_key = os.getenv("OPENAI_API_KEY")
+        self.base_url = os.getenv("OPENAI_BASE_URL") or None
+        self.max_connections = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))
+        self.max_keepalive = int(os.getenv("OPENAI_MAX_KEEPALIVE", "10"))
+        self.max_concurrency = int(os.getenv("OPENAI_MAX_CONCURRENCY", "8"))
+        self.timeout = float(os.getenv("OPENAI_TIMEOUT", "60"))
+        self.connect_timeout = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+        self.max_retries = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+        self.http2 = HTTP2_AVAILABLE and os.getenv("OPENAI_HTTP2", "true").lower() in ("1", "true", "yes")
+
+        self._client: Optional[openai.AsyncOpenAI] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._histograms: Dict[str, LatencyHistogram] = {}
+        self.in_flight = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.api_key) and self.api_key != "your_openai_api_key_here"
+
+    @property
+    def client(self) -> openai.AsyncOpenAI:
+        """Client AsyncOpenAI partagé (créé à la première utilisation, dans la boucle courante)"""
+        if self._client is None:
+            http_client = httpx.AsyncClient(
+                http2=self.http2,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive,
+                    keepalive_expiry=60.0,
+                ),
+                timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+            )
+            self._client = openai.AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                max_retries=self.max_retries,
+                http_client=http_client,
+            )
+            logger.info(f"Shared OpenAI client created (HTTP/2: {self.http2}, "
+                        f"{self.max_connections} connections, {self.max_concurrency} concurrent requests)")
+        return self._client
+
+    async def chat_completion(self, operation: str, max_retries: Optional[int] = None, **kwargs):
+        """
+        Appelle chat.completions.create avec le client partagé
+
+        Args:
+            operation: Nom de l'opération pour l'histogramme (summary_map, chat, ...)
+            max_retries: Nombre de nouvelles tentatives du SDK (par défaut celui du client)
+            **kwargs: Paramètres de chat.completions.create
+
+        Returns:
+            La réponse de l'API
+        """
+        client = self.client if max_retries is None else self.client.with_options(max_retries=max_retries)
+        return await self._timed(operation, client.chat.completions.create, kwargs)
+
+    async def stream_chat_completion(self, operation: str, **kwargs) -> AsyncIterator[str]:
+        """
+        Appelle chat.completions.create en streaming et relaie le texte au fil de l'eau
+
+        Le délai avant le premier token est enregistré dans l'histogramme
+        `{operation}_ttft`, la durée totale dans celui de l'opération.
+
+        Args:
+            operation: Nom de l'opération pour l'histogramme (chat_stream, ...)
+            **kwargs: Paramètres de chat.completions.create (sans `stream`)
+
+        Yields:
+            Les fragments de texte de la réponse
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        histogram = self._histograms.setdefault(operation, LatencyHistogram())
+        ttft_histogram = self._histograms.setdefault(f"{operation}_ttft", LatencyHistogram())
+
+        async with self._semaphore:
+            self.in_flight += 1
+            started = time.perf_counter()
+            first_token = True
+            stream = None
+            try:
+                stream = await self.client.chat.completions.create(stream=True, **kwargs)
+                async for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    text = chunk.choices[0].delta.content
+                    if not text:
+                        continue
+                    if first_token:
+                        ttft_histogram.observe(time.perf_counter() - started)
+                        first_token = False
+                    yield text
+            except Exception:
+                histogram.errors += 1
+                raise
+            finally:
+                # Client parti en cours de réponse : libérer la connexion
+                if stream is not None:
+                    await stream.close()
+                histogram.observe(time.perf_counter() - started)
+                self.in_flight -= 1
+
+    async def embeddings(self, operation: str, **kwargs):
+        """
+        Appelle embeddings.create avec le client partagé
+
+        Args:
+            operation: Nom de l'opération pour l'histogramme
+            **kwargs: Paramètres de embeddings.create (model, input)
+
+        Returns:
+            La réponse de l'API
+        """
+        return await self._timed(operation, self.client.embeddings.create, kwargs)
+
+    async def transcription(self, operation: str, max_retries: Optional[int] = None, **kwargs):
+        """
+        Appelle audio.transcriptions.create avec le client partagé
+
+        Args:
+            operation: Nom de l'opération pour l'histogramme
+            max_retries: Nombre de nouvelles tentatives du SDK (par défaut celui du client)
+            **kwargs: Paramètres de audio.transcriptions.create (model, file, timeout...)
+
+        Returns:
+            La réponse de l'API
+        """
+        client = self.client if max_retries is None else self.client.with_options(max_retries=max_retries)
+        return await self._timed(operation, client.audio.transcriptions.create, kwargs)
+
+    async def _timed(self, operation: str, create, kwargs: Dict[str, Any]):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        histogram = self._histograms.setdefault(operation, LatencyHistogram())
+
+        async with self._semaphore:
+            self.in_flight += 1
+            started = time.perf_counter()
+            try:
+                return await create(**kwargs)
+            except Exception:
+                histogram.errors += 1
+                raise
+            finally:
+                histogram.observe(time.perf_counter() - started)
+                self.in_flight -= 1
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+        # Le sémaphore est lié à la boucle qui l'a utilisé
+        self._semaphore = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "http2": self.http2,
+            "max_connections": self.max_connections,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "latency": {operation: histogram.to_dict() for operation, histogram in self._histograms.items()},
+        }
+
+
+# Instance globale
+openai_client = SharedOpenAIClient()
@@ -3,10 +3,12 @@ Module de résumé avec OpenAI
 """
 
 import os
-import openai
+import asyncio
 from typing import Dict, List, Any
 import logging
 
+from map_reduce_summarizer import map_reduce_summarizer
+
 logger = logging.getLogger(__name__)
 
 class OpenAISummarizer:
@@ -25,13 +27,18 @@ class OpenAISummarizer:
             self.enabled = False
             logger.warning("OpenAI API key not configured - using fallback summarization")
     
-    def summarize_transcript(self, transcript: str, language: str = "fr") -> Dict[str, str]:
+    async def summarize_transcript_async(self, transcript: str, language: str = "fr",
+                                         use_cache: bool = True) -> Dict[str, Any]:
         """
-        Résumer une transcription avec OpenAI
+        Résumer une transcription avec OpenAI, sans bloquer la boucle d'événements
+        
+        Les transcriptions plus longues que le contexte du modèle sont résumées
+        par sections puis fusionnées (voir map_reduce_summarizer).
         
         Args:
             transcript: Le texte de la transcription
             language: Langue du résumé (fr, en, etc.)
+            use_cache: False pour ignorer le cache des réponses OpenAI
             
         Returns:
             Dict contenant le résumé, les points clés et les actions
@@ -40,27 +47,48 @@ class OpenAISummarizer:
             return self._fallback_summary(transcript)
         
         try:
-            # Créer le prompt pour le résumé
-            prompt = self._create_summary_prompt(transcript, language)
-            
-            # Appeler l'API OpenAI (nouvelle version)
-            client = openai.OpenAI(api_key=self.api_key)
-            response = client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": f"Tu es un assistant spécialisé dans le résumé de réunions en {language}."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=self.max_tokens,
-                temperature=self.temperature
-            )
-            
-            # Extraire la réponse
-            summary_text = response.choices[0].message.content
+            return await map_reduce_summarizer.summarize(transcript, language, use_cache=use_cache)
+        except Exception as e:
+            logger.error(f"Erreur OpenAI: {e}")
+            return self._fallback_summary(transcript)
+    
+    def summarize_transcript(self, transcript: str, language: str = "fr") -> Dict[str, str]:
+        """
+        Résumer une transcription avec OpenAI (version synchrone, pour les scripts)
+        
+        Dans l'application (boucle d'événements en cours), utiliser
+        `summarize_transcript_async`.
+        
+        Args:
+            transcript: Le texte de la transcription
+            language: Langue du résumé (fr, en, etc.)
             
-            # Parser la réponse structurée
-            return self._parse_summary_response(summary_text)
+        Returns:
+            Dict contenant le résumé, les points clés et les actions
             
+        Raises:
+            RuntimeError: si appelée depuis une boucle d'événements en cours
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+        else:
+            raise RuntimeError("summarize_transcript() cannot run inside an event loop, "
+                               "await summarize_transcript_async() instead")
+        
+        if not self.enabled:
+            return self._fallback_summary(transcript)
+        
+        async def run():
+            try:
+                return await map_reduce_summarizer.summarize(transcript, language)
+            finally:
+                # Le client partagé est lié à cette boucle : il sera recréé dans la suivante
+                await map_reduce_summarizer.aclose()
+        
+        try:
+            return asyncio.run(run())
         except Exception as e:
             logger.error(f"Erreur OpenAI: {e}")
             return self._fallback_summary(transcript)
@@ -0,0 +1,168 @@
+"""
+Rendu des PDF dans un pool de processus, avec cache indexé par le contenu du rapport
+"""
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from report_pdf import PDF_FIELDS
+
+logger = logging.getLogger(__name__)
+
+# À incrémenter quand la mise en page change : les PDF en cache sont alors régénérés
+PDF_TEMPLATE_VERSION = "2"
+
+
+def _render(report: Dict[str, Any], output_path: str) -> float:
+    """Exécuté dans un worker : écrit le PDF dans un fichier temporaire puis le publie"""
+    from report_pdf import generate_pdf
+
+    started = time.perf_counter()
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    try:
+        if not generate_pdf(report, tmp_path):
+            raise RuntimeError("PDF generation failed")
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+    return time.perf_counter() - started
+
+
+class PDFRenderCache:
+    """
+    PDF des rapports rendus hors de la boucle asyncio et gardés sur disque.
+
+    La clé est l'empreinte SHA-256 des champs affichés dans le PDF (plus la
+    version de la mise en page) : un rapport régénéré produit une nouvelle clé
+    et l'ancien PDF est supprimé. L'empreinte sert aussi d'ETag. Deux demandes
+    simultanées pour le même rapport partagent un seul rendu.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None):
+        self.cache_dir = Path(cache_dir or os.getenv("PDF_CACHE_DIR", "/app/reports/pdf_cache"))
+        self.workers = int(os.getenv("PDF_WORKERS", "2"))
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._renders: Dict[str, asyncio.Future] = {}
+        self._background: set = set()
+
+        self.hits = 0
+        self.renders = 0
+        self.failures = 0
+        self.prerendered = 0
+        self.render_seconds = 0.0
+
+    @staticmethod
+    def content_hash(report: Dict[str, Any]) -> str:
+        content = {field: report.get(field) for field in PDF_FIELDS}
+        raw = json.dumps(content, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(f"{PDF_TEMPLATE_VERSION}|{raw}".encode("utf-8")).hexdigest()
+
+    def path_for(self, report_id: str, digest: str) -> Path:
+        return self.cache_dir / f"{report_id}-{digest[:16]}.pdf"
+
+    async def get_pdf(self, report: Dict[str, Any]) -> Tuple[Path, str]:
+        """
+        PDF d'un rapport, rendu si nécessaire
+
+        Args:
+            report: Le rapport complet (avec la transcription)
+
+        Returns:
+            (chemin du PDF, empreinte du contenu)
+
+        Raises:
+            RuntimeError: si le rendu échoue
+        """
+        digest = self.content_hash(report)
+        path = self.path_for(report["id"], digest)
+        if path.exists():
+            self.hits += 1
+            return path, digest
+
+        future = self._renders.get(digest)
+        if future is None:
+            future = asyncio.ensure_future(self._render_report(report, path))
+            self._renders[digest] = future
+            future.add_done_callback(lambda _: self._renders.pop(digest, None))
+        await asyncio.shield(future)
+        return path, digest
+
+    def prerender(self, report: Dict[str, Any]):
+        """Lance le rendu en arrière-plan (après la génération d'un rapport)"""
+        async def run():
+            try:
+                await self.get_pdf(report)
+                self.prerendered += 1
+            except Exception as e:
+                logger.warning(f"Background PDF rendering failed for {report.get('id')}: {e}")
+
+        task = asyncio.ensure_future(run())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    def discard(self, report_id: str):
+        """Supprime les PDF en cache d'un rapport"""
+        if not self.cache_dir.exists():
+            return
+        for pdf_file in self.cache_dir.glob(f"{report_id}-*.pdf"):
+            pdf_file.unlink(missing_ok=True)
+
+    def clear(self):
+        if not self.cache_dir.exists():
+            return
+        for pdf_file in self.cache_dir.glob("*.pdf"):
+            pdf_file.unlink(missing_ok=True)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "hits": self.hits,
+            "renders": self.renders,
+            "failures": self.failures,
+            "prerendered": self.prerendered,
+            "rendering": len(self._renders),
+            "avg_render_seconds": round(self.render_seconds / self.renders, 3) if self.renders else None,
+        }
+
+    async def _render_report(self, report: Dict[str, Any], path: Path):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        content = {field: report.get(field) for field in PDF_FIELDS}
+        try:
+            seconds = await asyncio.get_running_loop().run_in_executor(
+                self._executor, _render, content, str(path)
+            )
+        except Exception:
+            self.failures += 1
+            if getattr(self._executor, "_broken", False):
+                self._executor = None
+            raise
+
+        self.renders += 1
+        self.render_seconds += seconds
+        # Versions précédentes du rapport : plus jamais servies
+        for old_file in self.cache_dir.glob(f"{report['id']}-*.pdf"):
+            if old_file != path:
+                old_file.unlink(missing_ok=True)
+        logger.info(f"PDF rendered for {report['id']} in {seconds:.2f}s")
+
+
+# Instance globale
+pdf_cache = PDFRenderCache()
@@ -2,70 +2,18 @@ import os
 from datetime import datetime
 from pathlib import Path
 from reportlab.lib.pagesizes import A4
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.lib import colors
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak
-from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_JUSTIFY
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
 import logging
 
+from pdf_templates import pdf_templates
+
 logger = logging.getLogger(__name__)
 
 class PDFGenerator:
     def __init__(self):
-        self.styles = getSampleStyleSheet()
-        self._setup_custom_styles()
+        # Feuille de styles partagée, construite une fois par processus
+        self.styles = pdf_templates.generator_styles()
     
-    def _setup_custom_styles(self):
-        """Configure les styles personnalisés pour le PDF"""
-        # Style pour le titre principal
-        self.styles.add(ParagraphStyle(
-            name='CustomTitle',
-            parent=self.styles['Heading1'],
-            fontSize=24,
-            spaceAfter=30,
-            alignment=TA_CENTER,
-            textColor=colors.HexColor('#2563eb')
-        ))
-        
-        # Style pour les sous-titres
-        self.styles.add(ParagraphStyle(
-            name='CustomHeading2',
-            parent=self.styles['Heading2'],
-            fontSize=16,
-            spaceAfter=12,
-            spaceBefore=20,
-            textColor=colors.HexColor('#1e40af')
-        ))
-        
-        # Style pour le texte normal
-        self.styles.add(ParagraphStyle(
-            name='CustomBody',
-            parent=self.styles['Normal'],
-            fontSize=11,
-            spaceAfter=6,
-            alignment=TA_JUSTIFY
-        ))
-        
-        # Style pour les listes à puces
-        self.styles.add(ParagraphStyle(
-            name='CustomBullet',
-            parent=self.styles['Normal'],
-            fontSize=11,
-            spaceAfter=4,
-            leftIndent=20,
-            bulletIndent=10
-        ))
-        
-        # Style pour les métadonnées
-        self.styles.add(ParagraphStyle(
-            name='CustomMeta',
-            parent=self.styles['Normal'],
-            fontSize=9,
-            spaceAfter=4,
-            textColor=colors.HexColor('#6b7280')
-        ))
-
     def generate_meeting_report_pdf(self, report_data: dict, file_id: str) -> str:
         """
         Génère un PDF à partir des données du rapport de réunion
@@ -0,0 +1,278 @@
+"""
+Styles et polices ReportLab préparés une fois par processus, découpage de la transcription
+"""
+
+import os
+import re
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+from xml.sax.saxutils import escape
+
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER, TA_JUSTIFY
+from reportlab.lib.styles import ParagraphStyle, StyleSheet1, getSampleStyleSheet
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+
+logger = logging.getLogger(__name__)
+
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?…])\s+")
+
+
+class PDFTemplates:
+    """
+    Styles des deux mises en page PDF, construits à la première utilisation.
+
+    `getSampleStyleSheet()` et la dizaine de `ParagraphStyle` dérivés ne sont plus
+    recréés à chaque rendu ; les polices TrueType éventuelles (PDF_FONT_PATH,
+    PDF_FONT_BOLD_PATH) sont enregistrées une seule fois par processus. Les
+    styles sont partagés en lecture seule entre les rendus.
+    """
+
+    def __init__(self):
+        self.font_path = os.getenv("PDF_FONT_PATH", "")
+        self.bold_font_path = os.getenv("PDF_FONT_BOLD_PATH", "")
+        self.transcript_paragraph_chars = int(os.getenv("PDF_TRANSCRIPT_PARAGRAPH_CHARS", "800"))
+        self._lock = threading.RLock()
+        self._fonts: Optional[Tuple[str, str]] = None
+        self._report_styles: Optional[Dict[str, ParagraphStyle]] = None
+        self._generator_styles: Optional[StyleSheet1] = None
+
+    def fonts(self) -> Tuple[str, str]:
+        """Polices (normale, grasse) : TrueType configurée, sinon Helvetica"""
+        if self._fonts is None:
+            with self._lock:
+                if self._fonts is None:
+                    self._fonts = self._register_fonts()
+        return self._fonts
+
+    def report_styles(self) -> Dict[str, ParagraphStyle]:
+        """Styles de la mise en page de l'API principale (report_pdf)"""
+        if self._report_styles is None:
+            with self._lock:
+                if self._report_styles is None:
+                    self._report_styles = self._build_report_styles()
+        return self._report_styles
+
+    def generator_styles(self) -> StyleSheet1:
+        """Feuille de styles de PDFGenerator (API simplifiée)"""
+        if self._generator_styles is None:
+            with self._lock:
+                if self._generator_styles is None:
+                    self._generator_styles = self._build_generator_styles()
+        return self._generator_styles
+
+    def clear(self):
+        """Oublie les styles préparés (reconstruits au prochain rendu)"""
+        with self._lock:
+            self._report_styles = None
+            self._generator_styles = None
+
+    def transcript_paragraphs(self, lines: Iterable[str], max_chars: Optional[int] = None) -> List[str]:
+        """
+        Balisage des paragraphes de la transcription : un par ligne, au plus `max_chars` caractères
+
+        Une transcription Whisper arrive en un seul bloc de texte : un Paragraph
+        géant que ReportLab re-découpe à chaque saut de page (coût quadratique).
+        Les lignes trop longues sont donc coupées entre deux phrases. Les lignes
+        courtes ne sont pas fusionnées : un paragraphe avec des <br/> se met en
+        page plus lentement que plusieurs paragraphes simples. Le texte est
+        échappé pour le balisage ReportLab. `max_chars=0` désactive la coupe.
+        """
+        max_chars = self.transcript_paragraph_chars if max_chars is None else max_chars
+        paragraphs: List[str] = []
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            pieces = self._split_long(line, max_chars) if max_chars else [line]
+            paragraphs.extend(escape(piece) for piece in pieces)
+        return paragraphs
+
+    @staticmethod
+    def _split_long(line: str, max_chars: int) -> List[str]:
+        if len(line) <= max_chars:
+            return [line]
+        units: List[str] = []
+        for sentence in _SENTENCE_END_RE.split(line):
+            if len(sentence) <= max_chars:
+                units.append(sentence)
+                continue
+            # Phrase interminable (pas de ponctuation) : coupe entre deux mots
+            words = sentence.split()
+            chunk: List[str] = []
+            size = 0
+            for word in words:
+                if chunk and size + len(word) + 1 > max_chars:
+                    units.append(" ".join(chunk))
+                    chunk, size = [], 0
+                chunk.append(word)
+                size += len(word) + 1
+            if chunk:
+                units.append(" ".join(chunk))
+
+        pieces: List[str] = []
+        current = ""
+        for unit in units:
+            if current and len(current) + len(unit) + 1 > max_chars:
+                pieces.append(current)
+                current = unit
+            else:
+                current = f"{current} {unit}" if current else unit
+        if current:
+            pieces.append(current)
+        return pieces
+
+    def _register_fonts(self) -> Tuple[str, str]:
+        regular, bold = "Helvetica", "Helvetica-Bold"
+        if self.font_path:
+            try:
+                pdfmetrics.registerFont(TTFont("ReportFont", self.font_path))
+                regular = bold = "ReportFont"
+                if self.bold_font_path:
+                    pdfmetrics.registerFont(TTFont("ReportFont-Bold", self.bold_font_path))
+                    bold = "ReportFont-Bold"
+                logger.info(f"PDF font registered: {self.font_path}")
+            except Exception as e:
+                logger.warning(f"Could not register PDF font {self.font_path}, using Helvetica: {e}")
+        return regular, bold
+
+    def _build_report_styles(self) -> Dict[str, ParagraphStyle]:
+        regular, bold = self.fonts()
+        styles = getSampleStyleSheet()
+        return {
+            "title": ParagraphStyle(
+                'CustomTitle',
+                parent=styles['Heading1'],
+                fontSize=28,
+                textColor='#1e40af',
+                spaceAfter=20,
+                spaceBefore=10,
+                alignment=TA_CENTER,
+                fontName=bold
+            ),
+            "info_box": ParagraphStyle(
+                'InfoBox',
+                parent=styles['Normal'],
+                fontSize=10,
+                textColor='#6b7280',
+                spaceAfter=5,
+                fontName=regular
+            ),
+            "subtitle": ParagraphStyle(
+                'Subtitle',
+                parent=styles['Heading2'],
+                fontSize=18,
+                textColor='#1e40af',
+                spaceBefore=25,
+                spaceAfter=12,
+                fontName=bold,
+                borderWidth=1,
+                borderColor='#1e40af',
+                borderPadding=8,
+                backColor='#eff6ff'
+            ),
+            "normal": ParagraphStyle(
+                'Normal',
+                parent=styles['Normal'],
+                fontSize=12,
+                alignment=TA_JUSTIFY,
+                spaceAfter=12,
+                leading=14,
+                leftIndent=0,
+                rightIndent=0,
+                fontName=regular
+            ),
+            "transcript_title": ParagraphStyle(
+                'TranscriptTitle',
+                parent=styles['Heading2'],
+                fontSize=18,
+                textColor='#1e40af',
+                spaceBefore=25,
+                spaceAfter=15,
+                fontName=bold
+            ),
+            "transcript": ParagraphStyle(
+                'Transcript',
+                parent=styles['Normal'],
+                fontSize=10,
+                alignment=TA_JUSTIFY,
+                spaceAfter=14,
+                leading=12,
+                leftIndent=10,
+                rightIndent=10,
+                fontName=regular
+            ),
+            "footer": ParagraphStyle(
+                'Footer',
+                parent=styles['Normal'],
+                fontSize=9,
+                textColor='#9ca3af',
+                alignment=TA_CENTER,
+                spaceBefore=20,
+                fontName=regular
+            ),
+        }
+
+    def _build_generator_styles(self) -> StyleSheet1:
+        regular, bold = self.fonts()
+        styles = getSampleStyleSheet()
+
+        # Style pour le titre principal
+        styles.add(ParagraphStyle(
+            name='CustomTitle',
+            parent=styles['Heading1'],
+            fontSize=24,
+            spaceAfter=30,
+            alignment=TA_CENTER,
+            textColor=colors.HexColor('#2563eb'),
+            fontName=bold
+        ))
+
+        # Style pour les sous-titres
+        styles.add(ParagraphStyle(
+            name='CustomHeading2',
+            parent=styles['Heading2'],
+            fontSize=16,
+            spaceAfter=12,
+            spaceBefore=20,
+            textColor=colors.HexColor('#1e40af'),
+            fontName=bold
+        ))
+
+        # Style pour le texte normal
+        styles.add(ParagraphStyle(
+            name='CustomBody',
+            parent=styles['Normal'],
+            fontSize=11,
+            spaceAfter=6,
+            alignment=TA_JUSTIFY,
+            fontName=regular
+        ))
+
+        # Style pour les listes à puces
+        styles.add(ParagraphStyle(
+            name='CustomBullet',
+            parent=styles['Normal'],
+            fontSize=11,
+            spaceAfter=4,
+            leftIndent=20,
+            bulletIndent=10,
+            fontName=regular
+        ))
+
+        # Style pour les métadonnées
+        styles.add(ParagraphStyle(
+            name='CustomMeta',
+            parent=styles['Normal'],
+            fontSize=9,
+            spaceAfter=4,
+            textColor=colors.HexColor('#6b7280'),
+            fontName=regular
+        ))
+        return styles
+
+
+# Instance globale
+pdf_templates = PDFTemplates()
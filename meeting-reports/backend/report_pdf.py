@@ -0,0 +1,175 @@
+"""
+Rendu PDF des comptes rendus de réunion (mise en page de l'API principale)
+"""
+
+import logging
+from datetime import datetime
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak
+
+from pdf_templates import pdf_templates
+
+logger = logging.getLogger(__name__)
+
+# Champs du rapport qui apparaissent dans le PDF (empreinte du cache)
+PDF_FIELDS = ("filename", "created_at", "duration", "summary", "key_points",
+              "action_items", "participants", "transcript")
+
+
+def generate_pdf(report: dict, output_path: str):
+    """Generate PDF from report data"""
+    try:
+        logger.info(f"Generating PDF for report: {output_path}")
+        # Create PDF
+        doc = SimpleDocTemplate(output_path, pagesize=A4)
+        # Styles préparés une fois par processus
+        styles = pdf_templates.report_styles()
+        
+        # Story to build the PDF
+        story = []
+        
+        # Title - Style amélioré
+        title_style = styles["title"]
+        story.append(Paragraph("Compte-rendu de Réunion", title_style))
+        story.append(Spacer(1, 0.3*inch))
+        
+        # Report info - Style amélioré avec fond
+        info_box_style = styles["info_box"]
+        story.append(Paragraph(f"<b>Fichier:</b> {report.get('filename', 'N/A')}", info_box_style))
+        story.append(Paragraph(f"<b>Date de création:</b> {report.get('created_at', 'N/A')}", info_box_style))
+        if report.get('duration'):
+            story.append(Paragraph(f"<b>Durée:</b> {report.get('duration', 'N/A')}", info_box_style))
+        story.append(Spacer(1, 0.4*inch))
+        
+        # Summary - Style amélioré
+        subtitle_style = styles["subtitle"]
+        story.append(Paragraph("📋 Résumé", subtitle_style))
+        
+        normal_style = styles["normal"]
+        
+        summary = report.get('summary', '')
+        # Handle summary - can be string or list
+        if isinstance(summary, list):
+            summary = ' '.join(str(s) for s in summary if s)
+        elif not isinstance(summary, str):
+            summary = str(summary) if summary else ''
+        
+        # Format summary as paragraphs
+        if summary:
+            # Split by periods or newlines for better paragraph breaks
+            paragraphs = summary.replace('. ', '.\n').split('\n')
+            for para in paragraphs:
+                para = para.strip()
+                if para:
+                    # Remove trailing period if followed by new paragraph
+                    if para.endswith('.') and len(para) > 1:
+                        para = para[:-1]
+                    story.append(Paragraph(para, normal_style))
+        
+        story.append(Spacer(1, 0.2*inch))
+        
+        # Key Points - Style amélioré
+        story.append(Paragraph("🔑 Points clés", subtitle_style))
+        
+        key_points = report.get('key_points', [])
+        if isinstance(key_points, str):
+            key_points = [kp.strip() for kp in key_points.split(',') if kp.strip()]
+        elif not isinstance(key_points, list):
+            key_points = [str(key_points)] if key_points else []
+        
+        # Handle list items that might be nested lists
+        key_points_flat = []
+        for point in key_points:
+            if isinstance(point, list):
+                key_points_flat.extend([str(p) for p in point if p])
+            else:
+                key_points_flat.append(str(point))
+        
+        for point in key_points_flat:
+            point = point.strip()
+            if point:
+                story.append(Paragraph(f"• {point}", normal_style))
+        
+        story.append(Spacer(1, 0.2*inch))
+        
+        # Action Items - Style amélioré
+        story.append(Paragraph("✅ Éléments d'action", subtitle_style))
+        
+        action_items = report.get('action_items', [])
+        if isinstance(action_items, str):
+            action_items = [ai.strip() for ai in action_items.split(',') if ai.strip()]
+        elif not isinstance(action_items, list):
+            action_items = [str(action_items)] if action_items else []
+        
+        # Handle list items that might be nested lists
+        action_items_flat = []
+        for item in action_items:
+            if isinstance(item, list):
+                action_items_flat.extend([str(i) for i in item if i])
+            else:
+                action_items_flat.append(str(item))
+        
+        for item in action_items_flat:
+            item = item.strip()
+            if item:
+                story.append(Paragraph(f"• {item}", normal_style))
+        
+        story.append(Spacer(1, 0.2*inch))
+        
+        # Participants - Style amélioré
+        story.append(Paragraph("👥 Participants", subtitle_style))
+        
+        participants = report.get('participants', [])
+        if isinstance(participants, str):
+            participants = [p.strip() for p in participants.split(',') if p.strip()]
+        elif not isinstance(participants, list):
+            participants = [str(participants)] if participants else []
+        
+        # Handle list items that might be nested lists
+        participants_flat = []
+        for participant in participants:
+            if isinstance(participant, list):
+                participants_flat.extend([str(p) for p in participant if p])
+            else:
+                participants_flat.append(str(participant))
+        
+        for participant in participants_flat:
+            participant = participant.strip()
+            if participant:
+                story.append(Paragraph(f"• {participant}", normal_style))
+        
+        story.append(PageBreak())
+        
+        # Full Transcript - Style amélioré
+        transcript_title_style = styles["transcript_title"]
+        story.append(Paragraph("📝 Transcription complète", transcript_title_style))
+        
+        transcript_style = styles["transcript"]
+        transcript = report.get('transcript', '')
+        # Handle transcript - can be string or list
+        if isinstance(transcript, list):
+            transcript = ' '.join(str(t) for t in transcript if t)
+        elif not isinstance(transcript, str):
+            transcript = str(transcript) if transcript else ''
+        
+        # Un paragraphe par ligne, les blocs trop longs coupés entre deux phrases
+        # (plus de Spacer entre les lignes : l'espacement est porté par le style)
+        if transcript:
+            for para in pdf_templates.transcript_paragraphs(transcript.split('\n')):
+                story.append(Paragraph(para, transcript_style))
+        
+        # Footer
+        story.append(Spacer(1, 0.3*inch))
+        footer_style = styles["footer"]
+        story.append(Paragraph("─" * 50, footer_style))
+        story.append(Paragraph("Généré par Compte rendus IA - IAHome", footer_style))
+        story.append(Paragraph(f"Document généré le {datetime.now().strftime('%d/%m/%Y à %H:%M')}", footer_style))
+        
+        # Build PDF
+        doc.build(story)
+        logger.info(f"PDF generated successfully: {output_path}")
+        return True
+    except Exception as e:
+        logger.error(f"Error generating PDF: {e}")
+        return False
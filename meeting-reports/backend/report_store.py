@@ -0,0 +1,429 @@
+"""
+Stockage des rapports et des statuts de traitement dans SQLite (mode WAL)
+"""
+
+import os
+import json
+import base64
+import sqlite3
+import threading
+import logging
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PREVIEW_LENGTH = 200
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    id TEXT PRIMARY KEY,
+    filename TEXT,
+    created_at TEXT NOT NULL,
+    summary_preview TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_reports_created_at ON reports (created_at DESC, id DESC);
+
+CREATE TABLE IF NOT EXISTS transcripts (
+    report_id TEXT PRIMARY KEY REFERENCES reports (id) ON DELETE CASCADE,
+    transcript TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS transcript_segments (
+    report_id TEXT PRIMARY KEY REFERENCES reports (id) ON DELETE CASCADE,
+    segments TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS diarizations (
+    report_id TEXT PRIMARY KEY REFERENCES reports (id) ON DELETE CASCADE,
+    created_at TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS job_status (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    progress INTEGER NOT NULL DEFAULT 0,
+    message TEXT,
+    updated_at TEXT,
+    data TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS upload_hashes (
+    file_id TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    size_bytes INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS upload_durations (
+    file_id TEXT PRIMARY KEY,
+    duration REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS audio_cache (
+    cache_key TEXT PRIMARY KEY,
+    report_id TEXT NOT NULL,
+    size_bytes INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL,
+    last_used REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_audio_cache_last_used ON audio_cache (last_used);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def _summary_preview(summary: Any) -> str:
+    if isinstance(summary, list):
+        summary = " ".join(str(s) for s in summary if s)
+    elif not isinstance(summary, str):
+        summary = str(summary) if summary else ""
+    if len(summary) > SUMMARY_PREVIEW_LENGTH:
+        return summary[:SUMMARY_PREVIEW_LENGTH] + "..."
+    return summary
+
+
+def _encode_cursor(created_at: str, report_id: str) -> str:
+    return base64.urlsafe_b64encode(f"{created_at}|{report_id}".encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        created_at, report_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|", 1)
+    except Exception:
+        raise ValueError("Invalid cursor")
+    return created_at, report_id
+
+
+class ReportStore:
+    """
+    Rapports de réunion et statuts de traitement dans une base SQLite.
+
+    La liste des rapports ne lit que la table `reports` (métadonnées + aperçu du
+    résumé, indexée sur created_at) ; les transcriptions, volumineuses, sont dans
+    une table séparée et ne sont lues que pour un rapport précis.
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = Path(db_path or os.getenv("REPORTS_DB", "reports/reports.db"))
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.db_path), timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    conn.executescript(_SCHEMA)
+                    self._initialized = True
+        return conn
+
+    # --- Rapports ---
+
+    def save_report(self, report: Dict[str, Any]):
+        """
+        Enregistre (ou remplace) un rapport et sa transcription
+
+        Les segments horodatés (clé "segments") sont stockés à part ; les
+        remplacer invalide la diarisation en cache.
+        """
+        data = dict(report)
+        transcript = data.pop("transcript", "") or ""
+        segments = data.pop("segments", None)
+        if not isinstance(transcript, str):
+            transcript = json.dumps(transcript, ensure_ascii=False)
+        conn = self._connection()
+        with conn:
+            # Upsert plutôt que REPLACE : un REPLACE supprimerait en cascade segments et diarisation
+            conn.execute(
+                "INSERT INTO reports (id, filename, created_at, summary_preview, data) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET filename = excluded.filename, created_at = excluded.created_at, "
+                "summary_preview = excluded.summary_preview, data = excluded.data",
+                (
+                    data["id"],
+                    data.get("filename"),
+                    str(data.get("created_at") or ""),
+                    _summary_preview(data.get("summary", "")),
+                    json.dumps(data, ensure_ascii=False, default=str),
+                ),
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO transcripts (report_id, transcript) VALUES (?, ?)",
+                (data["id"], transcript),
+            )
+            if segments is not None:
+                conn.execute(
+                    "INSERT OR REPLACE INTO transcript_segments (report_id, segments) VALUES (?, ?)",
+                    (data["id"], json.dumps(segments, ensure_ascii=False)),
+                )
+                conn.execute("DELETE FROM diarizations WHERE report_id = ?", (data["id"],))
+
+    def get_report(self, report_id: str, include_transcript: bool = True) -> Optional[Dict[str, Any]]:
+        conn = self._connection()
+        row = conn.execute("SELECT data FROM reports WHERE id = ?", (report_id,)).fetchone()
+        if row is None:
+            return None
+        report = json.loads(row["data"])
+        if include_transcript:
+            report["transcript"] = self.get_transcript(report_id) or ""
+        return report
+
+    def get_transcript(self, report_id: str) -> Optional[str]:
+        row = self._connection().execute(
+            "SELECT transcript FROM transcripts WHERE report_id = ?", (report_id,)
+        ).fetchone()
+        return row["transcript"] if row else None
+
+    def get_segments(self, report_id: str) -> Optional[List[Dict[str, Any]]]:
+        """Segments Whisper horodatés d'un rapport (None pour les rapports antérieurs)"""
+        row = self._connection().execute(
+            "SELECT segments FROM transcript_segments WHERE report_id = ?", (report_id,)
+        ).fetchone()
+        return json.loads(row["segments"]) if row else None
+
+    def save_diarization(self, report_id: str, diarization: Dict[str, Any]):
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO diarizations (report_id, created_at, data) VALUES (?, datetime('now'), ?)",
+                (report_id, json.dumps(diarization, ensure_ascii=False, default=str)),
+            )
+
+    def get_diarization(self, report_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connection().execute(
+            "SELECT data FROM diarizations WHERE report_id = ?", (report_id,)
+        ).fetchone()
+        return json.loads(row["data"]) if row else None
+
+    def list_reports(self, limit: Optional[int] = None,
+                     cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Liste les rapports du plus récent au plus ancien
+
+        Args:
+            limit: Nombre maximum de rapports (None = tous)
+            cursor: Curseur renvoyé par l'appel précédent
+
+        Returns:
+            (rapports, curseur de la page suivante ou None)
+        """
+        query = "SELECT id, filename, created_at, summary_preview FROM reports"
+        params: List[Any] = []
+        if cursor:
+            created_at, report_id = _decode_cursor(cursor)
+            query += " WHERE created_at < ? OR (created_at = ? AND id < ?)"
+            params += [created_at, created_at, report_id]
+        query += " ORDER BY created_at DESC, id DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit + 1)
+
+        rows = self._connection().execute(query, params).fetchall()
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = _encode_cursor(rows[-1]["created_at"], rows[-1]["id"])
+
+        reports = [
+            {
+                "id": row["id"],
+                "filename": row["filename"],
+                "created_at": row["created_at"],
+                "summary": row["summary_preview"],
+            }
+            for row in rows
+        ]
+        return reports, next_cursor
+
+    def delete_report(self, report_id: str) -> bool:
+        conn = self._connection()
+        with conn:
+            deleted = conn.execute("DELETE FROM reports WHERE id = ?", (report_id,)).rowcount
+            conn.execute("DELETE FROM job_status WHERE id = ?", (report_id,))
+            conn.execute("DELETE FROM upload_hashes WHERE file_id = ?", (report_id,))
+            conn.execute("DELETE FROM upload_durations WHERE file_id = ?", (report_id,))
+            conn.execute("DELETE FROM audio_cache WHERE report_id = ?", (report_id,))
+        return deleted > 0
+
+    def clear(self) -> int:
+        """Supprime tous les rapports et statuts, renvoie le nombre de rapports supprimés"""
+        conn = self._connection()
+        with conn:
+            deleted = conn.execute("DELETE FROM reports").rowcount
+            conn.execute("DELETE FROM job_status")
+            conn.execute("DELETE FROM upload_hashes")
+            conn.execute("DELETE FROM upload_durations")
+            conn.execute("DELETE FROM audio_cache")
+        return deleted
+
+    # --- Statuts de traitement ---
+
+    def save_status(self, status: Dict[str, Any]):
+        self.save_statuses([status])
+
+    def save_statuses(self, statuses: List[Dict[str, Any]]):
+        """Enregistre plusieurs statuts dans une seule transaction"""
+        if not statuses:
+            return
+        conn = self._connection()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO job_status (id, status, progress, message, updated_at, data) VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        status["id"],
+                        status["status"],
+                        int(status.get("progress", 0)),
+                        status.get("message"),
+                        status.get("updated_at"),
+                        json.dumps(status, ensure_ascii=False, default=str),
+                    )
+                    for status in statuses
+                ],
+            )
+
+    def get_status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connection().execute("SELECT data FROM job_status WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row["data"]) if row else None
+
+    def list_statuses(self, statuses: Sequence[str]) -> List[Dict[str, Any]]:
+        """Statuts des jobs dont l'état fait partie de `statuses`"""
+        placeholders = ",".join("?" * len(statuses))
+        rows = self._connection().execute(
+            f"SELECT data FROM job_status WHERE status IN ({placeholders})", list(statuses)
+        ).fetchall()
+        return [json.loads(row["data"]) for row in rows]
+
+    # --- Empreintes des uploads et cache de déduplication ---
+
+    def save_upload_hash(self, file_id: str, sha256: str, size_bytes: int):
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO upload_hashes (file_id, sha256, size_bytes) VALUES (?, ?, ?)",
+                (file_id, sha256, size_bytes),
+            )
+
+    def save_upload_duration(self, file_id: str, duration: float):
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO upload_durations (file_id, duration) VALUES (?, ?)", (file_id, duration)
+            )
+
+    def get_upload_duration(self, file_id: str) -> Optional[float]:
+        row = self._connection().execute(
+            "SELECT duration FROM upload_durations WHERE file_id = ?", (file_id,)
+        ).fetchone()
+        return row["duration"] if row else None
+
+    def get_upload_hash(self, file_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connection().execute(
+            "SELECT sha256, size_bytes FROM upload_hashes WHERE file_id = ?", (file_id,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def get_cache_entry(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        row = self._connection().execute(
+            "SELECT cache_key, report_id, size_bytes, hits FROM audio_cache WHERE cache_key = ?", (cache_key,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def touch_cache_entry(self, cache_key: str, last_used: float):
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "UPDATE audio_cache SET last_used = ?, hits = hits + 1 WHERE cache_key = ?", (last_used, cache_key)
+            )
+
+    def put_cache_entry(self, cache_key: str, report_id: str, size_bytes: int, last_used: float):
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO audio_cache (cache_key, report_id, size_bytes, created_at, last_used, hits) "
+                "VALUES (?, ?, ?, datetime('now'), ?, 0)",
+                (cache_key, report_id, size_bytes, last_used),
+            )
+
+    def delete_cache_entry(self, cache_key: str):
+        conn = self._connection()
+        with conn:
+            conn.execute("DELETE FROM audio_cache WHERE cache_key = ?", (cache_key,))
+
+    def cache_totals(self) -> Tuple[int, int]:
+        """(nombre d'entrées, taille audio cumulée en octets)"""
+        row = self._connection().execute("SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM audio_cache").fetchone()
+        return row[0], row[1]
+
+    def evict_cache_lru(self, count: int) -> int:
+        """Supprime les `count` entrées les moins récemment utilisées"""
+        conn = self._connection()
+        with conn:
+            return conn.execute(
+                "DELETE FROM audio_cache WHERE cache_key IN "
+                "(SELECT cache_key FROM audio_cache ORDER BY last_used ASC LIMIT ?)",
+                (count,),
+            ).rowcount
+
+    # --- Migration ---
+
+    def migrate_json_files(self, reports_dir: Path) -> Dict[str, int]:
+        """
+        Importe une fois pour toutes les fichiers `*_report.json` et `*_status.json`
+
+        Les fichiers d'origine ne sont pas supprimés. La migration n'est exécutée
+        qu'une seule fois par base (marqueur dans la table meta).
+        """
+        conn = self._connection()
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+            return {"reports": 0, "statuses": 0}
+
+        imported_reports = 0
+        for report_file in Path(reports_dir).glob("*_report.json"):
+            try:
+                with open(report_file, "r", encoding="utf-8") as f:
+                    report = json.load(f)
+                report.setdefault("id", report_file.name[:-len("_report.json")])
+                self.save_report(report)
+                imported_reports += 1
+            except Exception as e:
+                logger.error(f"Could not import {report_file}: {e}")
+
+        statuses = []
+        for status_file in Path(reports_dir).glob("*_status.json"):
+            try:
+                with open(status_file, "r", encoding="utf-8") as f:
+                    status = json.load(f)
+                # Fichier incomplet ou corrompu : ignoré seul, la migration des autres continue
+                if not isinstance(status, dict) or not isinstance(status.get("status"), str):
+                    logger.warning(f"Skipping {status_file}: no job status in it")
+                    continue
+                status.setdefault("id", status_file.name[:-len("_status.json")])
+                status["progress"] = int(status.get("progress") or 0)
+                statuses.append(status)
+            except Exception as e:
+                logger.error(f"Could not import {status_file}: {e}")
+        self.save_statuses(statuses)
+
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('json_migrated', datetime('now'))")
+        logger.info(f"Imported {imported_reports} reports and {len(statuses)} statuses into {self.db_path}")
+        return {"reports": imported_reports, "statuses": len(statuses)}
+
+
+# Instance globale
+report_store = ReportStore()
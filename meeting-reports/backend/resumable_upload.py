@@ -0,0 +1,592 @@
+"""
+Upload reprenable par morceaux (protocole inspiré de tus) : création, PATCH à un offset, HEAD, finalisation
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import base64
+import errno
+import asyncio
+import hashlib
+import binascii
+import threading
+import logging
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterator, Optional
+
+from audio_prep import audio_preparer
+
+logger = logging.getLogger(__name__)
+
+TUS_VERSION = "1.0.0"
+
+# Formats que ffmpeg sait décoder en flux (mp4/m4a : index souvent en fin de fichier)
+STREAMABLE_EXTENSIONS = {".mp3", ".wav", ".ogg", ".oga", ".opus", ".webm", ".flac"}
+
+_UPLOAD_ID_RE = re.compile(r"^[0-9a-f-]{36}$")
+_EXTENSION_RE = re.compile(r"^\.[A-Za-z0-9]{1,8}$")
+
+
+class UploadError(Exception):
+    """Requête d'upload refusée (le code HTTP à renvoyer accompagne le message)"""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def parse_metadata(header: Optional[str]) -> Dict[str, str]:
+    """Décode l'en-tête Upload-Metadata : paires « clé valeur-base64 » séparées par des virgules"""
+    metadata: Dict[str, str] = {}
+    for pair in (header or "").split(","):
+        parts = pair.strip().split(" ")
+        if not parts[0]:
+            continue
+        try:
+            metadata[parts[0]] = base64.b64decode(parts[1]).decode("utf-8") if len(parts) > 1 else ""
+        except (binascii.Error, UnicodeDecodeError):
+            raise UploadError(400, f"Invalid Upload-Metadata value for {parts[0]}")
+    return metadata
+
+
+def parse_checksum(header: Optional[str]) -> Optional[bytes]:
+    """Décode l'en-tête Upload-Checksum (« sha256 empreinte-base64 »)"""
+    if not header:
+        return None
+    algorithm, _, value = header.strip().partition(" ")
+    if algorithm.lower() != "sha256":
+        raise UploadError(400, f"Unsupported checksum algorithm: {algorithm}")
+    try:
+        digest = base64.b64decode(value.strip(), validate=True)
+    except binascii.Error:
+        raise UploadError(400, "Invalid Upload-Checksum value")
+    if len(digest) != 32:
+        raise UploadError(400, "Invalid Upload-Checksum value")
+    return digest
+
+
+class PartialUpload:
+    __slots__ = ("upload_id", "filename", "extension", "length", "offset", "sha256", "created_at",
+                 "updated_at", "path", "hasher", "condition", "busy", "aborted", "audio_path",
+                 "decode_failures", "outcome", "settled")
+
+    def __init__(self, upload_id: str, filename: str, extension: str, length: int, path: Path,
+                 offset: int = 0, sha256: Optional[str] = None, created_at: Optional[float] = None,
+                 updated_at: Optional[float] = None):
+        self.upload_id = upload_id
+        self.filename = filename
+        self.extension = extension
+        self.length = length
+        self.offset = offset
+        self.sha256 = sha256
+        self.created_at = created_at or time.time()
+        self.updated_at = updated_at or self.created_at
+        self.path = path
+        # Empreinte des `offset` premiers octets (recalculée après un redémarrage)
+        self.hasher = hashlib.sha256() if offset == 0 else None
+        self.condition = threading.Condition()
+        self.busy = False
+        self.aborted = False
+        self.audio_path: Optional[str] = None
+        self.decode_failures = 0
+        # True une fois finalisé, False si abandonné ou rejeté (checksum)
+        self.outcome: Optional[bool] = None
+        self.settled: Optional[asyncio.Event] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.upload_id,
+            "filename": self.filename,
+            "extension": self.extension,
+            "length": self.length,
+            "offset": self.offset,
+            "sha256": self.sha256,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+
+class ResumableUploadManager:
+    """
+    Uploads reçus par morceaux et reprenables après une coupure réseau.
+
+    Le client crée l'upload (taille totale connue), envoie des PATCH à l'offset
+    courant, demande cet offset par HEAD après une coupure puis finalise.
+    Le fichier est préalloué à sa taille finale et chaque morceau y est écrit
+    à sa position (pwrite) ; l'offset n'est publié qu'une fois les octets
+    écrits. Le SHA-256 est calculé au fil des morceaux (reconstruit depuis le
+    disque après un redémarrage) et comparé à l'empreinte annoncée lors de la
+    finalisation. Pendant la réception, ffmpeg peut déjà décoder le début du
+    fichier pour les formats lisibles en flux.
+
+    L'état de chaque upload est gardé dans `{upload_id}.json` à côté du fichier
+    partiel ; les uploads abandonnés depuis `ttl` secondes sont supprimés.
+    """
+
+    def __init__(self, partial_dir: Optional[str] = None):
+        self.partial_dir = Path(partial_dir or os.getenv("UPLOAD_PARTIAL_DIR", "/app/uploads/partial"))
+        self.max_bytes = int(float(os.getenv("UPLOAD_MAX_MB", "500")) * 1024 * 1024)
+        self.ttl = float(os.getenv("UPLOAD_PARTIAL_TTL", str(24 * 3600)))
+        self.write_block = int(os.getenv("UPLOAD_WRITE_BLOCK_KB", "1024")) * 1024
+        self.early_decode = os.getenv("UPLOAD_EARLY_DECODE", "true").lower() in ("1", "true", "yes")
+        self.early_decode_max = int(os.getenv("UPLOAD_EARLY_DECODE_MAX", "4"))
+        self.early_decode_idle = float(os.getenv("UPLOAD_EARLY_DECODE_IDLE", "300"))
+        # Nouveaux essais de décodage (au PATCH suivant) après un échec
+        self.early_decode_retries = int(os.getenv("UPLOAD_EARLY_DECODE_RETRIES", "2"))
+        # Attente maximale de la finalisation par un traitement déjà commencé
+        self.finalize_timeout = float(os.getenv("UPLOAD_FINALIZE_TIMEOUT", "3600"))
+        self.expiry_interval = 600.0
+
+        self._uploads: Dict[str, PartialUpload] = {}
+        self._lock = threading.Lock()
+        self._background: set = set()
+        self._decoding = 0
+        self._last_expiry = 0.0
+
+        self.created = 0
+        self.completed = 0
+        self.interrupted = 0
+        self.checksum_failures = 0
+        self.bytes_received = 0
+        self.early_decodes = 0
+        self.early_decode_failures = 0
+
+    async def create(self, filename: str, length: int, sha256: Optional[str] = None) -> PartialUpload:
+        """
+        Crée un upload et préalloue son fichier
+
+        Args:
+            filename: Nom du fichier d'origine (pour l'extension)
+            length: Taille totale annoncée (Upload-Length)
+            sha256: Empreinte hexadécimale attendue, si le client la connaît
+
+        Returns:
+            L'upload créé (offset 0)
+        """
+        if length <= 0:
+            raise UploadError(400, "Upload-Length must be a positive integer")
+        if length > self.max_bytes:
+            raise UploadError(413, f"File too large. Maximum: {self.max_bytes / 1024 / 1024:.0f}MB")
+        if sha256 is not None and not re.match(r"^[0-9a-fA-F]{64}$", sha256):
+            raise UploadError(400, "Invalid sha256 metadata")
+        self._expire_if_due()
+
+        extension = Path(filename).suffix if filename else ""
+        if not _EXTENSION_RE.match(extension):
+            extension = ".wav"
+        upload_id = str(uuid.uuid4())
+        self.partial_dir.mkdir(parents=True, exist_ok=True)
+        upload = PartialUpload(upload_id, filename or f"{upload_id}{extension}", extension, length,
+                               self.partial_dir / f"{upload_id}{extension}",
+                               sha256=sha256.lower() if sha256 else None)
+
+        await asyncio.get_running_loop().run_in_executor(None, self._allocate, upload.path, length)
+        self._save_state(upload)
+        with self._lock:
+            self._uploads[upload_id] = upload
+        self.created += 1
+        logger.info(f"Resumable upload {upload_id} created ({length / 1024 / 1024:.1f} MB)")
+        return upload
+
+    def get(self, upload_id: str) -> PartialUpload:
+        """Upload en cours (relu depuis son fichier d'état après un redémarrage)"""
+        if not _UPLOAD_ID_RE.match(upload_id or ""):
+            raise UploadError(404, "Upload not found")
+        with self._lock:
+            upload = self._uploads.get(upload_id)
+            if upload is None:
+                upload = self._load_state(upload_id)
+                if upload is None:
+                    raise UploadError(404, "Upload not found")
+                self._uploads[upload_id] = upload
+            return upload
+
+    def exists(self, upload_id: str) -> bool:
+        try:
+            self.get(upload_id)
+            return True
+        except UploadError:
+            return False
+
+    def expires_at(self, upload: PartialUpload) -> float:
+        return upload.updated_at + self.ttl
+
+    async def write(self, upload_id: str, offset: int, chunks: AsyncIterator[bytes],
+                    checksum: Optional[bytes] = None) -> int:
+        """
+        Écrit le corps d'un PATCH à partir de `offset`
+
+        Sans empreinte de morceau, chaque bloc écrit fait avancer l'offset : une
+        coupure en cours de requête garde ce qui est arrivé. Avec `checksum`, le
+        morceau n'est retenu que s'il est complet et intact.
+
+        Args:
+            upload_id: L'ID de l'upload
+            offset: Upload-Offset annoncé par le client (doit être l'offset courant)
+            chunks: Le corps de la requête, au fil de l'eau
+            checksum: SHA-256 (brut) du morceau, si fourni par Upload-Checksum
+
+        Returns:
+            Le nouvel offset
+        """
+        upload = self.get(upload_id)
+        if upload.busy:
+            raise UploadError(423, "Another request is writing to this upload")
+        if offset != upload.offset:
+            raise UploadError(409, f"Upload-Offset mismatch: upload is at {upload.offset}")
+
+        upload.busy = True
+        loop = asyncio.get_running_loop()
+        fd = None
+        try:
+            await self._ensure_hasher(upload)
+            saved_hasher = upload.hasher.copy() if checksum else None
+            chunk_hasher = hashlib.sha256() if checksum else None
+            publish = checksum is None
+            fd = os.open(upload.path, os.O_WRONLY)
+            position = offset
+            buffer = bytearray()
+            try:
+                async for data in chunks:
+                    if position + len(buffer) + len(data) > upload.length:
+                        raise UploadError(413, "Request body goes past Upload-Length")
+                    buffer += data
+                    if len(buffer) >= self.write_block:
+                        position = await loop.run_in_executor(
+                            None, self._write_block, fd, bytes(buffer), position, upload, chunk_hasher, publish
+                        )
+                        buffer.clear()
+                if buffer:
+                    position = await loop.run_in_executor(
+                        None, self._write_block, fd, bytes(buffer), position, upload, chunk_hasher, publish
+                    )
+            except BaseException as e:
+                self.interrupted += 1
+                if checksum:
+                    upload.hasher = saved_hasher
+                elif buffer and isinstance(e, Exception) and not isinstance(e, UploadError):
+                    # Coupure réseau : les octets déjà reçus sont gardés
+                    await loop.run_in_executor(
+                        None, self._write_block, fd, bytes(buffer), position, upload, chunk_hasher, publish
+                    )
+                raise
+
+            if checksum:
+                if chunk_hasher.digest() != checksum:
+                    upload.hasher = saved_hasher
+                    self.checksum_failures += 1
+                    raise UploadError(460, "Checksum mismatch")
+                self._publish(upload, position)
+            return upload.offset
+        finally:
+            if fd is not None:
+                # Octets sur disque avant de publier l'offset dans le fichier d'état
+                await loop.run_in_executor(None, os.fdatasync, fd)
+                os.close(fd)
+                self.bytes_received += upload.offset - offset
+                upload.updated_at = time.time()
+                self._save_state(upload)
+            upload.busy = False
+
+    async def finalize(self, upload_id: str, dest_dir: Path, sha256: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Vérifie l'empreinte de l'upload complet et le publie dans `dest_dir`
+
+        Args:
+            upload_id: L'ID de l'upload
+            dest_dir: Répertoire des uploads terminés (le fichier devient {upload_id}{ext})
+            sha256: Empreinte hexadécimale attendue (sinon celle annoncée à la création)
+
+        Returns:
+            {id, filename, path, size, sha256}
+        """
+        upload = self.get(upload_id)
+        if upload.busy:
+            raise UploadError(423, "Another request is writing to this upload")
+        if upload.offset != upload.length:
+            raise UploadError(409, f"Upload incomplete: {upload.offset} of {upload.length} bytes received")
+
+        upload.busy = True
+        try:
+            await self._ensure_hasher(upload)
+            digest = upload.hasher.hexdigest()
+            expected = (sha256 or upload.sha256 or "").lower()
+            if expected and expected != digest:
+                self.checksum_failures += 1
+                logger.warning(f"Upload {upload_id} rejected: SHA-256 {digest} instead of {expected}")
+                self._remove(upload)
+                raise UploadError(460, "Checksum mismatch, the upload has been discarded")
+
+            dest_path = Path(dest_dir) / f"{upload_id}{upload.extension}"
+            with upload.condition:
+                os.replace(upload.path, dest_path)
+                upload.path = dest_path
+            self._state_path(upload_id).unlink(missing_ok=True)
+            with self._lock:
+                self._uploads.pop(upload_id, None)
+            self._settle(upload, True)
+        finally:
+            upload.busy = False
+
+        self.completed += 1
+        logger.info(f"Resumable upload {upload_id} finalized: {upload.length} bytes, sha256 {digest[:12]}")
+        return {
+            "id": upload_id,
+            "filename": dest_path.name,
+            "path": dest_path,
+            "size": upload.length,
+            "sha256": digest,
+        }
+
+    def abort(self, upload_id: str):
+        """Supprime un upload en cours (et l'audio déjà décodé)"""
+        upload = self.get(upload_id)
+        if upload.busy:
+            raise UploadError(423, "Another request is writing to this upload")
+        self._remove(upload)
+
+    async def wait_finalized(self, upload: PartialUpload) -> bool:
+        """
+        Attend la fin d'un upload dont le traitement a commencé avant sa finalisation
+
+        Returns:
+            True si l'upload a été finalisé (empreinte vérifiée), False s'il a été
+            abandonné, rejeté, a expiré ou n'est pas finalisé après `finalize_timeout`
+        """
+        if upload.outcome is None:
+            if upload.settled is None:
+                upload.settled = asyncio.Event()
+            try:
+                await asyncio.wait_for(upload.settled.wait(), self.finalize_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Upload {upload.upload_id} not finalized after {self.finalize_timeout:.0f}s")
+                return False
+        return bool(upload.outcome)
+
+    def decode_while_uploading(self, upload_id: str, audio_path: str) -> bool:
+        """
+        Lance le décodage ffmpeg de l'upload pendant sa réception
+
+        L'artefact PCM est écrit à côté de `audio_path` (chemin final de l'upload) :
+        le traitement le réutilise au lieu de décoder après la finalisation. En cas
+        d'échec (format non lisible en flux, coupure trop longue), un PATCH suivant
+        peut le relancer (`early_decode_retries` fois) ; sinon le décodage aura lieu
+        normalement au moment du traitement.
+
+        Returns:
+            True si le décodage a été lancé
+        """
+        upload = self.get(upload_id)
+        if not self.early_decode or upload.extension.lower() not in STREAMABLE_EXTENSIONS:
+            return False
+        with self._lock:
+            if (self._decoding >= self.early_decode_max or upload.audio_path is not None
+                    or upload.decode_failures > self.early_decode_retries):
+                return False
+            upload.audio_path = audio_path
+            self._decoding += 1
+        future = asyncio.get_running_loop().run_in_executor(None, self._decode_stream, upload, audio_path)
+        self._background.add(future)
+        future.add_done_callback(self._background.discard)
+        return True
+
+    def iter_bytes(self, upload: PartialUpload, block_size: int = 1 << 20) -> Iterator[bytes]:
+        """
+        Octets de l'upload dans l'ordre, au fur et à mesure de leur écriture (appel bloquant)
+
+        Raises:
+            RuntimeError: si l'upload est abandonné
+            TimeoutError: si aucun octet n'arrive pendant `early_decode_idle` secondes
+        """
+        with upload.condition:
+            fd = os.open(upload.path, os.O_RDONLY)
+        try:
+            position = 0
+            while position < upload.length:
+                with upload.condition:
+                    deadline = time.monotonic() + self.early_decode_idle
+                    while upload.offset <= position and not upload.aborted:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0 or not upload.condition.wait(remaining):
+                            raise TimeoutError(f"No data received for upload {upload.upload_id}")
+                    if upload.aborted:
+                        raise RuntimeError(f"Upload {upload.upload_id} aborted")
+                    available = upload.offset
+                while position < available:
+                    data = os.pread(fd, min(block_size, available - position), position)
+                    position += len(data)
+                    yield data
+        finally:
+            os.close(fd)
+
+    def expire_stale(self) -> int:
+        """Supprime les uploads sans nouvel octet depuis `ttl` secondes"""
+        self._last_expiry = time.time()
+        if not self.partial_dir.exists():
+            return 0
+        cutoff = time.time() - self.ttl
+        expired = 0
+        for state_file in self.partial_dir.glob("*.json"):
+            try:
+                upload = self.get(state_file.stem)
+            except UploadError:
+                state_file.unlink(missing_ok=True)
+                continue
+            if upload.updated_at < cutoff and not upload.busy:
+                self._remove(upload)
+                expired += 1
+        if expired:
+            logger.info(f"Resumable uploads: expired {expired} abandoned uploads")
+        return expired
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            active = len(self._uploads)
+        return {
+            "active": active,
+            "created": self.created,
+            "completed": self.completed,
+            "interrupted_requests": self.interrupted,
+            "checksum_failures": self.checksum_failures,
+            "mb_received": round(self.bytes_received / 1024 / 1024, 1),
+            "early_decodes": self.early_decodes,
+            "early_decode_failures": self.early_decode_failures,
+            "decoding": self._decoding,
+        }
+
+    @staticmethod
+    def _allocate(path: Path, length: int):
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        try:
+            # Blocs réservés dès la création : disque plein détecté avant le premier octet
+            if hasattr(os, "posix_fallocate"):
+                try:
+                    os.posix_fallocate(fd, 0, length)
+                except OSError as e:
+                    if e.errno == errno.ENOSPC:
+                        raise UploadError(507, "Not enough disk space for this upload")
+                    os.ftruncate(fd, length)
+            else:
+                os.ftruncate(fd, length)
+        except BaseException:
+            os.close(fd)
+            path.unlink(missing_ok=True)
+            raise
+        os.close(fd)
+
+    def _write_block(self, fd: int, data: bytes, position: int, upload: PartialUpload,
+                     chunk_hasher: Optional["hashlib._Hash"], publish: bool) -> int:
+        view = memoryview(data)
+        written = 0
+        while written < len(data):
+            written += os.pwrite(fd, view[written:], position + written)
+        upload.hasher.update(data)
+        if chunk_hasher is not None:
+            chunk_hasher.update(data)
+        position += len(data)
+        if publish:
+            self._publish(upload, position)
+        return position
+
+    @staticmethod
+    def _publish(upload: PartialUpload, offset: int):
+        with upload.condition:
+            upload.offset = offset
+            upload.condition.notify_all()
+
+    async def _ensure_hasher(self, upload: PartialUpload):
+        if upload.hasher is not None:
+            return
+
+        def rehash():
+            hasher = hashlib.sha256()
+            with open(upload.path, "rb") as f:
+                remaining = upload.offset
+                while remaining > 0:
+                    block = f.read(min(1 << 20, remaining))
+                    if not block:
+                        break
+                    hasher.update(block)
+                    remaining -= len(block)
+            return hasher
+
+        upload.hasher = await asyncio.get_running_loop().run_in_executor(None, rehash)
+
+    def _decode_stream(self, upload: PartialUpload, audio_path: str):
+        try:
+            audio_preparer.prepare_stream(audio_path, self.iter_bytes(upload))
+            self.early_decodes += 1
+        except Exception as e:
+            logger.warning(f"Decoding upload {upload.upload_id} while receiving it failed, "
+                           f"it will be decoded again by a later PATCH or after the upload: {e}")
+            # Libérer l'upload : sans cela un PATCH suivant ne pourrait plus relancer le décodage
+            audio_preparer.discard(audio_path)
+            with self._lock:
+                upload.audio_path = None
+                upload.decode_failures += 1
+                self.early_decode_failures += 1
+        finally:
+            with self._lock:
+                self._decoding -= 1
+            if upload.aborted:
+                audio_preparer.discard(audio_path)
+
+    def _remove(self, upload: PartialUpload):
+        with upload.condition:
+            upload.aborted = True
+            upload.condition.notify_all()
+        upload.path.unlink(missing_ok=True)
+        self._state_path(upload.upload_id).unlink(missing_ok=True)
+        if upload.audio_path:
+            audio_preparer.discard(upload.audio_path)
+        with self._lock:
+            self._uploads.pop(upload.upload_id, None)
+        self._settle(upload, False)
+
+    @staticmethod
+    def _settle(upload: PartialUpload, outcome: bool):
+        if upload.outcome is None:
+            upload.outcome = outcome
+            if upload.settled is not None:
+                upload.settled.set()
+
+    def _state_path(self, upload_id: str) -> Path:
+        return self.partial_dir / f"{upload_id}.json"
+
+    def _save_state(self, upload: PartialUpload):
+        path = self._state_path(upload.upload_id)
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(upload.to_dict(), f)
+        os.replace(tmp_path, path)
+
+    def _load_state(self, upload_id: str) -> Optional[PartialUpload]:
+        path = self._state_path(upload_id)
+        if not path.exists():
+            return None
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable upload state {path}: {e}")
+            return None
+        partial_path = self.partial_dir / f"{upload_id}{data['extension']}"
+        if not partial_path.exists():
+            return None
+        return PartialUpload(upload_id, data["filename"], data["extension"], int(data["length"]), partial_path,
+                             offset=int(data["offset"]), sha256=data.get("sha256"),
+                             created_at=data.get("created_at"), updated_at=data.get("updated_at"))
+
+    def _expire_if_due(self):
+        if time.time() - self._last_expiry >= self.expiry_interval:
+            try:
+                self.expire_stale()
+            except Exception as e:
+                logger.error(f"Error expiring resumable uploads: {e}")
+
+
+# Instance globale
+resumable_uploads = ResumableUploadManager()
@@ -0,0 +1,145 @@
+"""
+Attribution des mots transcrits aux tours de parole de la diarisation
+"""
+
+from bisect import bisect_right
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+class SpeakerTimeline:
+    """
+    Index des tours de parole pour retrouver le locuteur d'un intervalle de temps.
+
+    Les bornes de tous les tours découpent la timeline en intervalles élémentaires,
+    chacun associé aux locuteurs actifs (les tours peuvent se chevaucher). Une
+    recherche dichotomique donne l'intervalle d'un mot : l'alignement de n mots sur
+    m tours coûte O((n + m) log m) au lieu de O(n * m) pour un parcours naïf.
+    """
+
+    def __init__(self, turns: Iterable[Dict[str, Any]]):
+        events: List[Tuple[float, int, str]] = []
+        for turn in turns:
+            if turn["end"] > turn["start"]:
+                events.append((float(turn["start"]), 1, turn["speaker"]))
+                events.append((float(turn["end"]), -1, turn["speaker"]))
+        events.sort(key=lambda event: (event[0], event[1]))
+
+        self._bounds: List[float] = []
+        self._pieces: List[Tuple[str, ...]] = []
+        active: Dict[str, int] = {}
+        for index, (time, delta, speaker) in enumerate(events):
+            active[speaker] = active.get(speaker, 0) + delta
+            if active[speaker] == 0:
+                del active[speaker]
+            if index + 1 < len(events) and events[index + 1][0] == time:
+                continue
+            # Locuteurs actifs entre cette borne et la suivante
+            self._bounds.append(time)
+            self._pieces.append(tuple(sorted(active)))
+        # Le dernier élément est la borne de fin, pas un intervalle
+        self._pieces = self._pieces[:-1]
+
+        # Intervalle non vide le plus proche de chaque côté, pour les mots tombant dans un silence
+        self._prev_voiced: List[Optional[int]] = []
+        last = None
+        for index, speakers in enumerate(self._pieces):
+            if speakers:
+                last = index
+            self._prev_voiced.append(last)
+        self._next_voiced: List[Optional[int]] = [None] * len(self._pieces)
+        last = None
+        for index in range(len(self._pieces) - 1, -1, -1):
+            if self._pieces[index]:
+                last = index
+            self._next_voiced[index] = last
+
+    def __bool__(self) -> bool:
+        return any(self._pieces)
+
+    def speaker_at(self, start: float, end: float) -> Optional[str]:
+        """
+        Locuteur d'un intervalle [start, end)
+
+        Returns:
+            Le locuteur qui recouvre le plus l'intervalle, celui du tour le plus
+            proche si aucun ne le recouvre, ou None si la timeline est vide
+        """
+        if not self:
+            return None
+        bounds = self._bounds
+        overlap: Dict[str, float] = {}
+        index = max(0, bisect_right(bounds, start) - 1)
+        while index < len(self._pieces) and bounds[index] < end:
+            covered = min(end, bounds[index + 1]) - max(start, bounds[index])
+            if covered > 0:
+                for speaker in self._pieces[index]:
+                    overlap[speaker] = overlap.get(speaker, 0.0) + covered
+            index += 1
+        if overlap:
+            return max(overlap, key=overlap.get)
+        return self._nearest((start + end) / 2)
+
+    def _nearest(self, time: float) -> str:
+        index = min(max(0, bisect_right(self._bounds, time) - 1), len(self._pieces) - 1)
+        left = self._prev_voiced[index]
+        right = self._next_voiced[index]
+        if left is None:
+            return self._pieces[right][0]
+        if right is None:
+            return self._pieces[left][0]
+        left_gap = max(0.0, time - self._bounds[left + 1])
+        right_gap = max(0.0, self._bounds[right] - time)
+        return self._pieces[left][0] if left_gap <= right_gap else self._pieces[right][0]
+
+
+def words_from_segments(segments: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Mots horodatés d'une transcription Whisper
+
+    Les segments sans timestamps par mot (anciens rapports) sont traités comme un
+    seul « mot » couvrant tout le segment.
+    """
+    words = []
+    for segment in segments:
+        if segment.get("words"):
+            words.extend(segment["words"])
+        elif segment.get("text", "").strip():
+            words.append({"word": segment["text"], "start": segment["start"], "end": segment["end"]})
+    return words
+
+
+def assign_speakers(words: List[Dict[str, Any]], turns: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Attribue chaque mot à un locuteur et regroupe les mots consécutifs en répliques
+
+    Args:
+        words: Mots horodatés ({"word", "start", "end"})
+        turns: Tours de parole ({"speaker", "start", "end"})
+
+    Returns:
+        Répliques ({"speaker", "start", "end", "text", "words_count"}) dans l'ordre
+    """
+    timeline = SpeakerTimeline(turns)
+    utterances: List[Dict[str, Any]] = []
+    for word in sorted(words, key=lambda w: w["start"]):
+        text = word["word"].strip()
+        if not text:
+            continue
+        speaker = timeline.speaker_at(float(word["start"]), float(word["end"])) or "Unknown"
+        if utterances and utterances[-1]["speaker"] == speaker:
+            current = utterances[-1]
+            current["text"] += " " + text
+            current["end"] = max(current["end"], float(word["end"]))
+            current["words_count"] += 1
+        else:
+            utterances.append({
+                "speaker": speaker,
+                "start": float(word["start"]),
+                "end": float(word["end"]),
+                "text": text,
+                "words_count": 1,
+            })
+    for utterance in utterances:
+        utterance["start"] = round(utterance["start"], 2)
+        utterance["end"] = round(utterance["end"], 2)
+    return utterances
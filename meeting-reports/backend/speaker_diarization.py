@@ -9,6 +9,9 @@ from pyannote.core import Segment
 import tempfile
 import shutil
 
+from audio_prep import PreparedAudio, audio_preparer
+from speaker_alignment import assign_speakers
+
 logger = logging.getLogger(__name__)
 
 class SpeakerDiarizer:
@@ -20,10 +23,10 @@ class SpeakerDiarizer:
     def _initialize_pipeline(self):
         """Initialise le pipeline de diarisation des locuteurs"""
         try:
-            # Vérifier si un token Hugging Face est disponible
-            hf_token = os.getenv("HUGGINGFACE_TOKEN")
+            # Vérifier si un token Hugging Face est disponible (HF_TOKEN : nom standard de huggingface_hub)
+            hf_token = os.getenv("HUGGINGFACE_TOKEN") or os.getenv("HF_TOKEN")
             if not hf_token:
-                logger.warning("HUGGINGFACE_TOKEN non configuré - diarisation désactivée")
+                logger.warning("HUGGINGFACE_TOKEN / HF_TOKEN non configuré - diarisation désactivée")
                 return
             
             # Initialiser le pipeline pyannote
@@ -38,12 +41,13 @@ class SpeakerDiarizer:
             logger.error(f"Erreur lors de l'initialisation de la diarisation: {e}")
             self.enabled = False
     
-    def diarize_speakers(self, audio_path: str) -> List[Dict[str, Any]]:
+    def diarize_speakers(self, audio_path: str, audio: Optional[PreparedAudio] = None) -> List[Dict[str, Any]]:
         """
         Identifie les différents locuteurs dans un fichier audio
         
         Args:
             audio_path: Chemin vers le fichier audio
+            audio: Audio déjà décodé (par défaut, l'artefact PCM partagé de l'upload)
             
         Returns:
             Liste des segments avec identification des locuteurs
@@ -55,8 +59,11 @@ class SpeakerDiarizer:
         try:
             logger.info(f"Début de la diarisation pour: {audio_path}")
             
-            # Appliquer la diarisation
-            diarization = self.pipeline(audio_path)
+            # Appliquer la diarisation sur la forme d'onde déjà décodée (pas de second décodage)
+            if audio is None:
+                audio = audio_preparer.prepare(audio_path)
+            waveform = torch.from_numpy(audio.samples()).unsqueeze(0)
+            diarization = self.pipeline({"waveform": waveform, "sample_rate": audio.sample_rate})
             
             # Convertir les résultats en format utilisable
             speakers = []
@@ -143,10 +150,11 @@ class SpeakerDiarizer:
         if not speakers:
             return [{"text": transcript, "speaker": "Unknown", "start": 0, "end": 0}]
         
-        # Pour l'instant, une implémentation simple
-        # Dans une version plus avancée, on pourrait utiliser les word_timestamps
-        # pour une correspondance plus précise
+        # Avec les timestamps Whisper, chaque mot va au tour de parole qui le recouvre
+        if word_timestamps:
+            return assign_speakers(word_timestamps, speakers)
         
+        # Sans timestamps : répartition uniforme des mots entre les segments
         result = []
         words = transcript.split()
         words_per_speaker = len(words) // len(speakers) if speakers else 0
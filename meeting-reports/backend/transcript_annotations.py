@@ -1,16 +1,113 @@
+"""
+Annotations des transcriptions (marqueurs, surlignages, actions) dans SQLite
+"""
+
+import os
 import json
+import time
+import uuid
+import sqlite3
+import threading
 import logging
+from contextlib import contextmanager
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 from pathlib import Path
 
 logger = logging.getLogger(__name__)
 
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS annotations (
+    id TEXT PRIMARY KEY,
+    report_id TEXT NOT NULL,
+    type TEXT,
+    start_time REAL,
+    end_time REAL,
+    created_at TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_annotations_report_created ON annotations (report_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_annotations_report_type ON annotations (report_id, type, start_time);
+CREATE INDEX IF NOT EXISTS idx_annotations_report_time ON annotations (report_id, start_time, end_time);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def _time_range(annotation: Dict[str, Any]):
+    """Intervalle (début, fin) couvert par une annotation, en secondes"""
+    def as_float(value):
+        try:
+            return float(value) if value is not None else None
+        except (TypeError, ValueError):
+            return None
+
+    if annotation.get("timestamp") is not None:
+        timestamp = as_float(annotation["timestamp"])
+        return timestamp, timestamp
+    start = as_float(annotation.get("start_time"))
+    end = as_float(annotation.get("end_time"))
+    return start, end if end is not None else start
+
+
 class TranscriptAnnotations:
-    def __init__(self):
-        self.annotations_dir = Path("annotations")
-        self.annotations_dir.mkdir(exist_ok=True)
-    
+    """
+    Annotations stockées une par ligne dans une base SQLite (mode WAL).
+
+    Chaque ajout, modification ou suppression est une transaction sur une seule
+    ligne : deux éditions simultanées ne s'écrasent plus. Les colonnes
+    start_time/end_time, indexées avec report_id et type, permettent de
+    retrouver les marqueurs et surlignages d'une plage de temps.
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.annotations_dir = Path(os.getenv("ANNOTATIONS_DIR", "annotations"))
+        self.db_path = Path(db_path or os.getenv("ANNOTATIONS_DB", str(self.annotations_dir / "annotations.db")))
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            # Transactions explicites (BEGIN IMMEDIATE) pour les lectures-modifications
+            conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    conn.executescript(_SCHEMA)
+                    self._initialized = True
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @staticmethod
+    def _new_id() -> str:
+        return f"ann_{int(time.time() * 1000)}_{uuid.uuid4().hex[:6]}"
+
+    @staticmethod
+    def _row(annotation: Dict[str, Any], report_id: str):
+        start, end = _time_range(annotation)
+        return (annotation["id"], report_id, annotation.get("type"), start, end,
+                annotation["created_at"], json.dumps(annotation, ensure_ascii=False))
+
     def add_annotation(self, report_id: str, annotation: Dict[str, Any]) -> bool:
         """
         Ajoute une annotation à une transcription
@@ -23,19 +120,17 @@ class TranscriptAnnotations:
             True si l'annotation a été ajoutée avec succès
         """
         try:
-            # Charger les annotations existantes
-            annotations = self._load_annotations(report_id)
-            
             # Ajouter un ID unique et un timestamp
-            annotation_id = f"ann_{int(datetime.now().timestamp() * 1000)}"
+            annotation_id = self._new_id()
             annotation["id"] = annotation_id
             annotation["created_at"] = datetime.now().isoformat()
             
-            # Ajouter l'annotation
-            annotations.append(annotation)
-            
-            # Sauvegarder
-            self._save_annotations(report_id, annotations)
+            with self._transaction() as conn:
+                conn.execute(
+                    "INSERT INTO annotations (id, report_id, type, start_time, end_time, created_at, data) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    self._row(annotation, report_id),
+                )
             
             logger.info(f"Annotation ajoutée: {annotation_id}")
             return True
@@ -54,7 +149,28 @@ class TranscriptAnnotations:
         Returns:
             Liste des annotations
         """
-        return self._load_annotations(report_id)
+        return self._query("WHERE report_id = ? ORDER BY created_at, id", (report_id,))
+    
+    def get_annotations_in_range(self, report_id: str, start_time: float, end_time: float,
+                                 annotation_type: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Récupère les annotations qui chevauchent une plage de temps
+        
+        Args:
+            report_id: L'ID du rapport
+            start_time: Début de la plage en secondes
+            end_time: Fin de la plage en secondes
+            annotation_type: Limite à un type (highlight, timestamp_marker, ...)
+            
+        Returns:
+            Liste des annotations, triées par temps de début
+        """
+        sql = "WHERE report_id = ? AND start_time <= ? AND end_time >= ?"
+        params: List[Any] = [report_id, end_time, start_time]
+        if annotation_type:
+            sql += " AND type = ?"
+            params.append(annotation_type)
+        return self._query(sql + " ORDER BY start_time, id", params)
     
     def update_annotation(self, report_id: str, annotation_id: str, updates: Dict[str, Any]) -> bool:
         """
@@ -69,23 +185,25 @@ class TranscriptAnnotations:
             True si la mise à jour a réussi
         """
         try:
-            annotations = self._load_annotations(report_id)
-            
-            # Trouver l'annotation
-            for i, annotation in enumerate(annotations):
-                if annotation.get("id") == annotation_id:
-                    # Mettre à jour
-                    annotations[i].update(updates)
-                    annotations[i]["updated_at"] = datetime.now().isoformat()
-                    
-                    # Sauvegarder
-                    self._save_annotations(report_id, annotations)
-                    
-                    logger.info(f"Annotation mise à jour: {annotation_id}")
-                    return True
+            with self._transaction() as conn:
+                row = conn.execute(
+                    "SELECT data FROM annotations WHERE id = ? AND report_id = ?", (annotation_id, report_id)
+                ).fetchone()
+                if row is None:
+                    logger.warning(f"Annotation non trouvée: {annotation_id}")
+                    return False
+                
+                annotation = json.loads(row["data"])
+                annotation.update({key: value for key, value in updates.items() if key != "id"})
+                annotation["updated_at"] = datetime.now().isoformat()
+                _, _, annotation_type, start, end, _, data = self._row(annotation, report_id)
+                conn.execute(
+                    "UPDATE annotations SET type = ?, start_time = ?, end_time = ?, data = ? WHERE id = ?",
+                    (annotation_type, start, end, data, annotation_id),
+                )
             
-            logger.warning(f"Annotation non trouvée: {annotation_id}")
-            return False
+            logger.info(f"Annotation mise à jour: {annotation_id}")
+            return True
             
         except Exception as e:
             logger.error(f"Error updating annotation: {e}")
@@ -103,25 +221,26 @@ class TranscriptAnnotations:
             True si la suppression a réussi
         """
         try:
-            annotations = self._load_annotations(report_id)
-            
-            # Filtrer l'annotation à supprimer
-            original_count = len(annotations)
-            annotations = [ann for ann in annotations if ann.get("id") != annotation_id]
+            with self._transaction() as conn:
+                deleted = conn.execute(
+                    "DELETE FROM annotations WHERE id = ? AND report_id = ?", (annotation_id, report_id)
+                ).rowcount
             
-            if len(annotations) < original_count:
-                # Sauvegarder
-                self._save_annotations(report_id, annotations)
+            if deleted:
                 logger.info(f"Annotation supprimée: {annotation_id}")
                 return True
-            else:
-                logger.warning(f"Annotation non trouvée: {annotation_id}")
-                return False
+            logger.warning(f"Annotation non trouvée: {annotation_id}")
+            return False
                 
         except Exception as e:
             logger.error(f"Error deleting annotation: {e}")
             return False
     
+    def delete_report_annotations(self, report_id: str) -> int:
+        """Supprime toutes les annotations d'un rapport"""
+        with self._transaction() as conn:
+            return conn.execute("DELETE FROM annotations WHERE report_id = ?", (report_id,)).rowcount
+    
     def create_timestamp_marker(self, report_id: str, timestamp: float, text: str, 
                               marker_type: str = "note") -> bool:
         """
@@ -210,34 +329,66 @@ class TranscriptAnnotations:
         Returns:
             Liste des annotations du type spécifié
         """
-        annotations = self._load_annotations(report_id)
-        return [ann for ann in annotations if ann.get("type") == annotation_type]
+        return self._query("WHERE report_id = ? AND type = ? ORDER BY created_at, id", (report_id, annotation_type))
     
-    def _load_annotations(self, report_id: str) -> List[Dict[str, Any]]:
-        """Charge les annotations d'un rapport"""
+    def import_json_files(self, annotations_dir: Optional[Path] = None) -> int:
+        """
+        Importe une fois pour toutes les fichiers `{report_id}_annotations.json`
+        
+        Chaque fichier est importé dans une seule transaction. Les fichiers
+        d'origine ne sont pas supprimés ; l'import n'est exécuté qu'une fois par
+        base (marqueur dans la table meta).
+        
+        Returns:
+            Le nombre d'annotations importées
+        """
+        conn = self._connection()
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'json_imported'").fetchone():
+            return 0
+        
+        imported = 0
+        for annotation_file in Path(annotations_dir or self.annotations_dir).glob("*_annotations.json"):
+            report_id = annotation_file.name[:-len("_annotations.json")]
+            try:
+                with open(annotation_file, "r", encoding="utf-8") as f:
+                    annotations = json.load(f)
+                with self._transaction() as conn:
+                    rows = []
+                    seen = set()
+                    for annotation in annotations:
+                        # Identifiants à la milliseconde : doublons possibles dans un fichier,
+                        # ou d'un rapport à l'autre (la clé est globale)
+                        annotation_id = annotation.get("id")
+                        if (not annotation_id or annotation_id in seen or conn.execute(
+                                "SELECT 1 FROM annotations WHERE id = ?", (annotation_id,)).fetchone()):
+                            annotation["id"] = self._new_id()
+                        seen.add(annotation["id"])
+                        annotation.setdefault("created_at", datetime.now().isoformat())
+                        rows.append(self._row(annotation, report_id))
+                    cursor = conn.executemany(
+                        "INSERT OR IGNORE INTO annotations (id, report_id, type, start_time, end_time, created_at, data) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        rows,
+                    )
+                    inserted = max(0, cursor.rowcount) if rows else 0
+                if inserted < len(rows):
+                    logger.warning(f"{len(rows) - inserted} annotations of {annotation_file} were not imported")
+                imported += inserted
+            except Exception as e:
+                logger.error(f"Could not import {annotation_file}: {e}")
+        
+        with self._transaction() as conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('json_imported', datetime('now'))")
+        logger.info(f"Imported {imported} annotations into {self.db_path}")
+        return imported
+    
+    def _query(self, where: str, params) -> List[Dict[str, Any]]:
         try:
-            annotation_file = self.annotations_dir / f"{report_id}_annotations.json"
-            
-            if not annotation_file.exists():
-                return []
-            
-            with open(annotation_file, "r", encoding="utf-8") as f:
-                return json.load(f)
-                
+            rows = self._connection().execute(f"SELECT data FROM annotations {where}", params).fetchall()
+            return [json.loads(row["data"]) for row in rows]
         except Exception as e:
             logger.error(f"Error loading annotations: {e}")
             return []
-    
-    def _save_annotations(self, report_id: str, annotations: List[Dict[str, Any]]):
-        """Sauvegarde les annotations d'un rapport"""
-        try:
-            annotation_file = self.annotations_dir / f"{report_id}_annotations.json"
-            
-            with open(annotation_file, "w", encoding="utf-8") as f:
-                json.dump(annotations, f, indent=2, ensure_ascii=False)
-                
-        except Exception as e:
-            logger.error(f"Error saving annotations: {e}")
 
 # Instance globale
 transcript_annotations = TranscriptAnnotations()
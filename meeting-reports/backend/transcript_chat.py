@@ -1,15 +1,35 @@
 import os
-import json
+import time
+import asyncio
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, AsyncIterator, Optional
 from datetime import datetime
-from openai import OpenAI
 from dotenv import load_dotenv
 
+from openai_client import openai_client
+from chat_session_store import ChatSession, chat_sessions
+from transcript_index import transcript_indexes
+
 load_dotenv("config.env")
 
 logger = logging.getLogger(__name__)
 
+RETRIEVAL_SYSTEM_PROMPT = """Tu es un assistant spécialisé dans l'analyse de transcriptions de réunions.
+À chaque question, tu reçois les passages de la transcription les plus pertinents.
+Réponds uniquement à partir de ces passages, en français, et cite-les quand c'est utile.
+Si les passages ne permettent pas de répondre, dis-le."""
+
+FULL_SYSTEM_PROMPT = """Tu es un assistant spécialisé dans l'analyse de transcriptions de réunions. 
+Tu as accès à la transcription complète suivante et tu peux répondre aux questions des utilisateurs 
+sur son contenu, extraire des informations spécifiques, résumer des sections, etc.
+
+Transcription de la réunion:
+---
+{transcript}
+---
+
+Réponds en français et sois précis dans tes réponses en citant des passages spécifiques quand nécessaire."""
+
 class TranscriptChat:
     def __init__(self):
         self.api_key = os.getenv("OPENAI_API_KEY")
@@ -17,6 +37,10 @@ class TranscriptChat:
         self.max_tokens = int(os.getenv("OPENAI_MAX_TOKENS", "1000"))
         self.temperature = float(os.getenv("OPENAI_TEMPERATURE", "0.3"))
         self.enabled = self.api_key is not None and self.api_key != "your_openai_api_key_here"
+        # Mode recherche : seuls les passages pertinents et les derniers échanges sont envoyés
+        self.retrieval = os.getenv("CHAT_RETRIEVAL", "true").lower() in ("1", "true", "yes")
+        self.top_k = int(os.getenv("CHAT_TOP_K", "5"))
+        self.history_turns = int(os.getenv("CHAT_HISTORY_TURNS", "3"))
         
         if not self.enabled:
             logger.warning("OpenAI API key not configured - chat functionality disabled")
@@ -36,36 +60,16 @@ class TranscriptChat:
         """
         session_id = f"chat_{report_id}_{int(datetime.now().timestamp())}"
         
-        # Créer le contexte initial
-        context = {
-            "session_id": session_id,
-            "report_id": report_id,
-            "transcript": transcript,
-            "messages": [
-                {
-                    "role": "system",
-                    "content": f"""Tu es un assistant spécialisé dans l'analyse de transcriptions de réunions. 
-                    Tu as accès à la transcription complète suivante et tu peux répondre aux questions des utilisateurs 
-                    sur son contenu, extraire des informations spécifiques, résumer des sections, etc.
-                    
-                    Transcription de la réunion:
-                    ---
-                    {transcript}
-                    ---
-                    
-                    Réponds en français et sois précis dans tes réponses en citant des passages spécifiques quand nécessaire."""
-                }
-            ],
-            "created_at": datetime.now().isoformat(),
-            "last_activity": datetime.now().isoformat()
-        }
-        
-        # Sauvegarder la session
-        self._save_chat_session(context)
+        if self.retrieval:
+            # La transcription n'est pas dans le prompt : les passages utiles sont ajoutés à chaque question
+            session = chat_sessions.create(report_id, transcript, "retrieval", RETRIEVAL_SYSTEM_PROMPT, session_id)
+        else:
+            # Le prompt complet est reconstruit à chaque question à partir de la transcription du rapport
+            session = chat_sessions.create(report_id, transcript, "full", "", session_id)
         
-        return session_id
+        return session.session_id
     
-    def send_message(self, session_id: str, message: str) -> Dict[str, Any]:
+    async def send_message(self, session_id: str, message: str) -> Dict[str, Any]:
         """
         Envoie un message dans une session de chat
         
@@ -84,24 +88,20 @@ class TranscriptChat:
         
         try:
             # Charger la session
-            session = self._load_chat_session(session_id)
+            session = chat_sessions.get(session_id)
             if not session:
                 return {
                     "success": False,
                     "error": "Session not found"
                 }
             
-            # Ajouter le message utilisateur
-            session["messages"].append({
-                "role": "user",
-                "content": message
-            })
+            messages, sources = await self._prepare_messages(session, message)
             
-            # Appeler l'API OpenAI
-            client = OpenAI(api_key=self.api_key)
-            response = client.chat.completions.create(
+            # Appeler l'API OpenAI (client partagé, connexions réutilisées)
+            response = await openai_client.chat_completion(
+                "chat",
                 model=self.model,
-                messages=session["messages"],
+                messages=messages,
                 max_tokens=self.max_tokens,
                 temperature=self.temperature
             )
@@ -109,23 +109,17 @@ class TranscriptChat:
             # Extraire la réponse
             ai_response = response.choices[0].message.content
             
-            # Ajouter la réponse de l'IA
-            session["messages"].append({
-                "role": "assistant",
-                "content": ai_response
-            })
-            
-            # Mettre à jour la dernière activité
-            session["last_activity"] = datetime.now().isoformat()
+            # Ajouter l'échange à la session et la sauvegarder
+            await self._record_exchange(session, message, ai_response)
             
-            # Sauvegarder la session mise à jour
-            self._save_chat_session(session)
-            
-            return {
+            result = {
                 "success": True,
                 "response": ai_response,
                 "session_id": session_id
             }
+            if sources:
+                result["sources"] = self._format_sources(sources)
+            return result
             
         except Exception as e:
             logger.error(f"Error in chat: {e}")
@@ -134,6 +128,110 @@ class TranscriptChat:
                 "error": str(e)
             }
     
+    async def stream_message(self, session_id: str, message: str) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Envoie un message et relaie la réponse token par token
+        
+        La session n'est sauvegardée qu'une fois la réponse complète : un client
+        qui se déconnecte en cours de route ne laisse pas de réponse tronquée.
+        
+        Args:
+            session_id: L'ID de la session
+            message: Le message de l'utilisateur
+            
+        Yields:
+            Les événements {"event", "data"} : sources, token, done ou error
+        """
+        if not self.enabled:
+            yield {"event": "error", "data": {"error": "Chat functionality not available - OpenAI API key not configured"}}
+            return
+        
+        session = chat_sessions.get(session_id)
+        if not session:
+            yield {"event": "error", "data": {"error": "Session not found"}}
+            return
+        
+        started = time.perf_counter()
+        first_token_at = None
+        parts: List[str] = []
+        try:
+            messages, sources = await self._prepare_messages(session, message)
+            if sources:
+                yield {"event": "sources", "data": {"sources": self._format_sources(sources)}}
+            
+            async for text in openai_client.stream_chat_completion(
+                "chat_stream",
+                model=self.model,
+                messages=messages,
+                max_tokens=self.max_tokens,
+                temperature=self.temperature
+            ):
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                parts.append(text)
+                yield {"event": "token", "data": {"text": text}}
+        except Exception as e:
+            logger.error(f"Error in chat stream: {e}")
+            yield {"event": "error", "data": {"error": str(e)}}
+            return
+        
+        ai_response = "".join(parts)
+        await self._record_exchange(session, message, ai_response)
+        total = time.perf_counter() - started
+        ttft = (first_token_at - started) if first_token_at is not None else None
+        logger.info(f"Chat stream {session_id}: first token {ttft if ttft is None else round(ttft, 3)}s, "
+                    f"total {total:.3f}s, {len(parts)} chunks")
+        yield {"event": "done", "data": {
+            "success": True,
+            "response": ai_response,
+            "session_id": session_id,
+            "ttft_seconds": round(ttft, 3) if ttft is not None else None,
+            "total_seconds": round(total, 3)
+        }}
+    
+    async def _prepare_messages(self, session: ChatSession, message: str):
+        """Messages à envoyer à l'API pour une nouvelle question, et passages retenus"""
+        if session.mode == "retrieval":
+            return await self._retrieval_messages(session, message)
+        system = {"role": "system", "content": FULL_SYSTEM_PROMPT.format(transcript=chat_sessions.transcript(session))}
+        return [system, *session.messages, {"role": "user", "content": message}], []
+    
+    async def _record_exchange(self, session: ChatSession, message: str, ai_response: str):
+        """Ajoute la question et la réponse à la fin du journal de la session (écriture hors de la boucle)"""
+        await asyncio.to_thread(chat_sessions.append, session, [
+            {"role": "user", "content": message},
+            {"role": "assistant", "content": ai_response}
+        ])
+    
+    @staticmethod
+    def _format_sources(sources: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return [{"passage": s["index"], "score": s["score"]} for s in sources]
+    
+    async def _retrieval_messages(self, session: ChatSession, message: str):
+        """
+        Construit les messages envoyés en mode recherche
+        
+        Returns:
+            (messages, passages retenus) : prompt système, passages pertinents,
+            derniers échanges et question
+        """
+        index = await transcript_indexes.get(session.report_id, chat_sessions.transcript(session))
+        passages = await transcript_indexes.search(index, message, self.top_k)
+        # Dans l'ordre de la réunion, plus lisible que l'ordre de pertinence
+        passages_text = "\n\n".join(
+            f"[Passage {p['index'] + 1}/{len(index.passages)}]\n{p['text']}"
+            for p in sorted(passages, key=lambda p: p["index"])
+        ) or "Aucun passage pertinent trouvé."
+        
+        recent = session.messages[-2 * self.history_turns:] if self.history_turns > 0 else []
+        messages = [
+            {"role": "system", "content": session.system},
+            {"role": "system", "content": f"Extraits de la transcription :\n---\n{passages_text}\n---"},
+            *recent,
+            {"role": "user", "content": message}
+        ]
+        return messages, passages
+    
     def get_chat_history(self, session_id: str) -> List[Dict[str, Any]]:
         """
         Récupère l'historique d'une session de chat
@@ -144,14 +242,14 @@ class TranscriptChat:
         Returns:
             L'historique des messages
         """
-        session = self._load_chat_session(session_id)
+        session = chat_sessions.get(session_id)
         if not session:
             return []
         
-        # Retourner seulement les messages utilisateur et assistant (pas le système)
-        return [msg for msg in session["messages"] if msg["role"] in ["user", "assistant"]]
+        # Le prompt système n'est pas stocké avec les messages
+        return list(session.messages)
     
-    def get_suggested_questions(self, transcript: str) -> List[str]:
+    async def get_suggested_questions(self, transcript: str) -> List[str]:
         """
         Génère des questions suggérées basées sur la transcription
         
@@ -170,8 +268,8 @@ class TranscriptChat:
             ]
         
         try:
-            client = OpenAI(api_key=self.api_key)
-            response = client.chat.completions.create(
+            response = await openai_client.chat_completion(
+                "chat_suggestions",
                 model=self.model,
                 messages=[
                     {
@@ -198,35 +296,6 @@ class TranscriptChat:
                 "Quelles décisions ont été prises ?",
                 "Y a-t-il des actions à suivre ?"
             ]
-    
-    def _save_chat_session(self, session: Dict[str, Any]):
-        """Sauvegarde une session de chat"""
-        try:
-            chat_dir = Path("chat_sessions")
-            chat_dir.mkdir(exist_ok=True)
-            
-            session_file = chat_dir / f"{session['session_id']}.json"
-            with open(session_file, "w", encoding="utf-8") as f:
-                json.dump(session, f, indent=2, ensure_ascii=False)
-                
-        except Exception as e:
-            logger.error(f"Error saving chat session: {e}")
-    
-    def _load_chat_session(self, session_id: str) -> Optional[Dict[str, Any]]:
-        """Charge une session de chat"""
-        try:
-            chat_dir = Path("chat_sessions")
-            session_file = chat_dir / f"{session_id}.json"
-            
-            if not session_file.exists():
-                return None
-            
-            with open(session_file, "r", encoding="utf-8") as f:
-                return json.load(f)
-                
-        except Exception as e:
-            logger.error(f"Error loading chat session: {e}")
-            return None
 
 # Instance globale
 transcript_chat = TranscriptChat()
@@ -0,0 +1,228 @@
+"""
+Index de recherche sur les transcriptions pour le chat (embeddings ou BM25)
+"""
+
+import os
+import re
+import json
+import math
+import asyncio
+import hashlib
+import logging
+from collections import Counter, OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from openai_client import openai_client
+
+logger = logging.getLogger(__name__)
+
+# Mots vides français et anglais ignorés par BM25
+_STOPWORDS = frozenset("""
+le la les un une des du de d l et ou en au aux a à ce ces cet cette se sa son ses
+que qui quoi dont où ne pas plus par pour sur dans avec sans est sont été être
+il elle ils elles on nous vous je tu me te lui leur y c s n qu j m t
+the a an of and or to in on for with is are was were be it this that
+""".split())
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    return [word for word in _WORD_RE.findall(text.lower()) if word not in _STOPWORDS]
+
+
+def chunk_transcript(transcript: str, chunk_words: int = 150, overlap_words: int = 30) -> List[str]:
+    """
+    Découpe la transcription en passages d'environ `chunk_words` mots
+
+    Les coupures se font entre phrases ; chaque passage reprend la fin du
+    précédent (`overlap_words` mots) pour ne pas couper une idée en deux.
+    """
+    sentences = [s for s in re.split(r"(?<=[.!?…])\s+", transcript.strip()) if s]
+    passages: List[str] = []
+    current: List[str] = []
+    for sentence in sentences:
+        words = sentence.split()
+        if current and len(current) + len(words) > chunk_words:
+            passages.append(" ".join(current))
+            current = current[-overlap_words:] if overlap_words else []
+        current.extend(words)
+        # Phrase interminable (transcription sans ponctuation) : coupe entre mots
+        while len(current) > chunk_words * 2:
+            passages.append(" ".join(current[:chunk_words]))
+            current = current[chunk_words - overlap_words:]
+    if current:
+        passages.append(" ".join(current))
+    return passages
+
+
+class TranscriptIndex:
+    """Passages d'une transcription et structure de recherche associée"""
+
+    def __init__(self, passages: List[str], embeddings: Optional[np.ndarray] = None):
+        self.passages = passages
+        self.embeddings = embeddings
+        self.mode = "embeddings" if embeddings is not None else "bm25"
+        if embeddings is None:
+            self._build_bm25()
+
+    def _build_bm25(self, k1: float = 1.5, b: float = 0.75):
+        self._k1 = k1
+        self._b = b
+        self._term_freqs = [Counter(tokenize(passage)) for passage in self.passages]
+        self._lengths = [sum(tf.values()) for tf in self._term_freqs]
+        self._avg_length = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0.0
+        doc_freq: Counter = Counter()
+        for tf in self._term_freqs:
+            doc_freq.update(tf.keys())
+        n = len(self.passages)
+        self._idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in doc_freq.items()}
+
+    def bm25_scores(self, query: str) -> np.ndarray:
+        terms = tokenize(query)
+        scores = np.zeros(len(self.passages), dtype=np.float32)
+        for index, tf in enumerate(self._term_freqs):
+            norm = self._k1 * (1 - self._b + self._b * self._lengths[index] / (self._avg_length or 1))
+            score = 0.0
+            for term in terms:
+                freq = tf.get(term)
+                if freq:
+                    score += self._idf[term] * freq * (self._k1 + 1) / (freq + norm)
+            scores[index] = score
+        return scores
+
+    def top_k(self, scores: np.ndarray, k: int) -> List[Dict[str, Any]]:
+        if not len(scores):
+            return []
+        k = min(k, len(scores))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [
+            {"index": int(index), "score": round(float(scores[index]), 4), "text": self.passages[index]}
+            for index in best if scores[index] > 0
+        ]
+
+
+class TranscriptIndexCache:
+    """
+    Index de chat par rapport, construits une fois et gardés en cache.
+
+    Avec un modèle d'embeddings configuré (CHAT_EMBEDDING_MODEL), les passages sont
+    vectorisés une seule fois (matrice numpy normalisée, persistée dans
+    `chat_indexes/`) et la recherche est un produit matriciel (similarité cosinus).
+    Sans service d'embeddings, la recherche se fait par BM25, sans appel réseau.
+    """
+
+    def __init__(self):
+        self.embedding_model = os.getenv("CHAT_EMBEDDING_MODEL", "")
+        self.chunk_words = int(os.getenv("CHAT_CHUNK_WORDS", "150"))
+        self.overlap_words = int(os.getenv("CHAT_CHUNK_OVERLAP_WORDS", "30"))
+        self.max_cached = int(os.getenv("CHAT_INDEX_CACHE_SIZE", "32"))
+        self.index_dir = Path(os.getenv("CHAT_INDEX_DIR", "/app/reports/chat_indexes"))
+        self._indexes: "OrderedDict[str, TranscriptIndex]" = OrderedDict()
+        self._building: Dict[str, asyncio.Task] = {}
+        self.builds = 0
+        self.hits = 0
+
+    @property
+    def use_embeddings(self) -> bool:
+        return bool(self.embedding_model) and openai_client.enabled
+
+    async def get(self, report_id: str, transcript: str) -> TranscriptIndex:
+        """Index de la transcription d'un rapport (construit au premier appel)"""
+        digest = hashlib.sha256(transcript.encode("utf-8")).hexdigest()[:16]
+        key = f"{report_id}:{digest}"
+        index = self._indexes.get(key)
+        if index is not None:
+            self._indexes.move_to_end(key)
+            self.hits += 1
+            return index
+
+        task = self._building.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._build(report_id, digest, transcript))
+            self._building[key] = task
+            task.add_done_callback(lambda _: self._building.pop(key, None))
+        index = await asyncio.shield(task)
+
+        self._indexes[key] = index
+        self._indexes.move_to_end(key)
+        while len(self._indexes) > self.max_cached:
+            self._indexes.popitem(last=False)
+        return index
+
+    async def search(self, index: TranscriptIndex, query: str, k: int) -> List[Dict[str, Any]]:
+        """Les `k` passages les plus pertinents pour une question"""
+        if index.mode == "embeddings":
+            query_vector = (await self._embed([query]))[0]
+            return index.top_k(index.embeddings @ query_vector, k)
+        return index.top_k(index.bm25_scores(query), k)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": "embeddings" if self.use_embeddings else "bm25",
+            "cached_indexes": len(self._indexes),
+            "builds": self.builds,
+            "hits": self.hits,
+        }
+
+    async def _build(self, report_id: str, digest: str, transcript: str) -> TranscriptIndex:
+        passages = chunk_transcript(transcript, self.chunk_words, self.overlap_words)
+        self.builds += 1
+        if not self.use_embeddings:
+            return TranscriptIndex(passages)
+
+        path = self.index_dir / f"{report_id}.npz"
+        cached = self._load(path, digest)
+        if cached is not None:
+            return cached
+        try:
+            embeddings = await self._embed(passages)
+        except Exception as e:
+            logger.warning(f"Embedding failed for {report_id}, falling back to BM25: {e}")
+            return TranscriptIndex(passages)
+        index = TranscriptIndex(passages, embeddings)
+        self._save(path, digest, index)
+        logger.info(f"Chat index built for {report_id}: {len(passages)} passages")
+        return index
+
+    async def _embed(self, texts: List[str], batch_size: int = 96) -> np.ndarray:
+        vectors = []
+        for start in range(0, len(texts), batch_size):
+            response = await openai_client.embeddings(
+                "chat_embeddings", model=self.embedding_model, input=texts[start:start + batch_size]
+            )
+            vectors.extend(item.embedding for item in response.data)
+        matrix = np.asarray(vectors, dtype=np.float32)
+        # Vecteurs normalisés : le produit scalaire est la similarité cosinus
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-12)
+
+    def _load(self, path: Path, digest: str) -> Optional[TranscriptIndex]:
+        if not path.exists():
+            return None
+        try:
+            with np.load(path) as data:
+                meta = json.loads(str(data["meta"]))
+                if meta["digest"] != digest or meta["model"] != self.embedding_model:
+                    return None
+                return TranscriptIndex(meta["passages"], data["embeddings"])
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable chat index {path}: {e}")
+            return None
+
+    def _save(self, path: Path, digest: str, index: TranscriptIndex):
+        try:
+            self.index_dir.mkdir(parents=True, exist_ok=True)
+            meta = json.dumps({"digest": digest, "model": self.embedding_model, "passages": index.passages},
+                              ensure_ascii=False)
+            np.savez(path, embeddings=index.embeddings, meta=np.array(meta))
+        except Exception as e:
+            logger.error(f"Error saving chat index {path}: {e}")
+
+
+# Instance globale
+transcript_indexes = TranscriptIndexCache()
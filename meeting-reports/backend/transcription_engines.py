@@ -0,0 +1,383 @@
+"""
+Moteurs de transcription interchangeables : openai-whisper, faster-whisper (int8 sur CPU), API OpenAI
+"""
+
+import io
+import os
+import importlib
+import time
+import wave
+import logging
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+
+from audio_chunking import SAMPLE_RATE
+
+logger = logging.getLogger(__name__)
+
+AudioInput = Union[str, np.ndarray]
+
+
+def _word(word: str, start: float, end: float, probability: Optional[float] = None) -> Dict[str, Any]:
+    item = {"word": word, "start": float(start), "end": float(end)}
+    if probability is not None:
+        item["probability"] = float(probability)
+    return item
+
+
+def _segment(index: int, start: float, end: float, text: str,
+             words: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    segment = {"id": index, "start": float(start), "end": float(end), "text": text}
+    if words:
+        segment["words"] = words
+    return segment
+
+
+class TranscriptionEngine(ABC):
+    """
+    Interface commune des moteurs de transcription.
+
+    `load(size)` renvoie un modèle dont la méthode `transcribe(audio, language=...,
+    condition_on_previous_text=..., word_timestamps=...)` accepte un chemin de
+    fichier ou des échantillons float32 à 16 kHz, et renvoie toujours la même
+    structure : {"text", "language", "segments": [{"id", "start", "end", "text",
+    "words": [{"word", "start", "end"}]}]}. Le moteur est choisi par déploiement
+    (TRANSCRIPTION_ENGINE) ; le registre des modèles et le pool de workers n'ont
+    pas à connaître la bibliothèque utilisée.
+
+    Les moteurs `batched` offrent aussi `transcribe_batch(audios, ...)` : plusieurs
+    extraits d'au plus 30 s passent ensemble dans l'encodeur (voir transcription_pool).
+    """
+
+    name = ""
+    module = ""
+    batched = False
+
+    def check(self):
+        """Vérifie que la bibliothèque du moteur est installée (ImportError sinon)"""
+        importlib.import_module(self.module)
+
+    @abstractmethod
+    def load(self, size: str, device: str = "cpu"):
+        """Charge le modèle `size` et renvoie un objet doté de `transcribe` (voir plus haut)"""
+
+    def describe(self) -> Dict[str, Any]:
+        return {"engine": self.name}
+
+    @property
+    def cache_id(self) -> str:
+        """Moteur et options qui changent le texte produit (clé des caches de transcription)"""
+        return "/".join(str(value) for value in self.describe().values())
+
+
+class OpenAIWhisperEngine(TranscriptionEngine):
+    """openai-whisper (PyTorch, float32 sur CPU) : le moteur historique"""
+
+    name = "openai-whisper"
+    module = "whisper"
+    batched = True
+
+    def load(self, size: str, device: str = "cpu"):
+        import whisper
+
+        return _OpenAIWhisperModel(whisper.load_model(size, device=device))
+
+
+class _OpenAIWhisperModel:
+    __slots__ = ("model",)
+
+    def __init__(self, model):
+        self.model = model
+
+    def transcribe(self, audio: AudioInput, language: Optional[str] = None,
+                   condition_on_previous_text: bool = True, word_timestamps: bool = False) -> Dict[str, Any]:
+        result = self.model.transcribe(audio, language=language, word_timestamps=word_timestamps,
+                                       condition_on_previous_text=condition_on_previous_text)
+        segments = [
+            _segment(segment.get("id", index), segment["start"], segment["end"], segment["text"],
+                     [_word(w["word"], w["start"], w["end"], w.get("probability"))
+                      for w in segment.get("words") or []])
+            for index, segment in enumerate(result.get("segments", []))
+        ]
+        return {"text": result["text"], "language": result.get("language", language), "segments": segments}
+
+    def transcribe_batch(self, audios: List[np.ndarray], language: Optional[str] = None,
+                         condition_on_previous_text: bool = False,
+                         word_timestamps: bool = False) -> List[Dict[str, Any]]:
+        """
+        Transcrit plusieurs extraits d'au plus 30 s en une passe d'encodeur
+
+        Chaque extrait est complété par du silence jusqu'à la fenêtre Whisper de 30 s ;
+        le lot de spectrogrammes passe une seule fois dans l'encodeur, puis le décodage
+        glouton (température 0) avance sur tout le lot. L'alignement des mots réutilise
+        les features du lot. Un extrait dont le décodage est douteux (seuils de
+        compression et de log-probabilité de `whisper.transcribe`) est retranscrit seul,
+        avec le repli en température habituel.
+        """
+        import torch
+        import whisper
+        from whisper.audio import HOP_LENGTH, N_SAMPLES
+        from whisper.timing import add_word_timestamps
+        from whisper.tokenizer import get_tokenizer
+
+        model = self.model
+        fp16 = model.device.type != "cpu"
+        mel = torch.stack([
+            whisper.log_mel_spectrogram(
+                whisper.pad_or_trim(torch.from_numpy(np.ascontiguousarray(audio, dtype=np.float32)), N_SAMPLES),
+                model.dims.n_mels
+            )
+            for audio in audios
+        ]).to(model.device)
+        with torch.no_grad():
+            features = model.embed_audio(mel.half() if fp16 else mel)
+        # Des features (et non un spectrogramme) : decode() saute l'encodeur
+        decoded = whisper.decode(model, features, whisper.DecodingOptions(
+            task="transcribe", language=language, temperature=0.0, fp16=fp16
+        ))
+
+        results = []
+        for index, (audio, decoding) in enumerate(zip(audios, decoded)):
+            duration = len(audio) / SAMPLE_RATE
+            if decoding.no_speech_prob > 0.6 and decoding.avg_logprob < -1.0:
+                results.append({"text": "", "language": decoding.language, "segments": []})
+                continue
+            if decoding.compression_ratio > 2.4 or decoding.avg_logprob < -1.0:
+                results.append(self.transcribe(audio, language=language, word_timestamps=word_timestamps,
+                                               condition_on_previous_text=condition_on_previous_text))
+                continue
+
+            tokenizer = get_tokenizer(model.is_multilingual, num_languages=model.num_languages,
+                                      language=decoding.language, task="transcribe")
+            raw_segments = _timestamped_segments(decoding.tokens, tokenizer, duration)
+            if word_timestamps and raw_segments:
+                add_word_timestamps(segments=raw_segments, model=_EncodedAudio(model, features[index:index + 1]),
+                                    tokenizer=tokenizer, mel=mel[index], num_frames=len(audio) // HOP_LENGTH,
+                                    last_speech_timestamp=0.0)
+            segments = [
+                _segment(number, segment["start"], segment["end"], segment["text"],
+                         [_word(w["word"], w["start"], w["end"], w.get("probability"))
+                          for w in segment.get("words") or []])
+                for number, segment in enumerate(raw_segments)
+            ]
+            results.append({"text": "".join(segment["text"] for segment in segments),
+                            "language": decoding.language, "segments": segments})
+        return results
+
+
+def _timestamped_segments(tokens: List[int], tokenizer, duration: float) -> List[Dict[str, Any]]:
+    """Segments délimités par les jetons d'horodatage de Whisper (<|0.00|> texte <|2.40|>)"""
+    segments = []
+    start = None
+    text_tokens: List[int] = []
+
+    def close(end: float):
+        segments.append({"seek": 0, "start": start or 0.0, "end": min(end, duration),
+                         "text": tokenizer.decode(text_tokens), "tokens": list(text_tokens)})
+
+    for token in tokens:
+        if token >= tokenizer.timestamp_begin:
+            # Un horodatage toutes les 20 ms
+            timestamp = (token - tokenizer.timestamp_begin) * 0.02
+            if text_tokens:
+                close(timestamp)
+                text_tokens = []
+                start = None
+            else:
+                start = timestamp
+        elif token < tokenizer.eot:
+            text_tokens.append(token)
+    if text_tokens:
+        close(duration)
+    return segments
+
+
+class _EncodedAudio:
+    """Modèle Whisper dont l'encodeur a déjà tourné : seul le décodeur est rappelé"""
+
+    def __init__(self, model, features):
+        self._model = model
+        self._features = features
+
+    def __call__(self, mel, tokens):
+        return self._model.decoder(tokens, self._features)
+
+    def __getattr__(self, name):
+        return getattr(self._model, name)
+
+
+class FasterWhisperEngine(TranscriptionEngine):
+    """
+    faster-whisper (CTranslate2) avec poids quantifiés int8 : même modèle Whisper,
+    plusieurs fois plus rapide et moins gourmand en mémoire sur CPU.
+    """
+
+    name = "faster-whisper"
+    module = "faster_whisper"
+
+    def __init__(self):
+        self.compute_type = os.getenv("WHISPER_COMPUTE_TYPE", "int8")
+        self.beam_size = int(os.getenv("WHISPER_BEAM_SIZE", "5"))
+        self.download_root = os.getenv("WHISPER_MODELS_DIR") or None
+
+    def load(self, size: str, device: str = "cpu"):
+        from faster_whisper import WhisperModel
+
+        # Autant de threads que de cœurs attribués au worker (voir transcription_pool)
+        if hasattr(os, "sched_getaffinity"):
+            threads = len(os.sched_getaffinity(0))
+        else:
+            threads = os.cpu_count() or 1
+        model = WhisperModel(size, device=device, compute_type=self.compute_type, cpu_threads=threads,
+                             download_root=self.download_root)
+        return _FasterWhisperModel(model, self.beam_size)
+
+    def describe(self) -> Dict[str, Any]:
+        return {"engine": self.name, "compute_type": self.compute_type, "beam_size": self.beam_size}
+
+
+class _FasterWhisperModel:
+    __slots__ = ("model", "beam_size")
+
+    def __init__(self, model, beam_size: int):
+        self.model = model
+        self.beam_size = beam_size
+
+    def transcribe(self, audio: AudioInput, language: Optional[str] = None,
+                   condition_on_previous_text: bool = True, word_timestamps: bool = False) -> Dict[str, Any]:
+        if isinstance(audio, np.ndarray):
+            audio = np.ascontiguousarray(audio, dtype=np.float32)
+        raw_segments, info = self.model.transcribe(
+            audio, language=language, beam_size=self.beam_size,
+            condition_on_previous_text=condition_on_previous_text, word_timestamps=word_timestamps
+        )
+        # Générateur paresseux : le décodage a lieu pendant l'itération
+        segments = [
+            _segment(index, segment.start, segment.end, segment.text,
+                     [_word(w.word, w.start, w.end, w.probability) for w in segment.words or []])
+            for index, segment in enumerate(raw_segments)
+        ]
+        return {
+            "text": "".join(segment["text"] for segment in segments),
+            "language": info.language or language,
+            "segments": segments,
+        }
+
+
+class OpenAIAPIEngine(TranscriptionEngine):
+    """
+    API de transcription d'OpenAI : aucun modèle local, l'audio est envoyé au service.
+
+    Les fichiers de plus de OPENAI_TRANSCRIBE_MAX_MB sont refusés par l'API ; en mode
+    découpé (TRANSCRIPTION_CHUNKED), chaque fenêtre de 30 s reste bien en dessous.
+    """
+
+    name = "openai-api"
+    module = "openai"
+
+    def __init__(self):
+        self.model = os.getenv("OPENAI_TRANSCRIBE_MODEL", "whisper-1")
+        self.max_bytes = int(float(os.getenv("OPENAI_TRANSCRIBE_MAX_MB", "25")) * 1024 * 1024)
+
+    def load(self, size: str, device: str = "cpu"):
+        import openai
+
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key or api_key == "your_openai_api_key_here":
+            raise RuntimeError("OPENAI_API_KEY is required for the openai-api transcription engine")
+        # Client synchrone : appelé depuis les threads / processus du pool de transcription
+        client = openai.OpenAI(
+            api_key=api_key,
+            base_url=os.getenv("OPENAI_BASE_URL") or None,
+            timeout=float(os.getenv("OPENAI_TRANSCRIBE_TIMEOUT", "300")),
+            max_retries=int(os.getenv("OPENAI_MAX_RETRIES", "2")),
+        )
+        return _OpenAIAPIModel(client, self.model, self.max_bytes)
+
+    def describe(self) -> Dict[str, Any]:
+        return {"engine": self.name, "model": self.model}
+
+
+def wav_bytes(samples: np.ndarray, sample_rate: int = SAMPLE_RATE) -> bytes:
+    """Encode des échantillons float32 en WAV PCM 16 bits"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes((np.clip(samples, -1.0, 1.0) * 32767).astype(np.int16).tobytes())
+    return buffer.getvalue()
+
+
+def assign_words(segments: List[Dict[str, Any]], words: List[Dict[str, Any]]):
+    """Range les mots (liste globale de l'API) dans le segment qui contient leur milieu"""
+    index = 0
+    for word in words:
+        middle = (word["start"] + word["end"]) / 2
+        while index + 1 < len(segments) and middle >= segments[index + 1]["start"]:
+            index += 1
+        if segments:
+            segments[index].setdefault("words", []).append(word)
+
+
+class _OpenAIAPIModel:
+    __slots__ = ("client", "model", "max_bytes")
+
+    def __init__(self, client, model: str, max_bytes: int):
+        self.client = client
+        self.model = model
+        self.max_bytes = max_bytes
+
+    def transcribe(self, audio: AudioInput, language: Optional[str] = None,
+                   condition_on_previous_text: bool = True, word_timestamps: bool = False) -> Dict[str, Any]:
+        if isinstance(audio, np.ndarray):
+            upload = ("audio.wav", wav_bytes(audio))
+        else:
+            with open(audio, "rb") as f:
+                upload = (os.path.basename(audio), f.read())
+        if len(upload[1]) > self.max_bytes:
+            raise ValueError(f"Audio too large for the transcription API ({len(upload[1]) / 1024 / 1024:.0f} MB), "
+                             f"enable TRANSCRIPTION_CHUNKED")
+
+        started = time.perf_counter()
+        response = self.client.audio.transcriptions.create(
+            model=self.model,
+            file=upload,
+            language=language,
+            response_format="verbose_json",
+            timestamp_granularities=["segment", "word"] if word_timestamps else ["segment"],
+        )
+        data = response.model_dump() if hasattr(response, "model_dump") else dict(response)
+        segments = [
+            _segment(segment.get("id", index), segment["start"], segment["end"], segment["text"])
+            for index, segment in enumerate(data.get("segments") or [])
+        ]
+        if word_timestamps:
+            assign_words(segments, [_word(w["word"], w["start"], w["end"]) for w in data.get("words") or []])
+        logger.debug(f"Transcription API answered in {time.perf_counter() - started:.1f}s")
+        return {"text": data.get("text", ""), "language": data.get("language") or language, "segments": segments}
+
+
+ENGINES = {
+    OpenAIWhisperEngine.name: OpenAIWhisperEngine,
+    FasterWhisperEngine.name: FasterWhisperEngine,
+    OpenAIAPIEngine.name: OpenAIAPIEngine,
+}
+
+
+def create_engine(name: Optional[str] = None) -> TranscriptionEngine:
+    """
+    Moteur de transcription du déploiement
+
+    Args:
+        name: openai-whisper, faster-whisper ou openai-api (par défaut TRANSCRIPTION_ENGINE)
+
+    Returns:
+        Le moteur (les modèles sont chargés par le registre)
+    """
+    name = (name or os.getenv("TRANSCRIPTION_ENGINE", OpenAIWhisperEngine.name)).strip().lower()
+    if name not in ENGINES:
+        raise ValueError(f"Unknown transcription engine '{name}' (expected one of: {', '.join(ENGINES)})")
+    return ENGINES[name]()
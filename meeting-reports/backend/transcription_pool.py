@@ -0,0 +1,1011 @@
+"""
+Pool de workers de transcription (Whisper ne tourne jamais sur la boucle FastAPI)
+"""
+
+import os
+import time
+import asyncio
+import logging
+import multiprocessing
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from model_registry import model_registry
+from audio_chunking import SAMPLE_RATE, SilenceSplitter, split_on_silence, stitch_chunks
+from audio_prep import LiveDecode, PreparedAudio, audio_preparer
+from job_events import job_events
+
+logger = logging.getLogger(__name__)
+
+# Timestamps par mot (nécessaires pour attribuer les mots aux locuteurs)
+WORD_TIMESTAMPS = os.getenv("WHISPER_WORD_TIMESTAMPS", "true").lower() in ("1", "true", "yes")
+
+# Fenêtre d'entrée de Whisper : les extraits regroupés en lot sont complétés jusqu'à 30 s
+BATCH_WINDOW_SAMPLES = 30 * SAMPLE_RATE
+
+
+class TranscriptionQueueFull(Exception):
+    """La file d'attente de transcription est pleine"""
+
+    def __init__(self, queue_position: int, capacity: int):
+        super().__init__(f"Transcription queue is full ({capacity} jobs waiting)")
+        self.queue_position = queue_position
+        self.capacity = capacity
+
+
+class TranscriptionCancelled(Exception):
+    """Le job a été annulé avant la fin de la transcription"""
+
+
+class TranscriptionUnavailable(Exception):
+    """Le pool n'est pas démarré (Whisper indisponible au démarrage)"""
+
+
+# --- Côté worker (exécuté dans les processus du pool) ---
+
+_worker_cores: List[int] = []
+
+
+def _init_worker(core_queue, model_size: str):
+    """Épingle le worker sur ses cœurs et charge son propre modèle"""
+    global _worker_cores
+    try:
+        cores = core_queue.get_nowait()
+    except Exception:
+        cores = []
+
+    if cores and hasattr(os, "sched_setaffinity"):
+        try:
+            os.sched_setaffinity(0, cores)
+            _worker_cores = list(cores)
+        except OSError as e:
+            logger.warning(f"Could not pin transcription worker to cores {cores}: {e}")
+
+    try:
+        import torch
+        torch.set_num_threads(max(1, len(_worker_cores) or 1))
+    except Exception:
+        pass
+
+    model_registry.warm([model_size])
+
+
+def _worker_info() -> Dict[str, Any]:
+    return {"pid": os.getpid(), "cores": _worker_cores, "models": model_registry.stats()}
+
+
+def _compact_segment(segment: Dict[str, Any], offset_seconds: float = 0.0) -> Dict[str, Any]:
+    """Ne garde que les champs utiles d'un segment Whisper, avec des timestamps absolus"""
+    compact = {
+        "start": segment["start"] + offset_seconds,
+        "end": segment["end"] + offset_seconds,
+        "text": segment["text"],
+    }
+    if segment.get("words"):
+        compact["words"] = [
+            {"word": word["word"], "start": word["start"] + offset_seconds, "end": word["end"] + offset_seconds}
+            for word in segment["words"]
+        ]
+    return compact
+
+
+def _transcribe_file(file_path: str, model_size: str, language: str,
+                     pcm_path: Optional[str] = None, num_samples: int = 0) -> Dict[str, Any]:
+    """Transcrit un fichier complet avec le modèle chaud du worker"""
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    # Avec l'artefact PCM, Whisper lit l'audio déjà décodé au lieu de relancer ffmpeg
+    audio = PreparedAudio(pcm_path, num_samples, 0.0).samples() if pcm_path else file_path
+    with model_registry.acquire(model_size) as model:
+        result = model.transcribe(audio, language=language, word_timestamps=WORD_TIMESTAMPS)
+    return {
+        "text": result["text"],
+        "segments": [_compact_segment(segment) for segment in result.get("segments", [])],
+        "language": result.get("language", language),
+        "transcribe_seconds": time.perf_counter() - started,
+        "cpu_seconds": time.process_time() - cpu_started,
+        "worker": _worker_info(),
+    }
+
+
+def _transcribe_chunk(pcm_path: str, num_samples: int, start: int, end: int,
+                      model_size: str, language: str) -> Dict[str, Any]:
+    """Transcrit une fenêtre de l'artefact PCM ; les timestamps sont rendus absolus"""
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    offset_seconds = start / SAMPLE_RATE
+    # Vue memory-mappée : seul le chemin et les bornes traversent la frontière du processus
+    samples = PreparedAudio(pcm_path, num_samples, 0.0).samples(start, end)
+    with model_registry.acquire(model_size) as model:
+        # Chaque fenêtre est indépendante : pas de conditionnement sur la précédente
+        result = model.transcribe(samples, language=language, condition_on_previous_text=False,
+                                  word_timestamps=WORD_TIMESTAMPS)
+    return {
+        "segments": [_compact_segment(segment, offset_seconds) for segment in result.get("segments", [])],
+        "language": result.get("language", language),
+        "transcribe_seconds": time.perf_counter() - started,
+        "cpu_seconds": time.process_time() - cpu_started,
+        "worker": _worker_info(),
+    }
+
+
+def _transcribe_batch(items: List[Tuple[str, int, int, int]], model_size: str, language: str) -> Dict[str, Any]:
+    """
+    Transcrit en un lot des fenêtres d'au plus 30 s, éventuellement de jobs différents
+
+    Args:
+        items: (pcm_path, num_samples, start, end) pour chaque fenêtre
+        model_size: Taille du modèle
+        language: Langue forcée (commune au lot)
+
+    Returns:
+        Un résultat par fenêtre (comme `_transcribe_chunk`), temps et CPU du lot
+    """
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    audios = [PreparedAudio(pcm_path, num_samples, 0.0).samples(start, end)
+              for pcm_path, num_samples, start, end in items]
+    with model_registry.acquire(model_size) as model:
+        results = model.transcribe_batch(audios, language=language, condition_on_previous_text=False,
+                                         word_timestamps=WORD_TIMESTAMPS)
+    elapsed = time.perf_counter() - started
+    cpu_seconds = time.process_time() - cpu_started
+
+    # Temps du lot réparti au prorata de la durée de chaque fenêtre
+    total = sum(len(audio) for audio in audios) or 1
+    chunks = []
+    for (_, _, start, _), audio, result in zip(items, audios, results):
+        offset_seconds = start / SAMPLE_RATE
+        chunks.append({
+            "segments": [_compact_segment(segment, offset_seconds) for segment in result.get("segments", [])],
+            "language": result.get("language", language),
+            "transcribe_seconds": elapsed * len(audio) / total,
+            "cpu_seconds": cpu_seconds * len(audio) / total,
+        })
+    return {"chunks": chunks, "transcribe_seconds": elapsed, "cpu_seconds": cpu_seconds, "worker": _worker_info()}
+
+
+def _diarize_file(file_path: str, segments: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Diarise l'audio partagé et attribue les mots transcrits aux locuteurs"""
+    # Import tardif : pyannote n'est chargé que dans les workers qui diarisent
+    from speaker_diarization import speaker_diarizer
+    from speaker_alignment import words_from_segments
+
+    started = time.perf_counter()
+    if not speaker_diarizer.enabled:
+        return {"enabled": False, "worker": _worker_info()}
+
+    audio = audio_preparer.prepare(file_path)
+    turns = speaker_diarizer.diarize_speakers(file_path, audio)
+    words = words_from_segments(segments)
+    utterances = speaker_diarizer.merge_with_transcript("", turns, words) if turns else []
+    return {
+        "enabled": True,
+        "turns": turns,
+        "utterances": utterances,
+        "statistics": speaker_diarizer.get_speaker_statistics(turns),
+        "audio_seconds": audio.duration,
+        "diarize_seconds": time.perf_counter() - started,
+        "worker": _worker_info(),
+    }
+
+
+# --- Côté application ---
+
+def _segment_event(segment: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": segment.get("id"),
+        "start": round(float(segment["start"]), 2),
+        "end": round(float(segment["end"]), 2),
+        "text": segment["text"].strip(),
+    }
+
+
+class TranscriptionJob:
+    __slots__ = ("job_id", "file_path", "language", "model_size", "future", "started",
+                 "state", "submitted_at", "started_at", "finished_at", "cancelled",
+                 "audio", "windows", "chunk_results", "chunks_remaining", "audio_seconds",
+                 "committed_chunks", "emitted_segments", "live", "splitter", "windows_final",
+                 "user", "estimated_audio", "done_samples", "wait_ready", "generation",
+                 "awaiting_upload")
+
+    def __init__(self, job_id: str, file_path: str, language: str, model_size: str,
+                 future: "asyncio.Future", user: Optional[str] = None, estimated_audio: Optional[float] = None,
+                 wait_ready: Optional[Callable[[], Awaitable[bool]]] = None):
+        self.job_id = job_id
+        self.file_path = file_path
+        self.language = language
+        self.model_size = model_size
+        self.future = future
+        self.user = user
+        # Durée annoncée par ffprobe à l'upload (None si inconnue)
+        self.estimated_audio = estimated_audio
+        self.done_samples = 0
+        # Signalé quand un worker prend le job (ou quand il quitte la file sans démarrer)
+        self.started = asyncio.Event()
+        self.state = "queued"
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.cancelled = False
+        self.audio: Optional[PreparedAudio] = None
+        self.windows: List = []
+        self.chunk_results: List[Optional[Dict[str, Any]]] = []
+        self.chunks_remaining = 0
+        self.audio_seconds: Optional[float] = None
+        self.committed_chunks = 0
+        self.emitted_segments = 0
+        # Mode pipeline : audio décodé pendant l'upload, fenêtres ajoutées au fil de l'eau
+        self.live: Optional[LiveDecode] = None
+        self.splitter: Optional[SilenceSplitter] = None
+        self.windows_final = False
+        # Attente de la finalisation de l'upload (pipeline), pour reprendre si le décodage échoue
+        self.wait_ready = wait_ready
+        self.awaiting_upload = False
+        # Incrémenté quand les fenêtres sont abandonnées : les résultats en vol sont ignorés
+        self.generation = 0
+
+
+class _ChunkTask:
+    __slots__ = ("job", "index", "start", "end", "generation")
+
+    def __init__(self, job: TranscriptionJob, index: int, start: int, end: int):
+        self.job = job
+        self.index = index
+        self.start = start
+        self.end = end
+        self.generation = job.generation
+
+    @property
+    def stale(self) -> bool:
+        """Fenêtre abandonnée (job terminé ou découpage recommencé)"""
+        return self.job.future.done() or self.generation != self.job.generation
+
+
+class TranscriptionPool:
+    """
+    File d'attente bornée devant un pool de processus de transcription.
+
+    Chaque worker est épinglé sur un sous-ensemble des cœurs et garde son propre
+    modèle Whisper chaud. La file est gérée ici (et non dans l'executor) pour
+    pouvoir donner une position d'attente, refuser les jobs quand elle est pleine
+    et annuler un job qui n'a pas encore démarré.
+
+    L'audio est décodé une seule fois en PCM (voir audio_prep) ; les workers le
+    lisent par memory-mapping. En mode découpé (par défaut), il est coupé dans les
+    silences en fenêtres d'environ 30 s ; les fenêtres d'un même job sont réparties
+    sur tous les workers et passent avant les nouveaux jobs de la file.
+
+    En mode pipeline, un job dont l'upload est encore en cours de réception (et de
+    décodage, voir resumable_upload) reçoit ses fenêtres au fur et à mesure que
+    l'audio décodé s'allonge : la transcription avance pendant l'upload.
+
+    Les fenêtres des enregistrements courts (mémos vocaux de moins de
+    TRANSCRIPTION_BATCH_MAX_SECONDS) sont regroupées, tous jobs confondus, en lots
+    d'au plus TRANSCRIPTION_BATCH_SIZE qui passent ensemble dans l'encodeur. Un lot
+    incomplet attend au plus TRANSCRIPTION_BATCH_WAIT_MS d'autres fenêtres.
+
+    L'ordre n'est pas celui d'arrivée : le job dont le temps de transcription restant
+    estimé (durée audio x facteur temps réel mesuré) est le plus court passe
+    d'abord, fenêtre par fenêtre, si bien qu'un mémo d'une minute double un
+    enregistrement de trois heures déjà commencé. Chaque seconde d'attente retire
+    TRANSCRIPTION_AGING seconde au coût d'un job : les longs finissent par passer.
+    Un utilisateur n'a pas plus de TRANSCRIPTION_MAX_JOBS_PER_USER jobs démarrés.
+    """
+
+    def __init__(self):
+        cpu_count = os.cpu_count() or 1
+        self.workers = int(os.getenv("TRANSCRIPTION_WORKERS", str(min(2, cpu_count))))
+        self.max_queue = int(os.getenv("TRANSCRIPTION_QUEUE_SIZE", "16"))
+        self.model_size = model_registry.default_size
+        self.chunked = os.getenv("TRANSCRIPTION_CHUNKED", "true").lower() in ("1", "true", "yes")
+        self.pipelined = self.chunked and os.getenv("TRANSCRIPTION_PIPELINED", "true").lower() in ("1", "true", "yes")
+        # Regroupement en lots : seulement si le moteur sait encoder plusieurs extraits à la fois
+        batch_size = int(os.getenv("TRANSCRIPTION_BATCH_SIZE", "8"))
+        self.batch_size = batch_size if self.chunked and model_registry.engine.batched else 1
+        self.batch_max_seconds = float(os.getenv("TRANSCRIPTION_BATCH_MAX_SECONDS", "120"))
+        self.batch_wait = int(os.getenv("TRANSCRIPTION_BATCH_WAIT_MS", "200")) / 1000
+        self.max_jobs_per_user = int(os.getenv("TRANSCRIPTION_MAX_JOBS_PER_USER", "2"))
+        self.aging = float(os.getenv("TRANSCRIPTION_AGING", "1.0"))
+        self.unknown_audio_seconds = float(os.getenv("TRANSCRIPTION_UNKNOWN_AUDIO_SECONDS", "600"))
+        # Secondes de worker par seconde d'audio, ajusté sur les transcriptions terminées
+        self._rtf = float(os.getenv("TRANSCRIPTION_RTF_ESTIMATE", "0.5"))
+
+        self._executor = None
+        self._dispatchers: List[asyncio.Task] = []
+        self._pending: "OrderedDict[str, TranscriptionJob]" = OrderedDict()
+        self._running: Dict[str, TranscriptionJob] = {}
+        self._chunks: "deque[_ChunkTask]" = deque()
+        self._diarizations: Dict[str, "asyncio.Future"] = {}
+        self._background: Set[asyncio.Task] = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker_stats: Dict[int, Dict[str, Any]] = {}
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._pipelined_jobs = 0
+        self._batches = 0
+        self._batched_chunks = 0
+        # Secondes d'audio transcrites et secondes CPU des workers, avec et sans lots
+        self._throughput = {"batched": [0.0, 0.0], "single": [0.0, 0.0]}
+
+    @property
+    def in_process(self) -> bool:
+        """Sans workers dédiés, la transcription tourne dans un thread du processus principal"""
+        return self.workers <= 0
+
+    def start(self):
+        """Démarre les workers et les dispatchers (appelé au démarrage de l'application)"""
+        if self._dispatchers:
+            return
+        self._wakeup = asyncio.Event()
+        self._executor = self._create_executor()
+        for _ in range(max(1, self.workers)):
+            self._dispatchers.append(asyncio.create_task(self._dispatch_loop()))
+        logger.info(f"Transcription pool started: {self.workers} worker(s), queue size {self.max_queue}")
+
+    async def shutdown(self):
+        for task in self._dispatchers:
+            task.cancel()
+        self._dispatchers = []
+        for job in list(self._pending.values()):
+            if not job.future.done():
+                job.future.set_exception(TranscriptionCancelled("Server shutting down"))
+            job.started.set()
+        self._pending.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def submit(self, job_id: str, file_path: str, language: str = "fr",
+               model_size: Optional[str] = None, user: Optional[str] = None,
+               audio_seconds: Optional[float] = None,
+               wait_ready: Optional[Callable[[], Awaitable[bool]]] = None) -> TranscriptionJob:
+        """
+        Ajoute un job de transcription à la file
+
+        Args:
+            job_id: Identifiant du fichier / job
+            file_path: Chemin du fichier audio
+            language: Langue forcée pour Whisper
+            model_size: Taille du modèle (par défaut celle du registre)
+            user: Utilisateur à l'origine du job (quota de jobs simultanés)
+            audio_seconds: Durée estimée à l'upload (ordonnancement)
+            wait_ready: Upload pas encore finalisé : attend sa finalisation (True si le
+                fichier final est disponible), pour transcrire ce fichier si le décodage
+                pendant l'upload échoue
+
+        Returns:
+            Le job, dont `future` se résout avec le résultat Whisper
+
+        Raises:
+            TranscriptionQueueFull: si la file d'attente est pleine
+            TranscriptionUnavailable: si le pool n'a pas démarré
+        """
+        if self._wakeup is None:
+            raise TranscriptionUnavailable("Transcription is unavailable (Whisper could not be loaded)")
+
+        existing = self._pending.get(job_id) or self._running.get(job_id)
+        if existing is not None:
+            return existing
+
+        if len(self._pending) >= self.max_queue:
+            self._rejected += 1
+            raise TranscriptionQueueFull(len(self._pending) + 1, self.max_queue)
+
+        future = asyncio.get_running_loop().create_future()
+        job = TranscriptionJob(job_id, file_path, language, model_size or self.model_size, future,
+                               user=user, estimated_audio=audio_seconds, wait_ready=wait_ready)
+        job_events.open(job_id)
+        self._pending[job_id] = job
+        self._wakeup.set()
+        return job
+
+    def position(self, job_id: str) -> Optional[int]:
+        """Position dans la file (1 = prochain job), 0 si en cours, None si inconnu"""
+        if job_id in self._running:
+            return 0
+        job = self._pending.get(job_id)
+        if job is None:
+            return None
+        now = time.time()
+        score = self._score(job, now)
+        return 1 + sum(1 for other in self._pending.values() if other is not job and self._score(other, now) < score)
+
+    def estimate(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Début et fin de transcription estimés pour un job en file ou en cours
+
+        Les jobs sont pris dans l'ordre de priorité actuel et leur travail restant se
+        répartit sur tous les workers (un seul par job hors mode découpé, où un job
+        démarré n'est pas doublé). Les arrivées futures ne sont pas prises en compte.
+
+        Returns:
+            estimated_start / estimated_finish (timestamps), estimated_audio_seconds
+        """
+        target = self._pending.get(job_id) or self._running.get(job_id)
+        if target is None:
+            return None
+        now = time.time()
+        workers = max(1, self.workers)
+        jobs = sorted(
+            list(self._running.values()) + list(self._pending.values()),
+            key=lambda job: (not self.chunked and job.job_id not in self._running, self._score(job, now))
+        )
+        ahead = 0.0
+        for job in jobs:
+            cost = self._cost(job, now)
+            if job is target:
+                break
+            ahead += cost
+        start = target.started_at or now + ahead / workers
+        finish = now + (ahead + cost) / workers if self.chunked else max(start, now) + cost
+        audio = target.audio_seconds if target.windows_final else target.estimated_audio
+        return {
+            "estimated_start": start,
+            "estimated_finish": finish,
+            "estimated_audio_seconds": round(audio, 1) if audio else None,
+        }
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Annule un job
+
+        Un job en attente est retiré de la file immédiatement. Pour un job en cours,
+        les fenêtres pas encore démarrées sont abandonnées ; celles déjà sur un
+        worker ne peuvent pas être interrompues et leur résultat est ignoré.
+        """
+        job = self._pending.pop(job_id, None) or self._running.get(job_id)
+        if job is None:
+            return False
+        job.cancelled = True
+        self._drop_chunks(job)
+        if job.state == "queued" or job.windows or job.live is not None or job.awaiting_upload:
+            job.state = "cancelled"
+            job.finished_at = time.time()
+            self._running.pop(job_id, None)
+            if not job.future.done():
+                job.future.set_exception(TranscriptionCancelled(f"Job {job_id} cancelled"))
+            job.started.set()
+            # Une place se libère peut-être pour un autre job de l'utilisateur
+            self._wakeup.set()
+        return True
+
+    async def diarize(self, job_id: str, file_path: str, segments: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Diarise un enregistrement sur un worker du pool
+
+        Les demandes simultanées pour un même job partagent le même calcul.
+
+        Args:
+            job_id: Identifiant du fichier / job
+            file_path: Chemin du fichier audio
+            segments: Segments Whisper (avec timestamps par mot si disponibles)
+
+        Returns:
+            Tours de parole, répliques attribuées et statistiques
+
+        Raises:
+            TranscriptionUnavailable: si le pool n'a pas démarré
+        """
+        if self._executor is None:
+            raise TranscriptionUnavailable("Transcription workers are not running")
+        pending = self._diarizations.get(job_id)
+        if pending is None:
+            loop = asyncio.get_running_loop()
+            pending = asyncio.ensure_future(loop.run_in_executor(self._executor, _diarize_file, file_path, segments))
+            self._diarizations[job_id] = pending
+            pending.add_done_callback(lambda _: self._diarizations.pop(job_id, None))
+        try:
+            result = await asyncio.shield(pending)
+        except BrokenProcessPool:
+            self._recover_executor()
+            raise
+        self._record_worker(result)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "queue_depth": len(self._pending),
+            "queue_capacity": self.max_queue,
+            "in_flight": len(self._running),
+            "chunks_waiting": len(self._chunks),
+            "diarizations_running": len(self._diarizations),
+            "completed": self._completed,
+            "failed": self._failed,
+            "rejected": self._rejected,
+            "pipelined_jobs": self._pipelined_jobs,
+            "scheduler": {
+                "policy": "shortest-remaining-first",
+                "aging": self.aging,
+                "max_jobs_per_user": self.max_jobs_per_user,
+                "rtf_estimate": round(self._rtf, 3),
+            },
+            "batching": {
+                "batch_size": self.batch_size,
+                "max_audio_seconds": self.batch_max_seconds,
+                "batches": self._batches,
+                "batched_chunks": self._batched_chunks,
+            },
+            "throughput": {
+                mode: {
+                    "audio_minutes": round(audio / 60, 2),
+                    "cpu_minutes": round(cpu / 60, 2),
+                    "audio_minutes_per_cpu_minute": round(audio / cpu, 2) if cpu else None,
+                }
+                for mode, (audio, cpu) in self._throughput.items()
+            },
+            "worker_processes": list(self._worker_stats.values()),
+        }
+
+    def _create_executor(self):
+        if self.in_process:
+            return ThreadPoolExecutor(max_workers=1, thread_name_prefix="transcription")
+
+        cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+        ctx = multiprocessing.get_context("spawn")
+        core_queue = ctx.Queue()
+        per_worker = max(1, len(cpus) // self.workers)
+        for index in range(self.workers):
+            cores = cpus[index * per_worker:(index + 1) * per_worker] or cpus
+            core_queue.put(cores)
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=ctx,
+            initializer=_init_worker,
+            initargs=(core_queue, self.model_size),
+        )
+
+    def _cost(self, job: TranscriptionJob, now: float) -> float:
+        """Temps de transcription restant estimé (secondes de worker)"""
+        total = max(job.audio_seconds or 0.0, job.estimated_audio or 0.0) or self.unknown_audio_seconds
+        cost = max(0.0, total - job.done_samples / SAMPLE_RATE) * self._rtf
+        if job.started_at is not None and not job.windows and job.live is None:
+            # Fichier entier sur un worker : aucune progression intermédiaire, on retire le temps écoulé
+            cost = max(0.0, cost - (now - job.started_at))
+        return cost
+
+    def _score(self, job: TranscriptionJob, now: float) -> float:
+        # Plus court d'abord ; chaque seconde d'attente rapproche le job de la tête de file
+        return self._cost(job, now) - self.aging * (now - job.submitted_at)
+
+    def _user_has_room(self, job: TranscriptionJob) -> bool:
+        if self.max_jobs_per_user <= 0 or job.user is None:
+            return True
+        running = sum(1 for other in self._running.values() if other.user == job.user)
+        return running < self.max_jobs_per_user
+
+    def _pick_pending(self, max_audio: Optional[float] = None) -> Optional[TranscriptionJob]:
+        """
+        Job en attente le plus prioritaire parmi ceux dont l'utilisateur a encore une place
+
+        Args:
+            max_audio: Si donné, seulement les jobs dont la durée annoncée ne dépasse pas
+                `max_audio` secondes (durée inconnue exclue)
+        """
+        now = time.time()
+        best, best_score = None, 0.0
+        for job in self._pending.values():
+            if not self._user_has_room(job):
+                continue
+            if max_audio is not None and (job.estimated_audio is None or job.estimated_audio > max_audio):
+                continue
+            score = self._score(job, now)
+            if best is None or score < best_score:
+                best, best_score = job, score
+        return best
+
+    def _pick_next(self):
+        """Prochaine fenêtre d'un job démarré ou prochain job à démarrer, par priorité"""
+        now = time.time()
+        best, best_score = None, 0.0
+        seen = set()
+        for task in self._chunks:
+            # La première fenêtre en file de chaque job le représente
+            if task.job.job_id in seen:
+                continue
+            seen.add(task.job.job_id)
+            score = self._score(task.job, now)
+            if best is None or score < best_score:
+                best, best_score = task, score
+        job = self._pick_pending()
+        if job is not None and (best is None or self._score(job, now) < best_score):
+            del self._pending[job.job_id]
+            return job
+        if best is not None:
+            self._chunks.remove(best)
+        return best
+
+    async def _next_item(self):
+        while True:
+            item = self._pick_next()
+            if item is not None:
+                return item
+            self._wakeup.clear()
+            await self._wakeup.wait()
+
+    async def _dispatch_loop(self):
+        while True:
+            item = await self._next_item()
+            batch = [item]
+            try:
+                if isinstance(item, _ChunkTask) and self._batchable(item):
+                    batch = await self._collect_batch(item)
+                    await self._run_batch(batch)
+                elif isinstance(item, _ChunkTask):
+                    await self._run_chunk(item)
+                else:
+                    await self._run_job(item)
+            except Exception as e:
+                # Une erreur imprévue fait échouer ses jobs, pas le dispatcher (capacité du pool)
+                logger.error(f"Transcription dispatch failed: {e}", exc_info=True)
+                for job in {entry.job if isinstance(entry, _ChunkTask) else entry for entry in batch}:
+                    self._drop_chunks(job)
+                    if not job.future.done():
+                        self._fail(job, e)
+
+    async def _run_job(self, job: TranscriptionJob):
+        job.state = "running"
+        job.started_at = time.time()
+        job.started.set()
+        self._running[job.job_id] = job
+
+        live = audio_preparer.live(job.file_path) if self.pipelined else None
+        if live is not None and live.error is None and not job.cancelled:
+            self._start_pipelined(job, live)
+            return
+        if job.wait_ready is not None and not os.path.exists(job.file_path):
+            # Décodage pendant l'upload déjà en échec : attendre le fichier finalisé
+            job.awaiting_upload = True
+            self._spawn(self._restart_after_upload(job))
+            return
+        await self._transcribe_job(job)
+
+    async def _transcribe_job(self, job: TranscriptionJob):
+        """Décode le fichier complet puis le découpe en fenêtres (ou le transcrit d'un bloc)"""
+        loop = asyncio.get_running_loop()
+        try:
+            job.audio = await loop.run_in_executor(None, audio_preparer.prepare, job.file_path)
+            job.audio_seconds = job.audio.duration
+        except Exception as e:
+            logger.warning(f"Could not decode {job.file_path} to PCM, letting Whisper read the file: {e}")
+
+        if job.cancelled:
+            self._complete(job, {})
+            return
+        if self.chunked and job.audio is not None:
+            self._schedule_chunks(job)
+            return
+
+        pcm_args = (str(job.audio.path), job.audio.num_samples) if job.audio is not None else ()
+        try:
+            result = await loop.run_in_executor(
+                self._executor, _transcribe_file, job.file_path, job.model_size, job.language, *pcm_args
+            )
+            self._record_worker(result)
+            if job.audio_seconds is not None:
+                self._record_throughput("single", job.audio_seconds, result["cpu_seconds"])
+                self._observe_rtf(job.audio_seconds, result["transcribe_seconds"])
+            self._complete(job, result)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._fail(job, e)
+
+    def _schedule_chunks(self, job: TranscriptionJob):
+        self._add_windows(job, split_on_silence(job.audio.samples()))
+        job.windows_final = True
+        logger.info(f"Job {job.job_id}: {job.audio_seconds:.0f}s of audio split into {len(job.windows)} chunk(s)")
+
+    def _add_windows(self, job: TranscriptionJob, windows: List):
+        for start, end in windows:
+            self._chunks.append(_ChunkTask(job, len(job.windows), start, end))
+            job.windows.append((start, end))
+            job.chunk_results.append(None)
+            job.chunks_remaining += 1
+        if windows:
+            self._wakeup.set()
+
+    def _start_pipelined(self, job: TranscriptionJob, live: LiveDecode):
+        """Transcrit les fenêtres de l'audio décodé pendant que l'upload se poursuit"""
+        loop = asyncio.get_running_loop()
+        job.live = live
+        job.splitter = SilenceSplitter()
+        self._pipelined_jobs += 1
+        logger.info(f"Job {job.job_id}: transcribing while the upload is still being received")
+        # Appelé depuis le thread de décodage : traité sur la boucle d'événements
+        live.subscribe(lambda: loop.call_soon_threadsafe(self._on_live_audio, job))
+
+    def _on_live_audio(self, job: TranscriptionJob):
+        live = job.live
+        if live is None or job.windows_final or job.cancelled or job.future.done():
+            return
+        if live.error is not None:
+            self._drop_chunks(job)
+            if job.wait_ready is None:
+                self._fail(job, RuntimeError(f"Decoding the upload failed: {live.error}"))
+                return
+            # Upload interrompu trop longtemps, format illisible en flux... : le job repart
+            # de zéro sur le fichier finalisé, comme un upload classique
+            logger.warning(f"Job {job.job_id}: decoding the upload failed ({live.error}), "
+                           f"transcribing the finalized file instead")
+            self._reset_windows(job)
+            job.awaiting_upload = True
+            self._spawn(self._restart_after_upload(job))
+            return
+
+        finished = live.finished
+        num_samples = live.num_samples
+        if num_samples:
+            samples = PreparedAudio(live.pcm_path, num_samples, 0.0).samples()
+            self._add_windows(job, job.splitter.feed(samples, final=finished))
+        job.audio_seconds = num_samples / SAMPLE_RATE
+        if not finished:
+            return
+
+        if not job.windows:
+            # Upload sans audio : une fenêtre vide, comme split_on_silence
+            self._add_windows(job, [(0, 0)])
+        job.audio = PreparedAudio(live.pcm_path, num_samples, live.decode_seconds)
+        job.windows_final = True
+        logger.info(f"Job {job.job_id}: upload decoded, {job.audio_seconds:.0f}s of audio "
+                    f"in {len(job.windows)} chunk(s)")
+        if job.chunks_remaining == 0:
+            self._finish_chunks(job)
+
+    def _reset_windows(self, job: TranscriptionJob):
+        """Abandonne les fenêtres du pipeline (les segments déjà diffusés restent valables)"""
+        job.generation += 1
+        job.live = None
+        job.splitter = None
+        job.audio = None
+        job.windows = []
+        job.chunk_results = []
+        job.chunks_remaining = 0
+        job.committed_chunks = 0
+        job.done_samples = 0
+
+    async def _restart_after_upload(self, job: TranscriptionJob):
+        try:
+            ready = job.cancelled or await job.wait_ready()
+        except Exception as e:
+            logger.warning(f"Job {job.job_id}: waiting for the upload failed: {e}")
+            ready = False
+        finally:
+            job.awaiting_upload = False
+        if job.future.done():
+            return
+        if job.cancelled:
+            # Annulé pendant l'attente : libérer le job (état, future, place de l'utilisateur)
+            self._complete(job, {})
+            return
+        if not ready:
+            self._fail(job, RuntimeError("Upload was abandoned, failed its checksum or was never finalized"))
+            return
+        await self._transcribe_job(job)
+
+    def _spawn(self, coroutine) -> asyncio.Task:
+        task = asyncio.create_task(coroutine)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return task
+
+    async def _run_chunk(self, task: _ChunkTask):
+        job = task.job
+        if job.cancelled or task.stale:
+            return
+        loop = asyncio.get_running_loop()
+        # Audio encore en cours de décodage (pipeline) : seule la fenêtre est garantie lisible
+        pcm_path, num_samples = (job.audio.path, job.audio.num_samples) if job.audio is not None \
+            else (job.live.pcm_path, task.end)
+        try:
+            result = await loop.run_in_executor(
+                self._executor, _transcribe_chunk, str(pcm_path), num_samples,
+                task.start, task.end, job.model_size, job.language
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if not task.stale:
+                self._drop_chunks(job)
+                self._fail(job, e)
+            return
+
+        self._record_worker(result)
+        self._record_throughput("single", (task.end - task.start) / SAMPLE_RATE, result["cpu_seconds"])
+        self._chunk_done(task, result)
+
+    def _batchable(self, task: _ChunkTask) -> bool:
+        """Fenêtre d'un enregistrement court, entièrement décodé, qui tient dans 30 s"""
+        job = task.job
+        return (self.batch_size > 1 and job.live is None and job.audio is not None
+                and job.audio_seconds <= self.batch_max_seconds
+                and task.end - task.start <= BATCH_WINDOW_SAMPLES)
+
+    def _take_batchable(self, batch: List[_ChunkTask]):
+        """Retire de la file les fenêtres qui peuvent rejoindre le lot (même modèle, même langue)"""
+        key = (batch[0].job.model_size, batch[0].job.language)
+        kept = deque()
+        for task in self._chunks:
+            if len(batch) < self.batch_size and self._batchable(task) \
+                    and (task.job.model_size, task.job.language) == key:
+                batch.append(task)
+            else:
+                kept.append(task)
+        self._chunks = kept
+
+    async def _collect_batch(self, first: _ChunkTask) -> List[_ChunkTask]:
+        """
+        Complète le lot avec les fenêtres en attente, au plus `batch_wait` secondes
+
+        Les jobs courts de la file sont préparés (décodés, découpés) pendant l'attente ;
+        une préparation qui dépasse l'échéance se poursuit en arrière-plan, ses fenêtres
+        rejoignant la file ensuite.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.batch_wait
+        batch = [first]
+        while True:
+            self._take_batchable(batch)
+            remaining = deadline - loop.time()
+            if len(batch) >= self.batch_size or remaining <= 0:
+                return batch
+            # Seuls les enregistrements courts peuvent rejoindre le lot : les longs restent
+            # à la boucle principale (décodage complet, voire transcription d'un bloc)
+            job = self._pick_pending(max_audio=self.batch_max_seconds)
+            if job is not None:
+                del self._pending[job.job_id]
+                await asyncio.wait({self._spawn(self._run_job(job))}, timeout=remaining)
+                continue
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _run_batch(self, batch: List[_ChunkTask]):
+        tasks = [task for task in batch if not (task.job.cancelled or task.stale)]
+        if len(tasks) <= 1:
+            for task in tasks:
+                await self._run_chunk(task)
+            return
+
+        loop = asyncio.get_running_loop()
+        items = [(str(task.job.audio.path), task.job.audio.num_samples, task.start, task.end) for task in tasks]
+        try:
+            result = await loop.run_in_executor(
+                self._executor, _transcribe_batch, items, tasks[0].job.model_size, tasks[0].job.language
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                self._recover_executor()
+            logger.warning(f"Batched transcription of {len(tasks)} chunk(s) failed, retrying one by one: {e}")
+            for task in tasks:
+                await self._run_chunk(task)
+            return
+
+        self._record_worker(result)
+        self._batches += 1
+        self._batched_chunks += len(tasks)
+        audio_seconds = sum(task.end - task.start for task in tasks) / SAMPLE_RATE
+        self._record_throughput("batched", audio_seconds, result["cpu_seconds"])
+        for task, chunk in zip(tasks, result["chunks"]):
+            self._chunk_done(task, chunk)
+
+    def _chunk_done(self, task: _ChunkTask, result: Dict[str, Any]):
+        job = task.job
+        if task.stale:
+            # Job annulé, en échec ou redécoupé pendant que la fenêtre tournait
+            return
+        job.chunk_results[task.index] = result
+        job.chunks_remaining -= 1
+        job.done_samples += task.end - task.start
+        self._observe_rtf((task.end - task.start) / SAMPLE_RATE, result["transcribe_seconds"])
+        self._publish_progress(job)
+        if job.chunks_remaining == 0 and job.windows_final:
+            self._finish_chunks(job)
+
+    def _finish_chunks(self, job: TranscriptionJob):
+        stitched = stitch_chunks(job.windows, job.chunk_results)
+        stitched["language"] = job.chunk_results[0].get("language", job.language)
+        stitched["transcribe_seconds"] = sum(r["transcribe_seconds"] for r in job.chunk_results)
+        stitched["audio_seconds"] = job.audio_seconds
+        stitched["chunks"] = len(job.windows)
+        if job.live is not None:
+            stitched["pipelined"] = True
+        self._complete(job, stitched)
+
+    def _publish_progress(self, job: TranscriptionJob):
+        """Diffuse les segments définitifs (préfixe de fenêtres terminées) et la progression"""
+        committed = job.committed_chunks
+        # Pipeline : la dernière fenêtre connue attend sa suivante (recouvrement pas encore arbitré)
+        limit = len(job.chunk_results) if job.windows_final else len(job.chunk_results) - 1
+        while committed < limit and job.chunk_results[committed] is not None:
+            committed += 1
+        if committed > job.committed_chunks:
+            job.committed_chunks = committed
+            # Les fenêtres suivantes ne modifient pas les segments d'un préfixe terminé
+            partial = stitch_chunks(job.windows, job.chunk_results[:committed])
+            for segment in partial["segments"][job.emitted_segments:]:
+                job_events.publish(job.job_id, "segment", _segment_event(segment))
+            job.emitted_segments = len(partial["segments"])
+
+        total = sum(end - start for start, end in job.windows) or 1
+        done = sum(
+            end - start
+            for (start, end), result in zip(job.windows, job.chunk_results)
+            if result is not None
+        )
+        job_events.publish(job.job_id, "progress", {
+            # Pipeline : total provisoire (audio décodé jusqu'ici) tant que l'upload continue
+            "receiving": not job.windows_final,
+            "audio_seconds_total": round(job.audio_seconds or 0, 2),
+            "audio_seconds_processed": round((job.audio_seconds or 0) * done / total, 2),
+            "transcribed_until": round(job.windows[committed - 1][1] / SAMPLE_RATE, 2) if committed else 0,
+            "percent": round(100 * done / total, 1),
+        })
+
+    def _drop_chunks(self, job: TranscriptionJob):
+        if self._chunks:
+            self._chunks = deque(task for task in self._chunks if task.job is not job)
+
+    def _record_worker(self, result: Dict[str, Any]):
+        worker = result.pop("worker", None)
+        if worker:
+            self._worker_stats[worker["pid"]] = worker
+
+    def _observe_rtf(self, audio_seconds: float, transcribe_seconds: float):
+        # Moyenne glissante : suit le modèle, le moteur et la charge de la machine
+        if audio_seconds >= 1.0:
+            self._rtf += 0.1 * (transcribe_seconds / audio_seconds - self._rtf)
+
+    def _record_throughput(self, mode: str, audio_seconds: float, cpu_seconds: float):
+        totals = self._throughput[mode]
+        totals[0] += audio_seconds
+        totals[1] += cpu_seconds
+
+    def _complete(self, job: TranscriptionJob, result: Dict[str, Any]):
+        job.finished_at = time.time()
+        self._running.pop(job.job_id, None)
+        self._wakeup.set()
+        if job.cancelled:
+            job.state = "cancelled"
+            if not job.future.done():
+                job.future.set_exception(TranscriptionCancelled(f"Job {job.job_id} cancelled"))
+            return
+        job.state = "completed"
+        self._completed += 1
+        if job.audio is not None:
+            result["audio_seconds"] = job.audio_seconds
+            result["decode_seconds"] = round(job.audio.decode_seconds, 2)
+        if not job.windows:
+            # Mode fichier entier : tous les segments arrivent d'un coup
+            for segment in result.get("segments", []):
+                job_events.publish(job.job_id, "segment", _segment_event(segment))
+            job_events.publish(job.job_id, "progress", {"percent": 100.0})
+        job.future.set_result(result)
+
+    def _fail(self, job: TranscriptionJob, error: Exception):
+        job.finished_at = time.time()
+        self._running.pop(job.job_id, None)
+        self._wakeup.set()
+        if isinstance(error, BrokenProcessPool):
+            logger.error(f"Transcription worker crashed on {job.job_id}: {error}")
+            self._recover_executor()
+        self._failed += 1
+        job.state = "error"
+        if not job.future.done():
+            job.future.set_exception(error)
+
+    def _recover_executor(self):
+        # Plusieurs jobs peuvent échouer sur le même pool cassé : on ne le recrée qu'une fois
+        if getattr(self._executor, "_broken", False):
+            self._executor = self._create_executor()
+
+# Instance globale
+transcription_pool = TranscriptionPool()
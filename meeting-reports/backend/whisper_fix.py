@@ -10,7 +10,8 @@ def fix_whisper_transcription(file_path):
     Essaie plusieurs approches pour contourner les problèmes de compatibilité
     """
     try:
-        import whisper
+        # Modèle partagé du registre, chargé par le moteur du déploiement (TRANSCRIPTION_ENGINE)
+        from model_registry import model_registry
         
         # Vérifier si le fichier existe
         if not os.path.exists(file_path):
@@ -20,8 +21,8 @@ def fix_whisper_transcription(file_path):
         
         # Approche 1: Essayer directement avec le fichier original
         try:
-            model = whisper.load_model("base")
-            result = model.transcribe(file_path)
+            with model_registry.acquire() as model:
+                result = model.transcribe(file_path)
             print("[WHISPER] Transcription directe réussie!")
             return result
         except Exception as e1:
@@ -40,7 +41,8 @@ def fix_whisper_transcription(file_path):
                         raise Exception("Échec de la copie vers le dossier temporaire")
                     
                     # Transcrire depuis le fichier temporaire
-                    result = model.transcribe(temp_file)
+                    with model_registry.acquire() as model:
+                        result = model.transcribe(temp_file)
                     print("[WHISPER] Transcription temporaire réussie!")
                     return result
                     
@@ -50,7 +52,8 @@ def fix_whisper_transcription(file_path):
                 # Approche 3: Essayer avec un chemin normalisé
                 try:
                     normalized_path = os.path.normpath(file_path)
-                    result = model.transcribe(normalized_path)
+                    with model_registry.acquire() as model:
+                        result = model.transcribe(normalized_path)
                     print("[WHISPER] Transcription normalisée réussie!")
                     return result
                 except Exception as e3:
@@ -59,7 +62,8 @@ def fix_whisper_transcription(file_path):
                     # Approche 4: Essayer avec un chemin relatif
                     try:
                         relative_path = os.path.relpath(file_path)
-                        result = model.transcribe(relative_path)
+                        with model_registry.acquire() as model:
+                            result = model.transcribe(relative_path)
                         print("[WHISPER] Transcription relative réussie!")
                         return result
                     except Exception as e4:
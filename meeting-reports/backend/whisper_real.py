@@ -9,7 +9,8 @@ def whisper_transcribe_real(file_path):
     Transcription Whisper réelle avec contournements Windows
     """
     try:
-        import whisper
+        # Modèle partagé du registre, chargé par le moteur du déploiement (TRANSCRIPTION_ENGINE)
+        from model_registry import model_registry
         
         print(f"[WHISPER] Début transcription: {file_path}")
         
@@ -21,10 +22,21 @@ def whisper_transcribe_real(file_path):
         file_size = os.path.getsize(file_path)
         print(f"[WHISPER] Taille fichier: {file_size} bytes")
         
+        # Approche 0: Réutiliser l'audio déjà décodé (artefact PCM partagé)
+        try:
+            from audio_prep import audio_preparer
+            audio = audio_preparer.prepare(file_path)
+            with model_registry.acquire() as model:
+                result = model.transcribe(audio.samples())
+            print(f"[WHISPER] Transcription depuis l'artefact PCM réussie! ({audio.duration:.0f}s d'audio)")
+            return result
+        except Exception as e0:
+            print(f"[WHISPER] Transcription depuis l'artefact PCM échouée: {e0}")
+        
         # Approche 1: Essayer directement
         try:
-            model = whisper.load_model("base")
-            result = model.transcribe(file_path)
+            with model_registry.acquire() as model:
+                result = model.transcribe(file_path)
             print("[WHISPER] Transcription directe réussie!")
             return result
         except Exception as e1:
@@ -54,8 +66,8 @@ def whisper_transcribe_real(file_path):
                 print("[WHISPER] Conversion FFmpeg réussie")
                 
                 # Transcrire le fichier converti
-                model = whisper.load_model("base")
-                result = model.transcribe(temp_path)
+                with model_registry.acquire() as model:
+                    result = model.transcribe(temp_path)
                 
                 # Nettoyer
                 os.unlink(temp_path)
@@ -84,8 +96,8 @@ def whisper_transcribe_real(file_path):
                     raise Exception("Échec de la copie")
                 
                 # Transcrire
-                model = whisper.load_model("base")
-                result = model.transcribe(temp_file)
+                with model_registry.acquire() as model:
+                    result = model.transcribe(temp_file)
                 
                 print("[WHISPER] Transcription temporaire réussie!")
                 return result
@@ -107,8 +119,8 @@ def whisper_transcribe_real(file_path):
             shutil.copy2(file_path, short_path)
             
             # Transcrire
-            model = whisper.load_model("base")
-            result = model.transcribe(short_path)
+            with model_registry.acquire() as model:
+                result = model.transcribe(short_path)
             
             # Nettoyer
             if os.path.exists(short_path):
@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+"""
+Benchmark de bout en bout de l'API : upload, file d'attente, transcription, résumé
+
+Des enregistrements synthétiques « type parole » (déterministes, une graine par
+job) de durées fixes sont envoyés à l'API, qui tourne dans ce processus (uvicorn
+dans un thread) ou sur un serveur local (--url). Le LLM est remplacé par un faux
+serveur OpenAI local : le résumé est mesuré sans appel externe ni coût.
+
+Mesures enregistrées dans un fichier JSON (BENCHMARK_OUTPUT) pour comparer deux
+versions (--compare ancien.json) : débit d'upload, attente en file, facteur temps
+réel (RTF) de la transcription, latence du résumé, et p50/p95/p99 par endpoint.
+
+Usage : python benchmark-api.py [--durations 30,120,600] [--repeat N] [--concurrency N]
+                                [--url http://127.0.0.1:8001] [--llm-latency S] [--compare FICHIER]
+
+Avec --url, le serveur doit être lancé avec OPENAI_BASE_URL=http://127.0.0.1:<--llm-port>/v1
+pour utiliser le faux LLM.
+"""
+
+import os
+import sys
+import json
+import time
+import wave
+import asyncio
+import tempfile
+import threading
+import subprocess
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import httpx
+import numpy as np
+
+# Add backend directory to path
+sys.path.append(str(Path(__file__).parent / "backend"))
+
+SAMPLE_RATE = 16000
+
+REPORT_JSON = {
+    "summary": "Réunion de suivi du projet : budget validé, livraison décalée.",
+    "key_points": ["Budget du trimestre validé", "Livraison de la maquette décalée"],
+    "action_items": ["Marie : migration des données", "Prévoir la recette"],
+    "participants": ["Marie", "Paul"],
+    "decisions": ["Point hebdomadaire avec le client"],
+    "next_steps": "Recette complète avant la mise en production",
+}
+
+
+class StubLLM(BaseHTTPRequestHandler):
+    """Imite POST /v1/chat/completions avec une latence fixe et un compte rendu JSON"""
+
+    latency = 0.5
+    lock = threading.Lock()
+    calls = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with StubLLM.lock:
+            StubLLM.calls += 1
+        time.sleep(StubLLM.latency)
+        data = json.dumps({
+            "id": "chatcmpl-bench",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant",
+                                     "content": json.dumps(REPORT_JSON, ensure_ascii=False)}}],
+            "usage": {"prompt_tokens": 100, "completion_tokens": 100, "total_tokens": 200},
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def speech_like(seconds: float, seed: int) -> np.ndarray:
+    """
+    Signal « type parole » déterministe : phrases voisées (fondamentale de 100 à
+    220 Hz avec intonation, harmoniques, enveloppe syllabique de 3 à 6 Hz, souffle)
+    séparées de pauses de 0,2 à 0,8 s
+
+    Returns:
+        Échantillons int16 à 16 kHz
+    """
+    rng = np.random.default_rng(seed)
+    total = int(seconds * SAMPLE_RATE)
+    out = np.zeros(total, dtype=np.float32)
+    position = 0
+    while position < total:
+        end = min(total, position + int(rng.uniform(1.5, 4.0) * SAMPLE_RATE))
+        t = np.arange(end - position) / SAMPLE_RATE
+        f0 = rng.uniform(100, 220) * (1 + 0.1 * np.sin(2 * np.pi * rng.uniform(0.5, 2.0) * t))
+        phase = 2 * np.pi * np.cumsum(f0) / SAMPLE_RATE
+        voice = sum(np.sin(k * phase) / k for k in range(1, 8))
+        syllables = 0.5 * (1 - np.cos(2 * np.pi * rng.uniform(3.0, 6.0) * t))
+        breath = rng.normal(0, 0.05, len(t))
+        out[position:end] = 0.25 * (voice + breath) * syllables
+        position = end + int(rng.uniform(0.2, 0.8) * SAMPLE_RATE)
+    return (np.clip(out, -1, 1) * 32767).astype(np.int16)
+
+
+def write_wav(path: Path, samples: np.ndarray):
+    with wave.open(str(path), "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(samples.tobytes())
+
+
+def quantiles(values: list) -> dict:
+    """Nombre, p50, p95, p99 et max (rang le plus proche)"""
+    if not values:
+        return {"count": 0, "p50": None, "p95": None, "p99": None, "max": None}
+    ordered = sorted(values)
+
+    def rank(q):
+        return round(ordered[min(len(ordered) - 1, max(0, int(np.ceil(q * len(ordered))) - 1))], 4)
+
+    return {"count": len(ordered), "p50": rank(0.50), "p95": rank(0.95), "p99": rank(0.99),
+            "max": round(ordered[-1], 4)}
+
+
+class Benchmark:
+    """Jobs concurrents contre l'API, latences par endpoint et étapes de chaque job"""
+
+    def __init__(self, client: httpx.AsyncClient, poll: float, timeout: float, users: int):
+        self.client = client
+        self.poll = poll
+        self.timeout = timeout
+        self.users = users
+        self.latencies = {}
+        self.errors = {}
+        self.jobs = []
+
+    async def call(self, endpoint: str, method: str, url: str, **kwargs) -> httpx.Response:
+        """Requête chronométrée, rangée sous `endpoint` (ex. "POST /upload")"""
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+            raise
+        self.latencies.setdefault(endpoint, []).append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+        return response
+
+    async def run_job(self, index: int, seconds: float, audio: Path):
+        data = audio.read_bytes()
+        job = {"index": index, "audio_seconds": seconds, "bytes": len(data)}
+        self.jobs.append(job)
+        try:
+            started = time.perf_counter()
+            response = await self.call("POST /upload", "POST", "/upload",
+                                       files={"file": (audio.name, data, "audio/wav")})
+            response.raise_for_status()
+            upload_seconds = time.perf_counter() - started
+            file_id = response.json()["id"]
+            job["id"] = file_id
+            job["upload_seconds"] = round(upload_seconds, 3)
+            job["upload_mb_per_s"] = round(len(data) / 1024 / 1024 / upload_seconds, 2)
+
+            # Cache LLM contourné : chaque job mesure un vrai résumé (auprès du faux LLM)
+            submitted = time.time()
+            response = await self.call("POST /process", "POST", f"/process/{file_id}",
+                                       params={"bypass_llm_cache": "true"},
+                                       headers={"X-User-Id": f"benchmark-{index % self.users}"})
+            response.raise_for_status()
+
+            poller = asyncio.create_task(self._poll_status(file_id))
+            try:
+                marks = await asyncio.wait_for(self._follow(file_id), self.timeout)
+            finally:
+                poller.cancel()
+
+            job["status"] = marks.get("final", "unknown")
+            if "started" in marks:
+                job["queue_wait_seconds"] = round(marks["started"] - submitted, 3)
+            if "started" in marks and "transcribed" in marks:
+                transcription = marks["transcribed"] - marks["started"]
+                job["transcription_seconds"] = round(transcription, 3)
+                job["rtf"] = round(transcription / seconds, 4)
+            if "transcribed" in marks and "summarized" in marks:
+                job["summary_seconds"] = round(marks["summarized"] - marks["transcribed"], 3)
+            if "finished" in marks:
+                job["total_seconds"] = round(marks["finished"] - submitted + upload_seconds, 3)
+
+            if job["status"] == "completed":
+                await self.call("GET /report", "GET", f"/report/{file_id}")
+            await self.call("DELETE /reports", "DELETE", f"/reports/{file_id}")
+        except Exception as e:
+            job["status"] = "error"
+            job["error"] = f"{type(e).__name__}: {e}"
+
+    async def _follow(self, file_id: str) -> dict:
+        """
+        Suit les événements SSE du job ; l'heure de chaque étape est l'updated_at du
+        statut (horloge du serveur, la même en local), à défaut l'heure de réception
+        """
+        marks = {}
+        async with self.client.stream("GET", f"/stream/{file_id}", timeout=None) as response:
+            event = None
+            async for line in response.aiter_lines():
+                if line.startswith("event:"):
+                    event = line[6:].strip()
+                    continue
+                if not line.startswith("data:") or event != "status":
+                    continue
+                status = json.loads(line[5:])
+                at = time.time()
+                if status.get("updated_at"):
+                    at = datetime.fromisoformat(status["updated_at"]).timestamp()
+                progress = status.get("progress", 0)
+                if status["status"] == "processing" and progress >= 10:
+                    marks.setdefault("started", at)
+                if progress >= 50:
+                    marks.setdefault("transcribed", at)
+                if progress >= 90:
+                    marks.setdefault("summarized", at)
+                if status["status"] in ("completed", "error", "cancelled"):
+                    marks["final"] = status["status"]
+                    marks["finished"] = at
+                    break
+        return marks
+
+    async def _poll_status(self, file_id: str):
+        """Interroge /status pendant le job, comme le frontend (latence sous charge)"""
+        while True:
+            await asyncio.sleep(self.poll)
+            try:
+                await self.call("GET /status", "GET", f"/status/{file_id}")
+            except httpx.HTTPError:
+                pass
+
+    def results(self) -> dict:
+        done = [job for job in self.jobs if job.get("status") == "completed"]
+        return {
+            "endpoints": {endpoint: dict(quantiles(values), errors=self.errors.get(endpoint, 0))
+                          for endpoint, values in sorted(self.latencies.items())},
+            "metrics": {
+                "upload_mb_per_s": quantiles([job["upload_mb_per_s"] for job in self.jobs if "upload_mb_per_s" in job]),
+                "queue_wait_seconds": quantiles([job["queue_wait_seconds"] for job in done]),
+                "rtf": quantiles([job["rtf"] for job in done if "rtf" in job]),
+                "summary_seconds": quantiles([job["summary_seconds"] for job in done if "summary_seconds" in job]),
+                "total_seconds": quantiles([job["total_seconds"] for job in done if "total_seconds" in job]),
+            },
+            "jobs": sorted(self.jobs, key=lambda job: job["index"]),
+        }
+
+
+def start_llm_stub(port: int, latency: float) -> ThreadingHTTPServer:
+    StubLLM.latency = latency
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubLLM)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_app(llm_url: str):
+    """Lance l'API de backend/main.py dans ce processus (uvicorn dans un thread) ; renvoie (serveur, url)"""
+    os.environ["OPENAI_API_KEY"] = "sk-benchmark"
+    os.environ["OPENAI_BASE_URL"] = llm_url
+    import uvicorn
+    from main import app
+
+    config = uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning", lifespan="on")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("uvicorn stopped during startup")
+        time.sleep(0.05)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    return server, f"http://127.0.0.1:{port}"
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).parent).stdout.strip() or "unknown"
+    except OSError:
+        return "unknown"
+
+
+def compare(previous: dict, current: dict, tolerance: float) -> bool:
+    """Compare les latences (endpoints et étapes) à un précédent résultat ; False si régression"""
+    print(f"\nComparaison avec {previous.get('commit', '?')} (tolérance {tolerance:.0%}) :")
+    ok = True
+    pairs = [(f"endpoint {name}", previous.get("endpoints", {}).get(name), stats)
+             for name, stats in current["endpoints"].items()]
+    pairs += [(name, previous.get("metrics", {}).get(name), stats) for name, stats in current["metrics"].items()]
+    for label, before, after in pairs:
+        # Débit : médiane, plus haut est meilleur ; durées : p95, plus bas est meilleur
+        higher_is_better = label == "upload_mb_per_s"
+        key = "p50" if higher_is_better else "p95"
+        if not before or before.get(key) is None or after.get(key) is None:
+            continue
+        ratio = after[key] / before[key] if before[key] else 1.0
+        regressed = ratio < 1 - tolerance if higher_is_better else ratio > 1 + tolerance
+        line = f"{label}: {key} {before[key]} -> {after[key]} ({ratio - 1:+.1%})"
+        if regressed:
+            print(f"[ERROR] {line}")
+            ok = False
+        else:
+            print(f"[OK] {line}")
+    return ok
+
+
+async def benchmark(url: str, durations: list, repeat: int, concurrency: int, args: dict) -> dict:
+    workdir = tempfile.TemporaryDirectory()
+    files = []
+    for index, seconds in enumerate(d for d in durations for _ in range(repeat)):
+        # Une graine par job : audio différent, pas de réutilisation par le cache d'audio
+        path = Path(workdir.name) / f"benchmark-{index:03d}-{int(seconds)}s.wav"
+        write_wav(path, speech_like(seconds, seed=1000 + index))
+        files.append((index, seconds, path))
+
+    async with httpx.AsyncClient(base_url=url, timeout=httpx.Timeout(600.0, connect=10.0)) as client:
+        bench = Benchmark(client, poll=args["poll"], timeout=args["job_timeout"], users=args["users"])
+        health = (await bench.call("GET /health", "GET", "/health")).json()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def limited(index, seconds, path):
+            async with semaphore:
+                await bench.run_job(index, seconds, path)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(limited(*item) for item in files))
+        elapsed = time.perf_counter() - started
+        await bench.call("GET /reports", "GET", "/reports")
+        await bench.call("GET /health", "GET", "/health")
+
+    workdir.cleanup()
+    results = bench.results()
+    return {
+        "commit": git_commit(),
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "config": dict(args, url=url, durations=durations, repeat=repeat, concurrency=concurrency),
+        "server": {
+            "whisper_models": health.get("whisper_models"),
+            "transcription_workers": (health.get("transcription_pool") or {}).get("workers"),
+        },
+        "wall_seconds": round(elapsed, 2),
+        "audio_seconds": sum(seconds for _, seconds, _ in files),
+        "llm_calls": StubLLM.calls,
+        **results,
+    }
+
+
+def print_results(results: dict) -> bool:
+    print(f"\n{'endpoint':22s} {'n':>5s} {'p50':>8s} {'p95':>8s} {'p99':>8s} {'erreurs':>8s}")
+    for name, stats in results["endpoints"].items():
+        print(f"{name:22s} {stats['count']:5d} {stats['p50']:8.3f} {stats['p95']:8.3f} {stats['p99']:8.3f} "
+              f"{stats['errors']:8d}")
+    print()
+    for name, stats in results["metrics"].items():
+        if stats["count"]:
+            print(f"{name:22s} p50 {stats['p50']:8.3f}  p95 {stats['p95']:8.3f}  p99 {stats['p99']:8.3f}")
+
+    failed = [job for job in results["jobs"] if job.get("status") != "completed"]
+    for job in failed:
+        print(f"[ERROR] job {job['index']} ({job['audio_seconds']}s): {job.get('error') or job.get('status')}")
+    if not failed:
+        print(f"[OK] {len(results['jobs'])} jobs completed, {results['audio_seconds']}s of audio "
+              f"in {results['wall_seconds']}s")
+    return not failed
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+
+    def option(name, default):
+        if name in args:
+            index = args.index(name)
+            value = args[index + 1]
+            del args[index:index + 2]
+            return value
+        return default
+
+    durations = [float(d) for d in option("--durations", "30,120,600").split(",")]
+    repeat = int(option("--repeat", "2"))
+    concurrency = int(option("--concurrency", "4"))
+    url = option("--url", None)
+    llm_port = int(option("--llm-port", "8099" if url else "0"))
+    previous = option("--compare", None)
+    settings = {
+        "llm_latency": float(option("--llm-latency", "0.5")),
+        "poll": float(option("--poll", "1.0")),
+        "job_timeout": float(option("--job-timeout", "3600")),
+        "users": int(option("--users", "4")),
+        "tolerance": float(option("--tolerance", "0.2")),
+    }
+
+    llm = start_llm_stub(llm_port, settings["llm_latency"])
+    llm_url = f"http://127.0.0.1:{llm.server_address[1]}/v1"
+    server = None
+    if url is None:
+        try:
+            server, url = start_app(llm_url)
+        except Exception as e:
+            print(f"[ERROR] Could not start the API in-process: {e}")
+            sys.exit(1)
+    print(f"=== Benchmark API : {url} (faux LLM {llm_url}) ===")
+    print(f"Durées {durations} x {repeat}, {concurrency} jobs simultanés\n")
+
+    try:
+        results = asyncio.run(benchmark(url, durations, repeat, concurrency, settings))
+    except Exception as e:
+        print(f"[ERROR] Benchmark failed: {e}")
+        sys.exit(1)
+    finally:
+        if server is not None:
+            server.should_exit = True
+        llm.shutdown()
+
+    ok = print_results(results)
+    output = Path(os.getenv("BENCHMARK_OUTPUT", "benchmark-api.json"))
+    output.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"\nRésultats : {output}")
+    if previous:
+        ok = compare(json.loads(Path(previous).read_text(encoding="utf-8")), results, settings["tolerance"]) and ok
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Benchmark de la transcription en lots des enregistrements courts :
+minutes d'audio transcrites par minute CPU, fenêtre par fenêtre puis par lots
+
+Les mémos sont lus depuis un répertoire d'échantillons (manifest.jsonl, même format
+que benchmark-transcription-engines.py, qui sait synthétiser le jeu français) ou
+passés en arguments. Ils sont découpés comme dans le pool (fenêtres de 30 s) puis
+transcrits avec les fonctions des workers, dans ce processus.
+
+Usage : python benchmark-batched-transcription.py [audio ...] [--samples DIR] [--batch N]
+"""
+
+import os
+import sys
+import json
+import time
+from pathlib import Path
+
+# Add backend directory to path
+sys.path.append(str(Path(__file__).parent / "backend"))
+
+os.environ.setdefault("WHISPER_WORD_TIMESTAMPS", "true")
+
+from audio_chunking import SAMPLE_RATE, split_on_silence
+from audio_prep import audio_preparer
+from model_registry import model_registry
+from transcription_pool import _transcribe_batch, _transcribe_chunk
+
+DEFAULT_SAMPLES_DIR = Path(__file__).parent / "benchmark-samples" / "fr"
+
+
+def sample_files(args: list, samples_dir: Path) -> list:
+    if args:
+        return args
+    manifest = samples_dir / "manifest.jsonl"
+    if not manifest.exists():
+        raise RuntimeError(f"No audio given and no {manifest} "
+                           f"(run benchmark-transcription-engines.py once to synthesize it)")
+    with open(manifest, "r", encoding="utf-8") as f:
+        return [str(samples_dir / json.loads(line)["audio"]) for line in f if line.strip()]
+
+
+def windows_of(files: list) -> list:
+    """(pcm_path, num_samples, start, end) pour chaque fenêtre, comme dans le pool"""
+    items = []
+    for path in files:
+        audio = audio_preparer.prepare(path)
+        for start, end in split_on_silence(audio.samples()):
+            items.append((str(audio.path), audio.num_samples, start, end))
+    return items
+
+
+def run(items: list, batch_size: int, language: str):
+    """Transcrit toutes les fenêtres ; renvoie (secondes CPU, secondes réelles, textes)"""
+    size = model_registry.default_size
+    cpu_started = time.process_time()
+    started = time.perf_counter()
+    texts = []
+    if batch_size <= 1:
+        for item in items:
+            result = _transcribe_chunk(*item, size, language)
+            texts.append(" ".join(segment["text"].strip() for segment in result["segments"]))
+    else:
+        for index in range(0, len(items), batch_size):
+            result = _transcribe_batch(items[index:index + batch_size], size, language)
+            texts.extend(" ".join(segment["text"].strip() for segment in chunk["segments"])
+                         for chunk in result["chunks"])
+    return time.process_time() - cpu_started, time.perf_counter() - started, texts
+
+
+def word_divergence(reference: list, other: list) -> float:
+    """Part des mots qui diffèrent entre deux séries de transcriptions (distance d'édition)"""
+    errors = words = 0
+    for ref_text, text in zip(reference, other):
+        ref, hyp = ref_text.lower().split(), text.lower().split()
+        previous = list(range(len(hyp) + 1))
+        for i, ref_word in enumerate(ref, 1):
+            current = [i]
+            for j, hyp_word in enumerate(hyp, 1):
+                current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word)))
+            previous = current
+        errors += previous[-1]
+        words += len(ref)
+    return errors / max(1, words)
+
+
+def benchmark_batching(files: list, batch_sizes: list, language: str = "fr") -> bool:
+    print(f"=== Benchmark transcription en lots ({model_registry.engine.name}, "
+          f"modèle {model_registry.default_size}) ===")
+    if not model_registry.engine.batched:
+        print(f"[ERROR] The {model_registry.engine.name} engine does not support batched inference")
+        return False
+    items = windows_of(files)
+    audio_minutes = sum(end - start for _, _, start, end in items) / SAMPLE_RATE / 60
+    print(f"{len(files)} enregistrement(s), {len(items)} fenêtre(s), {audio_minutes:.2f} min d'audio\n")
+
+    model_registry.warm()
+    # Passage de chauffe non mesuré
+    run(items[:2], 1, language)
+    run(items[:2], 2, language)
+
+    ok = True
+    reference = None
+    baseline = None
+    for batch_size in [1] + batch_sizes:
+        cpu, wall, texts = run(items, batch_size, language)
+        throughput = audio_minutes / (cpu / 60)
+        label = "sans lots" if batch_size == 1 else f"lots de {batch_size}"
+        line = (f"  {label:12s} : {throughput:7.2f} min audio / min CPU, {audio_minutes / (wall / 60):7.2f} "
+                f"min audio / min réelle ({cpu:.1f}s CPU, {wall:.1f}s)")
+        if reference is None:
+            reference, baseline = texts, throughput
+            print(line)
+            continue
+        print(f"{line}, x{throughput / baseline:.2f}, {word_divergence(reference, texts):.1%} de mots différents")
+        if throughput < baseline:
+            print(f"[ERROR] Batches of {batch_size} are slower than one window at a time")
+            ok = False
+        else:
+            print(f"[OK] lots de {batch_size}")
+    return ok
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    samples_dir = DEFAULT_SAMPLES_DIR
+    batch_sizes = [2, 4, 8]
+    if "--samples" in args:
+        index = args.index("--samples")
+        samples_dir = Path(args[index + 1])
+        del args[index:index + 2]
+    if "--batch" in args:
+        index = args.index("--batch")
+        batch_sizes = [int(args[index + 1])]
+        del args[index:index + 2]
+
+    try:
+        files = sample_files(args, samples_dir)
+    except Exception as e:
+        print(f"[ERROR] {e}")
+        sys.exit(1)
+    sys.exit(0 if benchmark_batching(files, batch_sizes) else 1)
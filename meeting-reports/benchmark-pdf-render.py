@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Benchmark du rendu PDF d'une transcription de 2 heures : temps et pic mémoire, avant/après
+"""
+
+import os
+import sys
+import time
+import random
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+# Add backend directory to path
+sys.path.append(str(Path(__file__).parent / "backend"))
+
+from report_pdf import generate_pdf
+from pdf_templates import pdf_templates
+
+PARAGRAPH_CHARS = pdf_templates.transcript_paragraph_chars
+
+DURATION_SECONDS = 2 * 3600
+SEGMENT_SECONDS = 6
+WORDS = ("projet budget équipe client livraison planning réunion décision action maquette "
+         "développement test recette serveur migration données priorité semaine vendredi").split()
+
+
+def make_report(one_block: bool) -> dict:
+    """Rapport synthétique : ~150 mots par minute, un segment toutes les 6 secondes"""
+    rng = random.Random(42)
+    lines = []
+    for start in range(0, DURATION_SECONDS, SEGMENT_SECONDS):
+        words = [rng.choice(WORDS) for _ in range(15)]
+        lines.append(f"Intervenant {start // 600 % 4 + 1} : {' '.join(words).capitalize()}.")
+    return {
+        "id": "benchmark",
+        "filename": "reunion-2h.mp3",
+        "created_at": "2026-01-01T09:00:00",
+        "duration": DURATION_SECONDS,
+        "summary": "Réunion de suivi du projet. Point budget et planning.",
+        "key_points": ["Budget validé", "Planning décalé d'une semaine"],
+        "action_items": ["Livrer la maquette vendredi"],
+        "participants": ["Alice", "Bruno"],
+        # Whisper renvoie un seul bloc de texte ; les transcriptions diarisées ont une ligne par tour
+        "transcript": (" " if one_block else "\n").join(lines),
+    }
+
+
+def render(report: dict, prepared: bool, output_path: str) -> float:
+    if prepared:
+        pdf_templates.transcript_paragraph_chars = PARAGRAPH_CHARS
+    else:
+        # Avant : styles reconstruits à chaque rendu, transcription d'un bloc en un seul paragraphe
+        pdf_templates.clear()
+        pdf_templates.transcript_paragraph_chars = 0
+    started = time.perf_counter()
+    if not generate_pdf(report, output_path):
+        raise RuntimeError("PDF generation failed")
+    return time.perf_counter() - started
+
+
+def measure(report: dict, prepared: bool, runs: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        output_path = os.path.join(tmp, "report.pdf")
+        # Rendu de chauffe (imports, polices)
+        render(report, prepared, output_path)
+        times = [render(report, prepared, output_path) for _ in range(runs)]
+
+        tracemalloc.start()
+        render(report, prepared, output_path)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        size = os.path.getsize(output_path)
+    return min(times), sum(times) / len(times), peak, size
+
+
+def benchmark_pdf(runs: int = 3):
+    print(f"=== Benchmark rendu PDF : transcription de {DURATION_SECONDS // 3600} h ===")
+    ok = True
+    for one_block in (False, True):
+        report = make_report(one_block)
+        shape = "un seul bloc" if one_block else "une ligne par segment"
+        print(f"\nTranscription {shape} ({len(report['transcript'])} caractères)")
+        results = {}
+        for label, prepared in (("avant", False), ("après", True)):
+            best, avg, peak, size = measure(report, prepared, runs)
+            results[label] = (best, peak)
+            print(f"  {label:6s} : {best:6.2f}s (moyenne {avg:.2f}s), pic mémoire {peak / 1024 / 1024:6.1f} Mo, "
+                  f"PDF {size / 1024:.0f} Ko")
+        speedup = results["avant"][0] / results["après"][0]
+        memory = results["après"][1] / results["avant"][1]
+        print(f"  Gain : x{speedup:.2f} en temps, {memory:.0%} de la mémoire de départ")
+        if results["après"][0] > results["avant"][0] * 1.1:
+            print(f"[ERROR] Rendu plus lent après ({shape})")
+            ok = False
+        else:
+            print(f"[OK] {shape}")
+    return ok
+
+
+if __name__ == "__main__":
+    sys.exit(0 if benchmark_pdf(int(sys.argv[1]) if len(sys.argv) > 1 else 3) else 1)
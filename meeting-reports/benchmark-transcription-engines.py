@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Benchmark des moteurs de transcription sur un jeu d'échantillons français fixe :
+facteur temps réel (RTF), pic mémoire (RSS) et taux d'erreur sur les mots (WER)
+
+Chaque moteur tourne dans son propre processus pour que le pic mémoire ne mélange
+pas les modèles. Le jeu d'échantillons est un répertoire contenant manifest.jsonl
+({"audio": "fichier.wav", "text": "référence"} par ligne) ; à défaut, les phrases
+de SENTENCES sont synthétisées avec espeak-ng (sortie déterministe).
+
+Usage : python benchmark-transcription-engines.py [moteur ...] [--samples DIR]
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import wave
+import shutil
+import resource
+import subprocess
+import unicodedata
+from pathlib import Path
+
+# Add backend directory to path
+sys.path.append(str(Path(__file__).parent / "backend"))
+
+from transcription_engines import ENGINES, create_engine
+
+DEFAULT_SAMPLES_DIR = Path(__file__).parent / "benchmark-samples" / "fr"
+
+SENTENCES = [
+    "Bonjour à tous, nous allons commencer la réunion de suivi du projet.",
+    "Le budget du deuxième trimestre a été validé par la direction.",
+    "La livraison de la maquette est décalée à vendredi prochain.",
+    "Marie s'occupe de la migration des données vers le nouveau serveur.",
+    "Il faut prévoir une recette complète avant la mise en production.",
+    "Le client souhaite un point hebdomadaire sur l'avancement.",
+    "Nous avons trois priorités pour la semaine : les tests, la documentation et le déploiement.",
+    "Est-ce que quelqu'un a des questions sur le planning ?",
+    "La prochaine réunion aura lieu le douze mars à quatorze heures.",
+    "Merci à tous, bonne fin de journée.",
+]
+
+
+def normalize(text: str) -> list:
+    """Mots en minuscules, sans ponctuation (les accents sont conservés)"""
+    text = unicodedata.normalize("NFC", text.lower())
+    text = re.sub(r"[’'\-]", " ", text)
+    text = re.sub(r"[^\w\s]", " ", text)
+    return text.split()
+
+
+def word_errors(reference: list, hypothesis: list) -> int:
+    """Distance d'édition (substitutions, insertions, suppressions) entre deux listes de mots"""
+    previous = list(range(len(hypothesis) + 1))
+    for i, ref_word in enumerate(reference, 1):
+        current = [i]
+        for j, hyp_word in enumerate(hypothesis, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1,
+                               previous[j - 1] + (ref_word != hyp_word)))
+        previous = current
+    return previous[-1]
+
+
+def wav_seconds(path: Path) -> float:
+    with wave.open(str(path), "rb") as wav:
+        return wav.getnframes() / wav.getframerate()
+
+
+def load_samples(samples_dir: Path) -> list:
+    """Échantillons du manifeste, synthétisés au premier lancement si besoin"""
+    manifest = samples_dir / "manifest.jsonl"
+    if not manifest.exists():
+        espeak = shutil.which("espeak-ng") or shutil.which("espeak")
+        if not espeak:
+            raise RuntimeError(f"No {manifest} and espeak-ng is not installed to synthesize the sample set")
+        samples_dir.mkdir(parents=True, exist_ok=True)
+        with open(manifest, "w", encoding="utf-8") as f:
+            for index, sentence in enumerate(SENTENCES):
+                audio = f"phrase-{index:02d}.wav"
+                subprocess.run([espeak, "-v", "fr", "-s", "150", "-w", str(samples_dir / audio), sentence],
+                               check=True, capture_output=True)
+                f.write(json.dumps({"audio": audio, "text": sentence}, ensure_ascii=False) + "\n")
+        print(f"Sample set synthesized in {samples_dir}")
+
+    samples = []
+    with open(manifest, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            sample = json.loads(line)
+            path = samples_dir / sample["audio"]
+            duration = sample.get("duration") or wav_seconds(path)
+            samples.append({"path": path, "text": sample["text"], "duration": float(duration)})
+    return samples
+
+
+def run_engine(name: str, samples_dir: Path) -> dict:
+    """Mode enfant : charge le moteur, transcrit chaque échantillon, mesure"""
+    samples = load_samples(samples_dir)
+    engine = create_engine(name)
+    size = os.getenv("WHISPER_MODEL", "base")
+
+    started = time.perf_counter()
+    model = engine.load(size, device="cpu")
+    load_seconds = time.perf_counter() - started
+
+    # Premier passage non mesuré (initialisation paresseuse des bibliothèques)
+    model.transcribe(str(samples[0]["path"]), language="fr")
+
+    results = []
+    errors = reference_words = 0
+    audio_seconds = transcribe_seconds = 0.0
+    for sample in samples:
+        started = time.perf_counter()
+        result = model.transcribe(str(sample["path"]), language="fr")
+        elapsed = time.perf_counter() - started
+        reference, hypothesis = normalize(sample["text"]), normalize(result["text"])
+        sample_errors = word_errors(reference, hypothesis)
+        errors += sample_errors
+        reference_words += len(reference)
+        audio_seconds += sample["duration"]
+        transcribe_seconds += elapsed
+        results.append({
+            "audio": sample["path"].name,
+            "seconds": round(elapsed, 3),
+            "wer": round(sample_errors / max(1, len(reference)), 4),
+            "text": result["text"].strip(),
+        })
+
+    return {
+        **engine.describe(),
+        "model": size,
+        "load_seconds": round(load_seconds, 2),
+        "audio_seconds": round(audio_seconds, 2),
+        "transcribe_seconds": round(transcribe_seconds, 2),
+        "rtf": round(transcribe_seconds / audio_seconds, 4) if audio_seconds else None,
+        # ru_maxrss est en Ko sous Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "wer": round(errors / max(1, reference_words), 4),
+        "samples": results,
+    }
+
+
+def benchmark_engines(engines: list, samples_dir: Path) -> bool:
+    print(f"=== Benchmark moteurs de transcription : {samples_dir} ===")
+    try:
+        samples = load_samples(samples_dir)
+    except Exception as e:
+        print(f"[ERROR] Sample set unavailable: {e}")
+        return False
+    print(f"{len(samples)} échantillons, {sum(s['duration'] for s in samples):.1f}s d'audio, "
+          f"modèle {os.getenv('WHISPER_MODEL', 'base')}\n")
+
+    ok = True
+    rows = []
+    for name in engines:
+        if name == "openai-api" and not os.getenv("OPENAI_API_KEY"):
+            print(f"[ERROR] {name}: OPENAI_API_KEY not set")
+            ok = False
+            continue
+        process = subprocess.run(
+            [sys.executable, __file__, "--child", name, "--samples", str(samples_dir)],
+            capture_output=True, text=True
+        )
+        if process.returncode != 0:
+            error = (process.stderr.strip().splitlines() or ["no output"])[-1]
+            print(f"[ERROR] {name}: {error}")
+            ok = False
+            continue
+        result = json.loads(process.stdout.strip().splitlines()[-1])
+        rows.append(result)
+        print(f"[OK] {name}")
+
+    if rows:
+        print(f"\n{'moteur':16s} {'chargement':>10s} {'RTF':>8s} {'pic RSS':>10s} {'WER':>7s}")
+        for row in rows:
+            print(f"{row['engine']:16s} {row['load_seconds']:9.1f}s {row['rtf']:8.3f} "
+                  f"{row['peak_rss_mb']:7.0f} Mo {row['wer']:6.1%}")
+        output = Path(os.getenv("BENCHMARK_OUTPUT", "benchmark-transcription-engines.json"))
+        output.write_text(json.dumps(rows, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"\nDétail par échantillon : {output}")
+    return ok and bool(rows)
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    samples_dir = DEFAULT_SAMPLES_DIR
+    if "--samples" in args:
+        index = args.index("--samples")
+        samples_dir = Path(args[index + 1])
+        del args[index:index + 2]
+
+    if args[:1] == ["--child"]:
+        print(json.dumps(run_engine(args[1], samples_dir), ensure_ascii=False))
+        sys.exit(0)
+
+    sys.exit(0 if benchmark_engines(args or list(ENGINES), samples_dir) else 1)
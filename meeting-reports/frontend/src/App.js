@@ -5,6 +5,7 @@ import FileUpload from './components/FileUpload';
 import AudioRecorder from './components/AudioRecorder';
 import ReportList from './components/ReportList';
 import ReportViewer from './components/ReportViewer';
+import { uploadResumable, ResumableUploadUnsupported } from './resumableUpload';
 import './App.css';
 
 // Utiliser le domaine public pour les requêtes via Cloudflare
@@ -18,6 +19,26 @@ const isDevelopment = typeof window !== 'undefined' && window.location.hostname
 const UPLOAD_API_URL = isDevelopment 
   ? 'http://localhost:8000/upload'  // Direct backend en dev
   : 'https://upload-meeting-reports.iahome.fr/api/upload';  // Sous-domaine dédié en prod
+// Upload reprenable par morceaux (reprise après une coupure réseau au lieu de tout renvoyer)
+const RESUMABLE_UPLOAD_URL = `${UPLOAD_API_URL}s`;
+
+// Identifiant anonyme du navigateur : le backend limite le nombre de transcriptions simultanées par utilisateur
+const getClientId = () => {
+  try {
+    let clientId = window.localStorage.getItem('meetingReportsClientId');
+    if (!clientId) {
+      clientId = window.crypto && window.crypto.randomUUID
+        ? window.crypto.randomUUID()
+        : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+      window.localStorage.setItem('meetingReportsClientId', clientId);
+    }
+    return clientId;
+  } catch (err) {
+    return null;
+  }
+};
+const CLIENT_ID = typeof window !== 'undefined' ? getClientId() : null;
+const PROCESS_HEADERS = CLIENT_ID ? { 'X-User-Id': CLIENT_ID } : {};
 
 function App() {
   const [reports, setReports] = useState([]);
@@ -71,44 +92,74 @@ function App() {
       setCurrentStep(2); // Passer à l'étape d'upload
       setProcessingStatus('Upload du fichier en cours...');
 
-      // Upload du fichier
-      const formData = new FormData();
-      formData.append('file', file);
-
-      // Utiliser le sous-domaine dédié pour les uploads (bypass limite Cloudflare 1MB)
-      const uploadResponse = await axios.post(UPLOAD_API_URL, formData, {
-        headers: {
-          'Content-Type': 'multipart/form-data',
-        },
-        // Configuration pour les gros fichiers
-        maxContentLength: 524288000, // 500MB
-        maxBodyLength: 524288000, // 500MB
-        timeout: 1800000, // 30 minutes timeout pour les très gros fichiers (244MB)
-        // Configuration pour éviter les timeouts sur les connexions lentes
-        onUploadProgress: (progressEvent) => {
-          if (progressEvent.total) {
-            const percentCompleted = Math.round((progressEvent.loaded * 100) / progressEvent.total);
-            setProcessingStatus(`Upload en cours: ${percentCompleted}% (${(progressEvent.loaded / 1024 / 1024).toFixed(1)} MB / ${(progressEvent.total / 1024 / 1024).toFixed(1)} MB)`);
+      const showProgress = (loaded, total) => {
+        const percentCompleted = Math.round((loaded * 100) / total);
+        setProcessingStatus(`Upload en cours: ${percentCompleted}% (${(loaded / 1024 / 1024).toFixed(1)} MB / ${(total / 1024 / 1024).toFixed(1)} MB)`);
+      };
+
+      // Upload du fichier : par morceaux reprenables, multipart si le backend ne le supporte pas
+      let uploadData;
+      let processStarted = false;
+      try {
+        uploadData = await uploadResumable(RESUMABLE_UPLOAD_URL, file, {
+          onProgress: showProgress,
+          // Pipeline : la transcription commence pendant l'upload (mp3, wav, ogg, webm, flac)
+          onCreated: async (uploadId) => {
+            try {
+              const processResponse = await axios.post(`${API_BASE_URL}/process/${uploadId}`, null, {
+                headers: PROCESS_HEADERS,
+              });
+              processStarted = Boolean(processResponse.data.pipelined);
+            } catch (processErr) {
+              // 409 : format non décodable en flux, le traitement démarrera après l'upload
+            }
+          },
+        });
+      } catch (uploadErr) {
+        if (!(uploadErr instanceof ResumableUploadUnsupported)) {
+          throw uploadErr;
+        }
+        const formData = new FormData();
+        formData.append('file', file);
+
+        // Utiliser le sous-domaine dédié pour les uploads (bypass limite Cloudflare 1MB)
+        const uploadResponse = await axios.post(UPLOAD_API_URL, formData, {
+          headers: {
+            'Content-Type': 'multipart/form-data',
+          },
+          // Configuration pour les gros fichiers
+          maxContentLength: 524288000, // 500MB
+          maxBodyLength: 524288000, // 500MB
+          timeout: 1800000, // 30 minutes timeout pour les très gros fichiers (244MB)
+          // Configuration pour éviter les timeouts sur les connexions lentes
+          onUploadProgress: (progressEvent) => {
+            if (progressEvent.total) {
+              const percentCompleted = Math.round((progressEvent.loaded * 100) / progressEvent.total);
+              setProcessingStatus(`Upload en cours: ${percentCompleted}% (${(progressEvent.loaded / 1024 / 1024).toFixed(1)} MB / ${(progressEvent.total / 1024 / 1024).toFixed(1)} MB)`);
             
-            // Log pour debugging
-            if (percentCompleted % 10 === 0) {
-              console.log(`Upload progress: ${percentCompleted}%`);
+              // Log pour debugging
+              if (percentCompleted % 10 === 0) {
+                console.log(`Upload progress: ${percentCompleted}%`);
+              }
             }
-          }
-        },
-        // Configuration axios pour les gros fichiers
-        maxRedirects: 5,
-        validateStatus: function (status) {
-          return status >= 200 && status < 500; // Ne pas considérer 413 comme une erreur fatale
-        },
-      });
+          },
+          // Configuration axios pour les gros fichiers
+          maxRedirects: 5,
+          validateStatus: function (status) {
+            return status >= 200 && status < 500; // Ne pas considérer 413 comme une erreur fatale
+          },
+        });
+        uploadData = uploadResponse.data;
+      }
 
-      console.log('Upload response:', uploadResponse.data);
-      const fileId = uploadResponse.data.id || uploadResponse.data.file_id;
+      console.log('Upload response:', uploadData);
+      const fileId = uploadData.id || uploadData.file_id;
       setProcessingStatus('Démarrage de la transcription...');
 
-      // Démarrer le traitement
-      await axios.post(`${API_BASE_URL}/process/${fileId}`);
+      // Démarrer le traitement (sauf s'il tourne déjà en pipeline)
+      if (!processStarted) {
+        await axios.post(`${API_BASE_URL}/process/${fileId}`, null, { headers: PROCESS_HEADERS });
+      }
 
       // Polling pour vérifier le statut
       let retryCount = 0;
@@ -158,7 +209,12 @@ function App() {
             setProcessingStatus('');
           } else {
             // Continuer le polling
-            setProcessingStatus(status.message || `Transcription en cours... ${status.progress || '0'}%`);
+            let message = status.message || `Transcription en cours... ${status.progress || '0'}%`;
+            if (status.status === 'queued' && status.estimated_start) {
+              const start = new Date(status.estimated_start);
+              message += ` (démarrage estimé à ${start.toLocaleTimeString('fr-FR', { hour: '2-digit', minute: '2-digit' })})`;
+            }
+            setProcessingStatus(message);
             setTimeout(pollStatus, 2000);
           }
         } catch (err) {
@@ -64,22 +64,56 @@ const TranscriptChat = ({ reportId, onClose }) => {
       };
       setMessages(prev => [...prev, userMessage]);
 
-      // Envoyer au serveur
-      const response = await axios.post(`${API_BASE_URL}/api/chat/send-message`, {
-        session_id: sessionId,
-        message: message
+      // Envoyer au serveur : la réponse arrive token par token (Server-Sent Events)
+      const response = await fetch(`${API_BASE_URL}/api/chat/stream-message`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ session_id: sessionId, message: message })
       });
+      if (!response.ok || !response.body) {
+        throw new Error(`HTTP ${response.status}`);
+      }
 
-      if (response.data.success) {
-        // Ajouter la réponse de l'IA
-        const aiMessage = {
-          role: 'assistant',
-          content: response.data.response,
-          timestamp: new Date().toISOString()
-        };
-        setMessages(prev => [...prev, aiMessage]);
-      } else {
-        setError(response.data.error || 'Erreur lors de l\'envoi du message');
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let started = false;
+
+      const appendToAnswer = (text) => {
+        // Décidé hors de l'updater : StrictMode l'appelle deux fois, il doit rester pur
+        const first = !started;
+        started = true;
+        const timestamp = new Date().toISOString();
+        setMessages(prev => {
+          if (first) {
+            return [...prev, { role: 'assistant', content: text, timestamp }];
+          }
+          const last = prev[prev.length - 1];
+          return [...prev.slice(0, -1), { ...last, content: last.content + text }];
+        });
+      };
+
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        // Un événement SSE se termine par une ligne vide
+        let separator;
+        while ((separator = buffer.indexOf('\n\n')) !== -1) {
+          const block = buffer.slice(0, separator);
+          buffer = buffer.slice(separator + 2);
+          const eventLine = block.split('\n').find(line => line.startsWith('event: '));
+          const dataLine = block.split('\n').find(line => line.startsWith('data: '));
+          if (!eventLine || !dataLine) continue;
+          const event = eventLine.slice(7);
+          const data = JSON.parse(dataLine.slice(6));
+          if (event === 'token') {
+            appendToAnswer(data.text);
+          } else if (event === 'error') {
+            setError(data.error || 'Erreur lors de l\'envoi du message');
+          }
+        }
       }
     } catch (err) {
       setError('Erreur de connexion au serveur');
@@ -199,7 +233,7 @@ const TranscriptChat = ({ reportId, onClose }) => {
           </div>
         ))}
 
-        {isLoading && messages.length > 0 && (
+        {isLoading && messages.length > 0 && messages[messages.length - 1].role === 'user' && (
           <div className="flex justify-start">
             <div className="bg-gray-100 p-3 rounded-lg">
               <div className="flex items-center space-x-2">
@@ -0,0 +1,109 @@
+import axios from 'axios';
+
+// Upload reprenable par morceaux : POST /uploads, PATCH /uploads/{id} à l'offset courant,
+// HEAD /uploads/{id} après une coupure pour savoir où reprendre, puis POST /uploads/{id}/complete.
+const CHUNK_SIZE = 8 * 1024 * 1024; // 8 MB par PATCH
+const MAX_CONSECUTIVE_FAILURES = 10;
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+const encodeMetadata = (value) => btoa(unescape(encodeURIComponent(value)));
+
+// Empreinte SHA-256 du morceau (en-tête Upload-Checksum), si le navigateur la permet
+const chunkChecksum = async (blob) => {
+  if (typeof window === 'undefined' || !window.crypto || !window.crypto.subtle) {
+    return null;
+  }
+  const digest = await window.crypto.subtle.digest('SHA-256', await blob.arrayBuffer());
+  let binary = '';
+  new Uint8Array(digest).forEach((byte) => {
+    binary += String.fromCharCode(byte);
+  });
+  return `sha256 ${btoa(binary)}`;
+};
+
+export class ResumableUploadUnsupported extends Error {}
+
+export async function uploadResumable(baseUrl, file, { onProgress, onCreated, chunkSize = CHUNK_SIZE } = {}) {
+  let created;
+  try {
+    created = await axios.post(baseUrl, null, {
+      headers: {
+        'Tus-Resumable': '1.0.0',
+        'Upload-Length': String(file.size),
+        'Upload-Metadata': `filename ${encodeMetadata(file.name || 'audio.wav')}`,
+      },
+    });
+  } catch (err) {
+    // Ancien backend sans /uploads : l'appelant repasse par l'upload multipart
+    if (err.response && [404, 405].includes(err.response.status)) {
+      throw new ResumableUploadUnsupported('Resumable uploads are not supported by this backend');
+    }
+    throw err;
+  }
+
+  const uploadId = created.data.id;
+  const uploadUrl = `${baseUrl}/${uploadId}`;
+  if (onCreated) {
+    await onCreated(uploadId);
+  }
+  let offset = 0;
+  let failures = 0;
+
+  while (offset < file.size) {
+    const chunk = file.slice(offset, Math.min(offset + chunkSize, file.size));
+    try {
+      const headers = {
+        'Tus-Resumable': '1.0.0',
+        'Content-Type': 'application/offset+octet-stream',
+        'Upload-Offset': String(offset),
+      };
+      const checksum = await chunkChecksum(chunk);
+      if (checksum) {
+        headers['Upload-Checksum'] = checksum;
+      }
+      const chunkStart = offset;
+      const response = await axios.patch(uploadUrl, chunk, {
+        headers,
+        timeout: 300000, // 5 minutes par morceau
+        onUploadProgress: (progressEvent) => {
+          if (onProgress) {
+            onProgress(Math.min(chunkStart + progressEvent.loaded, file.size), file.size);
+          }
+        },
+      });
+      offset = parseInt(response.headers['upload-offset'], 10);
+      failures = 0;
+    } catch (err) {
+      const status = err.response && err.response.status;
+      // Erreurs définitives : inutile de réessayer
+      if (status && ![409, 423, 460].includes(status) && status < 500) {
+        throw err;
+      }
+      failures += 1;
+      if (failures > MAX_CONSECUTIVE_FAILURES) {
+        throw err;
+      }
+      console.warn(`Upload chunk failed at ${offset} bytes (attempt ${failures}), resuming`, err.message);
+      await sleep(Math.min(1000 * 2 ** (failures - 1), 30000));
+      // Le serveur garde les octets reçus avant la coupure : reprendre à son offset
+      try {
+        const head = await axios.head(uploadUrl, { headers: { 'Tus-Resumable': '1.0.0' } });
+        offset = parseInt(head.headers['upload-offset'], 10);
+      } catch (headErr) {
+        if (headErr.response && headErr.response.status === 404) {
+          throw headErr;
+        }
+      }
+    }
+    if (onProgress) {
+      onProgress(offset, file.size);
+    }
+  }
+
+  const completed = await axios.post(`${uploadUrl}/complete`, null, {
+    headers: { 'Tus-Resumable': '1.0.0' },
+    timeout: 300000,
+  });
+  return completed.data;
+}
@@ -71,8 +71,7 @@ def install_pyannote():
     print("🎤 Installation de pyannote.audio...")
     
     commands = [
-        "pip install pyannote.audio",
-        "pip install pyannote.core"
+        "pip install -r backend/requirements-diarization.txt",
     ]
     
     success = True
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Test de l'import des anciens fichiers d'annotations JSON dans SQLite
+(identifiants partagés entre rapports)
+"""
+
+import sys
+import json
+import tempfile
+from pathlib import Path
+
+# Add backend directory to path
+sys.path.append(str(Path(__file__).parent / "backend"))
+
+
+def test_annotations_import():
+    """Deux rapports dont les annotations portent le même identifiant"""
+    print("=== Test de l'import des annotations JSON ===")
+
+    from transcript_annotations import TranscriptAnnotations
+
+    with tempfile.TemporaryDirectory() as workdir:
+        annotations_dir = Path(workdir)
+        (annotations_dir / "r1_annotations.json").write_text(json.dumps([
+            {"id": "ann_1", "type": "highlight", "start_time": 1.0, "end_time": 2.0, "text": "budget"},
+        ]), encoding="utf-8")
+        (annotations_dir / "r2_annotations.json").write_text(json.dumps([
+            {"id": "ann_1", "type": "marker", "timestamp": 5.0, "text": "décision"},
+            {"id": "ann_1", "type": "marker", "timestamp": 8.0, "text": "doublon dans le fichier"},
+        ]), encoding="utf-8")
+
+        store = TranscriptAnnotations(db_path=str(annotations_dir / "annotations.db"))
+        imported = store.import_json_files(annotations_dir)
+        r1 = store.get_annotations("r1")
+        r2 = store.get_annotations("r2")
+        imported_again = store.import_json_files(annotations_dir)
+
+    ids = [annotation["id"] for annotation in r1 + r2]
+    checks = [
+        ("trois annotations importées", imported == 3),
+        ("compte égal aux lignes en base", imported == len(ids)),
+        ("surlignage de r1 conservé", [a["type"] for a in r1] == ["highlight"]),
+        ("deux marqueurs pour r2", sorted(a["timestamp"] for a in r2) == [5.0, 8.0]),
+        ("identifiants uniques", len(set(ids)) == len(ids)),
+        ("import exécuté une seule fois", imported_again == 0),
+    ]
+
+    print(f"Importées: {imported}, r1: {r1}, r2: {r2}")
+    failed = 0
+    for label, ok in checks:
+        print(f"[{'OK' if ok else 'ERROR'}] {label}")
+        failed += not ok
+    return failed == 0
+
+
+if __name__ == "__main__":
+    sys.exit(0 if test_annotations_import() else 1)
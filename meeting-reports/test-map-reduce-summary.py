@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Test du résumé map-reduce contre un faux serveur OpenAI local (aucun appel réseau externe)
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+# Add backend directory to path
+sys.path.append(str(Path(__file__).parent / "backend"))
+
+CONCURRENCY = 3
+
+
+class StubOpenAI(BaseHTTPRequestHandler):
+    """Imite POST /v1/chat/completions : une erreur 429 au départ, puis des réponses JSON"""
+
+    lock = threading.Lock()
+    in_flight = 0
+    max_in_flight = 0
+    map_calls = 0
+    reduce_calls = 0
+    rate_limited = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        prompt = body["messages"][-1]["content"]
+        cls = StubOpenAI
+
+        with cls.lock:
+            # Première requête refusée pour exercer les nouvelles tentatives
+            if cls.rate_limited == 0:
+                cls.rate_limited += 1
+                self._send(429, {"error": {"message": "Rate limit", "type": "rate_limit_error"}},
+                           {"retry-after": "0"})
+                return
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+
+        time.sleep(0.2)
+        if prompt.startswith("Voici la partie"):
+            index = prompt.split("/")[0].split()[-1]
+            with cls.lock:
+                cls.map_calls += 1
+            content = json.dumps({
+                "summary": f"Résumé de la partie {index}",
+                "key_points": [f"Point {index}"],
+                "action_items": [f"Action {index}"],
+                "participants": ["Alice"],
+                "decisions": []
+            }, ensure_ascii=False)
+        else:
+            with cls.lock:
+                cls.reduce_calls += 1
+            content = "Voici le compte rendu :\n" + json.dumps({
+                "summary": "Réunion de suivi du projet.",
+                "key_points": ["Point 1", "Point 2"],
+                "action_items": ["Action 1"],
+                "participants": ["Alice"],
+                "decisions": ["Décision 1"],
+                "next_steps": "Relire le compte rendu"
+            }, ensure_ascii=False)
+
+        with cls.lock:
+            cls.in_flight -= 1
+        self._send(200, {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body["model"],
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 10, "total_tokens": 20}
+        })
+
+    def _send(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def test_map_reduce_summary():
+    """Test du découpage, de la concurrence bornée, des nouvelles tentatives et de la fusion"""
+    print("=== Test du résumé map-reduce (serveur OpenAI simulé) ===")
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubOpenAI)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    os.environ["OPENAI_API_KEY"] = "sk-test"
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    os.environ["SUMMARY_SECTION_TOKENS"] = "200"
+    os.environ["SUMMARY_CONCURRENCY"] = str(CONCURRENCY)
+    cache_dir = tempfile.TemporaryDirectory()
+    os.environ["LLM_CACHE_DB"] = os.path.join(cache_dir.name, "llm_cache.db")
+
+    from map_reduce_summarizer import MapReduceSummarizer
+    from llm_cache import llm_cache
+
+    summarizer = MapReduceSummarizer()
+    transcript = " ".join(
+        f"Phrase numéro {i} de la réunion, où Alice présente l'avancement du projet." for i in range(200)
+    )
+    sections = summarizer.split_sections(transcript)
+    print(f"Transcript: {len(transcript)} caractères, {len(sections)} sections")
+
+    async def run():
+        try:
+            first = await summarizer.summarize(transcript, "fr")
+            requests_after_first = summarizer.requests
+            # Même transcription : servie par le cache, sans requête
+            cached = await summarizer.summarize(transcript, "fr")
+            requests_after_cached = summarizer.requests
+            # Contournement explicite du cache
+            await summarizer.summarize(transcript, "fr", use_cache=False)
+            return first, cached, requests_after_first, requests_after_cached
+        finally:
+            await summarizer.aclose()
+
+    started = time.perf_counter()
+    result, cached, requests_after_first, requests_after_cached = asyncio.run(run())
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+    cache_stats = llm_cache.stats()
+    cache_dir.cleanup()
+
+    checks = [
+        ("toutes les sections sont résumées (deux fois, cache contourné)", StubOpenAI.map_calls == 2 * len(sections)),
+        ("au moins une fusion", StubOpenAI.reduce_calls >= 1),
+        (f"concurrence bornée à {CONCURRENCY}", 1 < StubOpenAI.max_in_flight <= CONCURRENCY),
+        ("erreur 429 retentée", summarizer.retries >= 1 and summarizer.failures == 0),
+        ("clés du compte rendu", set(result) == {"summary", "key_points", "action_items",
+                                                 "participants", "decisions", "next_steps"}),
+        ("résumé final", result["summary"] == "Réunion de suivi du projet."),
+        ("sections aux limites de phrases", all(s.endswith(".") for s in sections)),
+        ("réponse servie par le cache", cached == result and requests_after_cached == requests_after_first),
+        ("tokens économisés comptés", cache_stats["hits"] == 1 and cache_stats["tokens_saved"] > 0),
+        ("contournement du cache", summarizer.requests > requests_after_cached and cache_stats["bypassed"] == 1),
+    ]
+
+    print(f"Durée: {elapsed:.2f}s, requêtes map: {StubOpenAI.map_calls}, reduce: {StubOpenAI.reduce_calls}, "
+          f"concurrence max: {StubOpenAI.max_in_flight}, statistiques: {summarizer.stats()}, cache: {cache_stats}")
+    failed = 0
+    for label, ok in checks:
+        print(f"[{'OK' if ok else 'ERROR'}] {label}")
+        failed += not ok
+    return failed == 0
+
+
+if __name__ == "__main__":
+    sys.exit(0 if test_map_reduce_summary() else 1)
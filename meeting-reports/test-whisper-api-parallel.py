@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Test de la transcription par l'API Whisper découpée et parallèle, contre un faux
+serveur OpenAI local (aucun appel réseau externe)
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import wave
+import struct
+import asyncio
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+# Add backend directory to path
+sys.path.append(str(Path(__file__).parent / "backend"))
+
+CONCURRENCY = 3
+MAX_MB = 0.3
+
+
+class StubWhisper(BaseHTTPRequestHandler):
+    """Imite POST /v1/audio/transcriptions : une erreur 500 au départ, puis du verbose_json"""
+
+    lock = threading.Lock()
+    in_flight = 0
+    max_in_flight = 0
+    calls = 0
+    failed = 0
+    largest_body = 0
+    verbose = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        cls = StubWhisper
+
+        with cls.lock:
+            # Première requête en échec pour exercer les nouvelles tentatives
+            if cls.failed == 0:
+                cls.failed += 1
+                self._send(500, {"error": {"message": "Internal error", "type": "server_error"}})
+                return
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+            cls.calls += 1
+            index = cls.calls
+            cls.largest_body = max(cls.largest_body, len(body))
+            cls.verbose = cls.verbose and b"verbose_json" in body
+
+        time.sleep(0.3)
+        with cls.lock:
+            cls.in_flight -= 1
+        self._send(200, {
+            "task": "transcribe",
+            "language": "french",
+            "duration": 1.0,
+            "text": f"Partie {index}.",
+            "segments": [{
+                "id": 0, "seek": 0, "start": 0.5, "end": 1.5, "text": f" Partie {index}.",
+                "tokens": [], "temperature": 0.0, "avg_logprob": -0.2,
+                "compression_ratio": 1.0, "no_speech_prob": 0.01,
+            }],
+        })
+
+    def _send(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def write_recording(path: str, seconds: int = 40, rate: int = 16000):
+    """Bouffées de 440 Hz de 2 s séparées par 0,5 s de silence"""
+    frames = bytearray()
+    for i in range(seconds * rate):
+        t = i / rate
+        voiced = (t % 2.5) < 2.0
+        frames += struct.pack("<h", int(8000 * math.sin(2 * math.pi * 440 * t)) if voiced else 0)
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(bytes(frames))
+
+
+def test_whisper_api_parallel():
+    """Test du découpage sous la limite de taille, de la concurrence, des nouvelles tentatives et du recollage"""
+    print("=== Test de la transcription par l'API Whisper en parallèle (serveur simulé) ===")
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubWhisper)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    workdir = tempfile.TemporaryDirectory()
+    os.environ["OPENAI_API_KEY"] = "sk-test"
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    os.environ["OPENAI_TRANSCRIBE_SEGMENT_SECONDS"] = "6"
+    os.environ["OPENAI_TRANSCRIBE_MAX_MB"] = str(MAX_MB)
+    os.environ["OPENAI_TRANSCRIBE_CONCURRENCY"] = str(CONCURRENCY)
+
+    from openai_client import openai_client
+    from whisper_api import remote_whisper, whisper_transcribe_api
+
+    audio_path = os.path.join(workdir.name, "reunion.wav")
+    write_recording(audio_path)
+
+    async def run():
+        try:
+            return await remote_whisper.transcribe(audio_path, "fr")
+        finally:
+            await openai_client.aclose()
+
+    started = time.perf_counter()
+    try:
+        result = asyncio.run(run())
+        # Version synchrone (client dédié), même découpage
+        sync_result = whisper_transcribe_api(audio_path)
+    except Exception as e:
+        print(f"[ERROR] Transcription failed: {e}")
+        server.shutdown()
+        workdir.cleanup()
+        return False
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+    workdir.cleanup()
+
+    parts = result["parts"]
+    segments = result["segments"]
+    max_bytes = MAX_MB * 1024 * 1024
+    checks = [
+        ("plusieurs parties", len(parts) > 1),
+        ("parties sous la limite de taille", all(part["bytes"] <= max_bytes for part in parts)),
+        ("parties contiguës, audio entier couvert",
+         parts[0]["start"] == 0 and abs(parts[-1]["end"] - 40) < 0.1
+         and all(a["end"] == b["start"] for a, b in zip(parts, parts[1:]))),
+        (f"envois en parallèle (au plus {CONCURRENCY})", 1 < StubWhisper.max_in_flight <= CONCURRENCY),
+        ("erreur 500 retentée", remote_whisper.retried >= 1 and any(part["attempts"] > 1 for part in parts)),
+        ("réponses verbose_json demandées", StubWhisper.verbose),
+        ("un segment par partie", len(segments) == len(parts)),
+        ("timestamps décalés au début de chaque partie",
+         all(abs(segment["start"] - (part["start"] + 0.5)) < 0.01 for segment, part in zip(segments, parts))),
+        ("timestamps croissants", all(a["start"] < b["start"] for a, b in zip(segments, segments[1:]))),
+        ("texte recollé dans l'ordre", result["text"] == " ".join(segment["text"] for segment in segments)),
+        ("version synchrone", sync_result is not None and len(sync_result["segments"]) == len(parts)),
+    ]
+
+    print(f"Durée: {elapsed:.2f}s, parties: {len(parts)}, plus grosse requête: {StubWhisper.largest_body} octets, "
+          f"concurrence max: {StubWhisper.max_in_flight}, statistiques: {remote_whisper.stats()}")
+    failed = 0
+    for label, ok in checks:
+        print(f"[{'OK' if ok else 'ERROR'}] {label}")
+        failed += not ok
+    return failed == 0
+
+
+if __name__ == "__main__":
+    sys.exit(0 if test_whisper_api_parallel() else 1)